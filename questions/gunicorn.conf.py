@@ -0,0 +1,47 @@
+"""Боевой app-сервер: gunicorn с потоковыми воркерами gthread (WSGI).
+
+Запуск: gunicorn -c gunicorn.conf.py — приложение (questions.wsgi или
+questions.asgi) выбирается по классу воркера, см. wsgi_app ниже.
+Плавная перезагрузка кода: kill -HUP <pid мастера> — новые воркеры
+поднимаются до того, как старые дообслужат свои запросы.
+"""
+import multiprocessing
+import os
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+
+# gthread на замерах http_load_test быстрее всех (см. README), но SSE-потоки
+# под WSGI выключены. Живые обновления страницы вопроса — с ASGI-воркером:
+# GUNICORN_WORKER_CLASS=uvicorn_worker.UvicornWorker
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+threads = int(os.environ.get('GUNICORN_THREADS', 4))  # только для gthread
+wsgi_app = 'questions.wsgi:application' if worker_class == 'gthread' else 'questions.asgi:application'
+
+# Воркеров по ядрам: 2 × ядра + 1, как советует документация gunicorn, но
+# не больше, чем выдержит PostgreSQL: каждый воркер держит до DB_POOL_MAX_SIZE
+# соединений пула (без пула — по одному на поток), а всех вместе должно
+# хватить в max_connections (DB_MAX_CONNECTIONS) за вычетом запаса на
+# migrate, management-команды и psql
+if os.environ.get('DB_CONN_MODE') == 'pool':
+    connections_per_worker = int(os.environ.get('DB_POOL_MAX_SIZE', 10))
+else:
+    connections_per_worker = threads
+connections_budget = int(os.environ.get('DB_MAX_CONNECTIONS', 100)) - int(os.environ.get('DB_RESERVED_CONNECTIONS', 10))
+workers = int(os.environ.get('WEB_CONCURRENCY') or max(1, min(
+    multiprocessing.cpu_count() * 2 + 1, connections_budget // connections_per_worker,
+)))
+
+# Перезапуск воркера после N запросов (с разбросом, чтобы не все сразу) —
+# страховка от утечек памяти
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 2000))
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER', 200))
+
+# Зависший воркер убивается через timeout; при остановке и HUP
+# воркеру дают graceful_timeout секунд дообслужить запросы
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', 5))
+
+# Пустой GUNICORN_ACCESSLOG выключает журнал запросов (для нагрузочных замеров)
+accesslog = os.environ.get('GUNICORN_ACCESSLOG', '-') or None
+errorlog = '-'
@@ -1,4 +1,6 @@
+from django.conf import settings
 from django.contrib import admin
+from django.contrib.postgres.search import SearchQuery
 from .models import Profile, Question, Answer, Tag, QuestionLike, AnswerLike
 
 @admin.register(Profile)
@@ -13,6 +15,16 @@ class QuestionAdmin(admin.ModelAdmin):
     search_fields = ['title', 'content']
     filter_horizontal = ['tags']  # удобный выбор тегов
 
+    def get_search_results(self, request, queryset, search_term):
+        # Сначала полнотекстовый поиск по GIN-индексу; если он ничего не нашёл
+        # (часть слова, id), — обычный icontains по search_fields
+        if not search_term:
+            return queryset, False
+        found = queryset.filter(search_vector=SearchQuery(search_term, config=settings.SEARCH_CONFIG, search_type='websearch'))
+        if found.exists():
+            return found, False
+        return super().get_search_results(request, queryset, search_term)
+
 @admin.register(Answer)
 class AnswerAdmin(admin.ModelAdmin):
     list_display = ['author', 'question', 'rating', 'is_correct', 'created_at']
@@ -21,7 +33,7 @@ class AnswerAdmin(admin.ModelAdmin):
 
 @admin.register(Tag)
 class TagAdmin(admin.ModelAdmin):
-    list_display = ['name']
+    list_display = ['name', 'questions_count', 'popularity']
     search_fields = ['name']
 
 @admin.register(QuestionLike)
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class MainConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'main'
+
+    def ready(self):
+        # Счётчик соединений должен видеть и те, что открылись до первого запроса
+        from . import dbpool  # noqa: F401
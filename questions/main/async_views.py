@@ -0,0 +1,96 @@
+"""Async-версии читающих страниц для ASGI (ASYNC_VIEWS = True, по умолчанию выключены).
+
+Async ORM и async-кэш Django пока лишь обёртки sync_to_async: запросы
+одного запроса по-прежнему идут по очереди в его потоке, параллелить
+их нечем. Поэтому чтения здесь просто ждутся одно за другим. Шаблон
+рендерится в потоке: он читает request.user и ленивые связи синхронно.
+На одном процессе эти страницы медленнее синхронных (bench_views);
+включать их стоит, только когда async ORM станет по-настоящему async.
+"""
+from asgiref.sync import sync_to_async
+from django.http import Http404
+from django.shortcuts import render
+
+from . import live, sidebar
+from .models import Answer, Question, Tag
+from .pages import anonymous_page_cache
+from .pagination import akeyset_page
+from .views import paginate
+
+
+async def _page(queryset, request, keys, count=None):
+    # Старые ссылки ?page=N обслуживает синхронный Paginator
+    if 'page' in request.GET:
+        return await sync_to_async(paginate)(queryset, request, count=count)
+    return await akeyset_page(queryset, keys, request.GET.get('cursor'))
+
+
+async def _with_sidebar(page):
+    """Страница и оба блока сайдбара"""
+    return {
+        'page_obj': await page,
+        'popular_tags': await sidebar.apopular_tags(),
+        'best_users': await sidebar.abest_users(),
+    }
+
+
+async def _render(request, template_name, context):
+    return await sync_to_async(render)(request, template_name, context)
+
+
+@anonymous_page_cache(lambda request: ['hot' if request.GET.get('sort') == 'hot' else 'new'])
+async def index(request):
+    sort_type = request.GET.get('sort', 'new')
+    if sort_type == 'hot':
+        questions, keys = Question.objects.best_questions().cards(), Question.objects.BEST_ORDERING
+    else:
+        questions, keys = Question.objects.new_questions().cards(), Question.objects.NEW_ORDERING
+    context = await _with_sidebar(_page(questions, request, keys))
+    return await _render(request, 'index.html', {**context, 'current_sort': sort_type})
+
+
+@anonymous_page_cache(lambda request: ['hot'])
+async def hot_questions(request):
+    questions = Question.objects.best_questions().cards()
+    context = await _with_sidebar(_page(questions, request, Question.objects.BEST_ORDERING))
+    return await _render(request, 'index.html', {**context, 'current_sort': 'hot'})
+
+
+@anonymous_page_cache(lambda request, tag_name: [f'tag:{tag_name}'])
+async def questions_by_tag(request, tag_name):
+    """Вопросы по тегу"""
+    try:
+        tag = await Tag.objects.aget(name=tag_name)
+    except Tag.DoesNotExist:
+        raise Http404("Тег не найден")
+    questions = Question.objects.questions_by_tag(tag).cards()
+    context = await _with_sidebar(
+        _page(questions, request, Question.objects.TAG_ORDERING, count=tag.questions_count)
+    )
+    return await _render(request, 'questions_by_tag.html', {
+        **context, 'tag': tag, 'questions_count': tag.questions_count,
+    })
+
+
+async def _answers_page(request, question_id):
+    try:
+        question = await Question.objects.aget(pk=question_id)
+    except Question.DoesNotExist:
+        raise Http404("Вопрос не найден")
+    answers = Answer.objects.filter(question=question).select_related('author').order_by('-rating', '-created_at')
+    # Номерные страницы ответов: число берётся из счётчика, а не COUNT(*)
+    page_obj = await sync_to_async(paginate)(answers, request, per_page=5, count=question.answers_count)
+    page_obj.object_list = await sync_to_async(list)(page_obj.object_list)
+    return question, page_obj
+
+
+@anonymous_page_cache(lambda request, question_id: [f'question:{question_id}'])
+async def question_detail(request, question_id):
+    question, page_obj = await _answers_page(request, question_id)
+    return await _render(request, 'question.html', {
+        'question': question,
+        'page_obj': page_obj,
+        'live_updates': live.available(request),
+        'popular_tags': await sidebar.apopular_tags(),
+        'best_users': await sidebar.abest_users(),
+    })
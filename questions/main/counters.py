@@ -0,0 +1,74 @@
+"""Денормализованные счётчики Question.answers_count, Tag.questions_count
+и рейтинг популярности тегов Tag.popularity.
+
+Счётчики меняются тем же UPDATE ... SET n = n + delta в транзакции
+записи, поэтому страницы читают готовое число вместо COUNT по ответам или
+по промежуточной таблице тегов. Сверка и массовый ремонт — manage.py fix_counters.
+"""
+from functools import partial
+
+from django.db import transaction
+from django.db.models import Count, F, FloatField, Sum, Value
+from django.db.models.functions import Greatest
+
+from . import sidebar
+from .hot import hot_score_expression
+from .pages import expire_question
+from .ratings import grouped
+
+
+def change_answers_count(question_id, delta):
+    from .models import Question
+    Question.objects.filter(pk=question_id).update(
+        answers_count=F('answers_count') + delta,
+        hot_score=hot_score_expression(answers_count=F('answers_count') + delta),
+        cache_version=F('cache_version') + 1,
+    )
+    expire_question(question_id)
+
+
+def change_questions_count(tag_ids, delta):
+    from .models import Tag
+    if not tag_ids:
+        return
+    changes = {'questions_count': F('questions_count') + delta}
+    if delta > 0:
+        # Новый вопрос сразу поднимает тег; уход старых вопросов из окна
+        # учитывает периодический refresh_tag_ranking
+        changes['popularity'] = F('popularity') + delta
+    Tag.objects.filter(pk__in=tag_ids).update(**changes)
+    transaction.on_commit(partial(sidebar.tags_changed, tag_ids, raised=tag_ids if delta > 0 else ()))
+
+
+def linked_tag_ids(question_id, tag_ids=None):
+    """Id тегов, реально привязанных к вопросу (опционально — только из tag_ids)"""
+    from .models import Question
+    links = Question.tags.through.objects.filter(question_id=question_id)
+    if tag_ids is not None:
+        links = links.filter(tag_id__in=tag_ids)
+    return list(links.values_list('tag_id', flat=True))
+
+
+def question_counter_expressions():
+    from .models import Answer
+    answers_count = grouped(Answer, 'question_id', 'pk', Count('id'))
+    return {'answers_count': answers_count, 'hot_score': hot_score_expression(answers_count=answers_count)}
+
+
+def tag_counter_expressions():
+    from .models import Question
+    return {'questions_count': grouped(Question.tags.through, 'tag_id', 'pk', Count('id'))}
+
+
+def tag_popularity_expressions(since, answer_weight, vote_weight):
+    """Популярность тега: вопросы за окно since, взвешенные ответами и голосами"""
+    from .models import Question
+    activity = (
+        Value(1.0)
+        + answer_weight * F('question__answers_count')
+        + vote_weight * Greatest(F('question__rating'), 0)
+    )
+    recent = Question.tags.through.objects.filter(question__created_at__gte=since)
+    return {'popularity': grouped(
+        recent, 'tag_id', 'pk', Sum(activity, output_field=FloatField()), output_field=FloatField()
+    )}
@@ -0,0 +1,124 @@
+"""Чтение с реплик PostgreSQL, запись — в primary (алиас 'default').
+
+Реплики — алиасы из settings.DB_REPLICAS (их строит settings.py из
+DB_REPLICA_HOSTS). Чтения ORM уходят на случайную реплику, записи и
+миграции — только в primary. Чтения идут в primary, если:
+
+- запрос изменяющий (POST и т.п.) или уже что-то записал;
+- идёт транзакция на primary — в ней надо видеть свои же записи;
+- у клиента есть cookie липкости: после своей записи пользователь
+  REPLICA_STICKY_SECONDS секунд читает с primary и видит свой голос или
+  ответ, даже если реплика отстаёт (см. middleware replica_stickiness);
+- код явно попросил: with use_primary(): ...
+
+Отставание реплик проверяется не чаще раза в REPLICA_LAG_CHECK_INTERVAL
+секунд; реплика, отставшая больше REPLICA_MAX_LAG (0 — не проверять) или
+недоступная, выпадает из выбора до следующей проверки. Если подходящих
+реплик нет, читается primary. Окно липкости должно быть не меньше
+REPLICA_MAX_LAG.
+"""
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.exceptions import SynchronousOnlyOperation
+from django.db import DatabaseError, connections
+
+PRIMARY = 'default'
+STICKY_COOKIE = 'db_primary'
+
+LAG_SQL = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+"""
+
+# Контекст, а не поток: под ASGI один поток обслуживает чужие запросы
+_pinned = ContextVar('db_pinned', default=False)
+_wrote = ContextVar('db_wrote', default=False)
+
+
+def replicas_enabled():
+    return bool(getattr(settings, 'DB_REPLICAS', ()))
+
+
+def sticky_seconds():
+    return getattr(settings, 'REPLICA_STICKY_SECONDS', 5)
+
+
+def begin(pinned):
+    """Начало запроса: читать с primary с самого начала или нет"""
+    _pinned.set(pinned)
+    _wrote.set(False)
+
+
+def wrote():
+    """Писал ли текущий запрос в БД"""
+    return _wrote.get()
+
+
+@contextmanager
+def use_primary(enabled=True):
+    """Читать с primary внутри блока"""
+    if not enabled:
+        yield
+        return
+    token = _pinned.set(True)
+    try:
+        yield
+    finally:
+        _pinned.reset(token)
+
+
+class ReplicaRouter:
+    def __init__(self):
+        self._lag_checks = {}  # алиас -> (когда проверяли, годится ли)
+
+    def db_for_read(self, model, **hints):
+        if _pinned.get() or _wrote.get() or connections[PRIMARY].in_atomic_block:
+            return PRIMARY
+        replicas = [alias for alias in settings.DB_REPLICAS if self._fresh(alias)]
+        return random.choice(replicas) if replicas else PRIMARY
+
+    def db_for_write(self, model, **hints):
+        # После записи запрос читает свои данные только с primary
+        _wrote.set(True)
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {PRIMARY, *settings.DB_REPLICAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Реплики получают схему репликацией
+        return db == PRIMARY
+
+    def _fresh(self, alias):
+        max_lag = getattr(settings, 'REPLICA_MAX_LAG', 0)
+        if not max_lag:
+            return True
+        now = time.monotonic()
+        checked = self._lag_checks.get(alias)
+        if checked is None or now - checked[0] >= getattr(settings, 'REPLICA_LAG_CHECK_INTERVAL', 5):
+            try:
+                checked = (now, self.replica_lag(alias) <= max_lag)
+            except SynchronousOnlyOperation:
+                # Из event loop'а в БД не сходить — решим по прошлой проверке
+                return checked is None or checked[1]
+            self._lag_checks[alias] = checked
+        return checked[1]
+
+    def replica_lag(self, alias):
+        """Отставание реплики в секундах; недоступная реплика отстаёт бесконечно"""
+        try:
+            with connections[alias].cursor() as cursor:
+                cursor.execute(LAG_SQL)
+                return float(cursor.fetchone()[0])
+        except DatabaseError:
+            connections[alias].close()
+            return float('inf')
@@ -0,0 +1,51 @@
+"""Метрики соединений с PostgreSQL (режим — DB_CONN_MODE в settings.py).
+
+В режиме 'pool' числа берутся у пула psycopg_pool этого процесса: сколько
+соединений открыто и сколько из них выдано, сколько запросов ждёт
+свободного, сколько соединений создано за жизнь пула. В режимах 'close'
+и 'persistent' пула нет — считаются только новые соединения (сигнал
+connection_created): в 'close' их столько же, сколько запросов к БД,
+в 'persistent' — примерно по одному на поток воркера.
+"""
+import threading
+
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+_lock = threading.Lock()
+_opened = 0
+
+
+@receiver(connection_created)
+def _count_connection(sender, connection, **kwargs):
+    global _opened
+    with _lock:
+        _opened += 1
+
+
+def pool_stats(alias='default'):
+    """Словарь метрик соединений этого процесса"""
+    mode = getattr(settings, 'DB_CONN_MODE', 'close')
+    pool = connections[alias].pool if mode == 'pool' else None
+    if pool is None:
+        # Без пула connection_created — это настоящие новые соединения
+        return {'mode': mode, 'created': _opened}
+    stats = pool.get_stats()
+    size, available = stats.get('pool_size', 0), stats.get('pool_available', 0)
+    return {
+        'mode': mode,
+        'min_size': stats.get('pool_min', 0),
+        'max_size': stats.get('pool_max', 0),
+        'size': size,
+        'in_use': size - available,
+        'available': available,
+        'waiting': stats.get('requests_waiting', 0),
+        'created': stats.get('connections_num', 0),
+        'checkouts': stats.get('requests_num', 0),
+        'wait_ms': stats.get('requests_wait_ms', 0),
+        'timeouts': stats.get('requests_errors', 0),
+        'bad_returns': stats.get('returns_bad', 0),
+        'lost': stats.get('connections_lost', 0),
+    }
@@ -0,0 +1,79 @@
+"""Кэш HTML-фрагментов: карточек вопросов и блоков ответов.
+
+Ключ фрагмента содержит cache_version объекта. Пути записи (голос,
+новый/удалённый ответ, смена тегов, правка) увеличивают версию тем же
+UPDATE, поэтому старый HTML просто перестаёт находиться и доживает
+FRAGMENT_CACHE_TTL. Шаблонный тег — {% fragment %} из fragment_cache.
+
+Массовые переписывания базы (fill_db, fix_ratings) версий не трогают или
+сбрасывают их вместе с pk, поэтому в ключе есть ещё поколение всех
+фрагментов: expire_all() начинает новое. Запрос читает его один раз.
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F
+
+_lock = threading.Lock()
+
+GENERATION_KEY = 'fragment:generation'
+
+# Счётчики процесса с момента запуска
+stats = {'hits': 0, 'misses': 0, 'render_seconds': 0.0}
+
+
+def fragment_key(name, obj, *vary_on, request=None):
+    parts = [generation(request), name, obj._meta.label_lower, obj.pk, obj.cache_version, *vary_on]
+    return 'fragment:' + ':'.join(str(part) for part in parts)
+
+
+def generation(request=None):
+    """Текущее поколение фрагментов; в запросе — одно на все фрагменты"""
+    if request is not None and 'fragment_generation' in request.__dict__:
+        return request.fragment_generation
+    value = cache.get(GENERATION_KEY)
+    if value is None:
+        # Начальное поколение уникально, как версии групп в main/pages.py
+        cache.add(GENERATION_KEY, time.time_ns(), None)
+        value = cache.get(GENERATION_KEY)
+    if request is not None:
+        request.fragment_generation = value
+    return value
+
+
+def expire_all():
+    """Все закэшированные фрагменты перестают находиться"""
+    cache.set(GENERATION_KEY, time.time_ns(), None)
+
+
+def get_fragment(key):
+    return cache.get(key)
+
+
+def set_fragment(key, html):
+    cache.set(key, html, getattr(settings, 'FRAGMENT_CACHE_TTL', 600))
+
+
+def record(request, hit, render_seconds=0.0):
+    """Учесть попадание или промах — в процессе и в текущем запросе"""
+    with _lock:
+        stats['hits' if hit else 'misses'] += 1
+        stats['render_seconds'] += render_seconds
+    if request is not None:
+        counters = request.__dict__.setdefault('fragment_stats', {'hits': 0, 'misses': 0, 'render_seconds': 0.0})
+        counters['hits' if hit else 'misses'] += 1
+        counters['render_seconds'] += render_seconds
+
+
+def miss_cost():
+    """Среднее время рендеринга фрагмента при промахе (по процессу)"""
+    with _lock:
+        return stats['render_seconds'] / stats['misses'] if stats['misses'] else 0.0
+
+
+def touch(model, pks):
+    """Сделать закэшированные фрагменты объектов устаревшими"""
+    if pks:
+        model.objects.filter(pk__in=pks).update(cache_version=F('cache_version') + 1)
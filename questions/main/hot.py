@@ -0,0 +1,33 @@
+"""Оценка «горячести» вопроса — Question.hot_score.
+
+    a   = rating + HOT_ANSWER_WEIGHT * answers_count
+    hot = sign(a) * log10(max(|a|, 1)) + (created_at - HOT_EPOCH) / HOT_SCORE_PERIOD
+
+Свежесть входит прибавкой, а не делением на возраст, поэтому сохранённая
+оценка не устаревает со временем: новый вопрос стартует выше старых, и
+каждые HOT_SCORE_PERIOD секунд свежести стоят десятикратной активности.
+Оценка пересчитывается тем же UPDATE, что меняет rating или answers_count;
+manage.py refresh_hot_scores — массовый пересчёт (ремонт, смена констант).
+"""
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.db.models import F, FloatField, Value
+from django.db.models.functions import Abs, Cast, Extract, Greatest, Log, Sign
+
+HOT_EPOCH = datetime(2025, 1, 1, tzinfo=timezone.utc).timestamp()
+
+
+def hot_score_expression(rating=None, answers_count=None):
+    """SQL-выражение оценки; rating/answers_count — новые значения, если
+    они меняются в том же UPDATE (SET видит старые значения полей)"""
+    activity = Cast(
+        (F('rating') if rating is None else rating)
+        + settings.HOT_ANSWER_WEIGHT * (F('answers_count') if answers_count is None else answers_count),
+        FloatField(),
+    )
+    age = Cast(Extract('created_at', 'epoch'), FloatField()) - Value(HOT_EPOCH)
+    return (
+        Sign(activity) * Log(Value(10.0), Greatest(Abs(activity), Value(1.0)))
+        + age / Value(float(settings.HOT_SCORE_PERIOD))
+    )
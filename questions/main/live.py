@@ -0,0 +1,149 @@
+"""Живые обновления страницы вопроса: Server-Sent Events и pub/sub в процессе.
+
+Каждый открытый поток /question/<id>/events/ — очередь asyncio в event
+loop'е ASGI-сервера. Пути записи после коммита публикуют событие: оно
+кодируется один раз, и одни и те же байты раскладываются по очередям
+подписчиков вопроса одним call_soon_threadsafe на event loop — без
+запросов к БД и опроса на каждого подписчика. Рейтинг после голоса
+читается один раз и только если у вопроса есть подписчики.
+
+Шина живёт в процессе: событие видят потоки, открытые в том же воркере,
+что и запись. Для нескольких воркеров publish() нужно кормить из общего
+канала (LISTEN/NOTIFY, Redis pub/sub).
+
+Поток открыт, пока открыта страница, — это по силам только ASGI-серверу.
+Под WSGI каждый поток навсегда занял бы поток воркера, поэтому там
+страница не подписывается, а /events/ отвечает 204.
+"""
+import asyncio
+import json
+import threading
+from functools import partial
+
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.db import transaction
+
+from .db_router import use_primary
+
+_lock = threading.Lock()
+_subscribers = {}  # id вопроса -> {(loop, queue)}
+
+RESYNC = b'event: resync\ndata: {}\n\n'
+
+
+def available(request):
+    """Можно ли держать поток событий: запрос обслуживает ASGI-сервер"""
+    return isinstance(request, ASGIRequest)
+
+
+def encode(event, data):
+    return f'event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n'.encode()
+
+
+def subscribe(question_id):
+    """Очередь событий вопроса для текущего event loop'а"""
+    queue = asyncio.Queue(maxsize=getattr(settings, 'LIVE_QUEUE_SIZE', 100))
+    subscriber = (asyncio.get_running_loop(), queue)
+    with _lock:
+        _subscribers.setdefault(question_id, set()).add(subscriber)
+    return subscriber
+
+
+def unsubscribe(question_id, subscriber):
+    with _lock:
+        subscribers = _subscribers.get(question_id)
+        if subscribers is not None:
+            subscribers.discard(subscriber)
+            if not subscribers:
+                del _subscribers[question_id]
+
+
+def subscribed(question_id):
+    return question_id in _subscribers
+
+
+def subscriber_count(question_id=None):
+    with _lock:
+        if question_id is not None:
+            return len(_subscribers.get(question_id, ()))
+        return sum(len(subscribers) for subscribers in _subscribers.values())
+
+
+def publish(question_id, event, data):
+    """Разослать событие подписчикам вопроса; можно звать из любого потока"""
+    with _lock:
+        subscribers = list(_subscribers.get(question_id, ()))
+    if not subscribers:
+        return 0
+    message = encode(event, data)
+    by_loop = {}
+    for loop, queue in subscribers:
+        by_loop.setdefault(loop, []).append(queue)
+    # Один вызов на event loop, а не на подписчика: пробуждение loop'а
+    # из чужого потока дороже, чем сама раскладка по очередям
+    for loop, queues in by_loop.items():
+        try:
+            loop.call_soon_threadsafe(_offer, queues, message)
+        except RuntimeError:
+            pass  # loop уже закрыт, его подписчики отпишутся сами
+    return len(subscribers)
+
+
+def _offer(queues, message):
+    for queue in queues:
+        try:
+            queue.put_nowait(message)
+        except asyncio.QueueFull:
+            # Медленный клиент: вместо потерянных событий — сигнал перечитать страницу
+            while not queue.empty():
+                queue.get_nowait()
+            queue.put_nowait(RESYNC)
+
+
+def announce_rating(kind, pk, question_id):
+    """После коммита разослать новый рейтинг вопроса ('question') или ответа ('answer')"""
+    transaction.on_commit(partial(_send_rating, kind, pk, question_id))
+
+
+def _send_rating(kind, pk, question_id):
+    from .models import Answer, Question
+    if not subscribed(question_id):
+        return
+    model = Question if kind == 'question' else Answer
+    # Только что закоммиченный рейтинг реплика могла ещё не получить
+    with use_primary():
+        rating = model.objects.filter(pk=pk).values_list('rating', flat=True).first()
+    if rating is not None:
+        publish(question_id, 'vote', {'kind': kind, 'id': pk, 'rating': rating})
+
+
+def announce_answer(answer):
+    """После коммита разослать новый ответ подписчикам его вопроса"""
+    transaction.on_commit(partial(_send_answer, answer))
+
+
+def _send_answer(answer):
+    if subscribed(answer.question_id):
+        publish(answer.question_id, 'answer', {
+            'id': answer.pk,
+            'author': answer.author.username,
+            'content': answer.content,
+            'rating': answer.rating,
+        })
+
+
+async def stream(question_id):
+    """Тело SSE-ответа: события вопроса и комментарий-пульс для прокси"""
+    heartbeat = getattr(settings, 'LIVE_HEARTBEAT', 15)
+    subscriber = subscribe(question_id)
+    _, queue = subscriber
+    try:
+        yield f'retry: {getattr(settings, "LIVE_RETRY_MS", 3000)}\n\n'.encode()
+        while True:
+            try:
+                yield await asyncio.wait_for(queue.get(), heartbeat)
+            except asyncio.TimeoutError:
+                yield b': ping\n\n'
+    finally:
+        unsubscribe(question_id, subscriber)
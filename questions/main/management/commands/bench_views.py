@@ -0,0 +1,189 @@
+# management/commands/bench_views.py
+import asyncio
+import io
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand, CommandError
+from django.core.wsgi import get_wsgi_application
+from django.test import override_settings
+
+from main.dbpool import pool_stats
+from main.models import Question, Tag
+
+
+def _environ(path):
+    path, _, query = path.partition('?')
+    return {
+        'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'QUERY_STRING': query,
+        'SERVER_NAME': 'localhost', 'SERVER_PORT': '80', 'HTTP_HOST': 'localhost',
+        'wsgi.url_scheme': 'http', 'wsgi.input': io.BytesIO(), 'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True, 'wsgi.multiprocess': False, 'wsgi.run_once': False,
+    }
+
+
+def _scope(path):
+    path, _, query = path.partition('?')
+    return {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1',
+        'method': 'GET', 'scheme': 'http', 'path': path, 'raw_path': path.encode(),
+        'query_string': query.encode(), 'headers': [(b'host', b'localhost')],
+        'client': ('127.0.0.1', 0), 'server': ('localhost', 80),
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare req/s and latency of the read pages on the sync (WSGI + thread pool) '
+        'and async (ASGI + async views) paths, in-process, with the page cache off'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--mode', choices=['sync', 'async', 'both'], default='both')
+        parser.add_argument('--requests', type=int, default=2000, help='Requests per run')
+        parser.add_argument('--concurrency', type=int, default=64, help='Concurrent clients')
+        parser.add_argument('--threads', type=int, default=8, help='Worker threads of the sync path')
+        parser.add_argument(
+            '--db-modes', help='Comma-separated DB_CONN_MODE values to compare, e.g. close,persistent,pool'
+        )
+        parser.add_argument('--json', action='store_true', help='Print the result as JSON')
+
+    def handle(self, *args, **options):
+        modes = ['sync', 'async'] if options['mode'] == 'both' else [options['mode']]
+        if options['db_modes']:
+            # persistent под ASGI не работает: поток, а с ним соединение, новые на каждый запрос
+            results = [
+                self.spawn(mode, options, db_mode)
+                for db_mode in options['db_modes'].split(',') for mode in modes
+                if not (db_mode == 'persistent' and mode == 'async')
+            ]
+        elif options['mode'] == 'both':
+            results = [self.spawn(mode, options) for mode in modes]
+        else:
+            with override_settings(DEBUG=False, ALLOWED_HOSTS=['localhost'], PAGE_CACHE_TTL=0):
+                results = [self.run(options['mode'], options)]
+        if options['json']:
+            self.stdout.write(json.dumps(results[0]))
+            return
+        for result in results:
+            self.report(result)
+
+    def spawn(self, mode, options, db_mode=None):
+        """Каждый путь — в своём процессе: urls.py выбирает версии страниц,
+        а settings.py — режим соединений с БД при импорте"""
+        command = [
+            sys.executable, sys.argv[0], 'bench_views', '--mode', mode, '--json',
+            '--requests', str(options['requests']), '--concurrency', str(options['concurrency']),
+            '--threads', str(options['threads']),
+        ]
+        env = {**os.environ, 'ASYNC_VIEWS': '1' if mode == 'async' else '0'}
+        if db_mode:
+            env['DB_CONN_MODE'] = db_mode
+        done = subprocess.run(command, env=env, capture_output=True, text=True)
+        if done.returncode:
+            raise CommandError(done.stderr)
+        return json.loads(done.stdout.strip().splitlines()[-1])
+
+    def paths(self):
+        question = Question.objects.order_by('-id').values_list('pk', flat=True).first()
+        tag = Tag.objects.order_by('-questions_count').values_list('name', flat=True).first()
+        if question is None or tag is None:
+            raise CommandError('No questions — run fill_db first')
+        return ['/', '/?sort=hot', f'/tag/{tag}/', f'/question/{question}/']
+
+    def run(self, mode, options):
+        if (mode == 'async') != settings.ASYNC_VIEWS:
+            raise CommandError(f'Run with ASYNC_VIEWS={int(mode == "async")} or use --mode both')
+        paths = self.paths()
+        latencies, errors, elapsed = asyncio.run(getattr(self, f'load_{mode}')(paths, options))
+        latencies.sort()
+        return {
+            'mode': mode,
+            'db': pool_stats(),
+            'requests': len(latencies) + errors,
+            'errors': errors,
+            'rps': len(latencies) / elapsed,
+            'p50': statistics.median(latencies) if latencies else 0,
+            'p99': latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] if latencies else 0,
+        }
+
+    async def clients(self, call, paths, options):
+        """concurrency клиентов по очереди забирают запросы из общего счётчика"""
+        remaining = iter(range(options['requests']))
+        latencies, errors = [], 0
+
+        async def client():
+            nonlocal errors
+            for number in remaining:
+                started = time.monotonic()
+                status = await call(paths[number % len(paths)])
+                if status == 200:
+                    latencies.append((time.monotonic() - started) * 1000)
+                else:
+                    errors += 1
+
+        started = time.monotonic()
+        await asyncio.gather(*(client() for _ in range(options['concurrency'])))
+        return latencies, errors, time.monotonic() - started
+
+    async def load_sync(self, paths, options):
+        app = get_wsgi_application()
+        # Как у gunicorn с gthread: запросы ждут свободный поток воркера
+        pool = ThreadPoolExecutor(options['threads'])
+        loop = asyncio.get_running_loop()
+
+        def request(path):
+            status = []
+            body = app(_environ(path), lambda line, headers, exc_info=None: status.append(int(line[:3])))
+            try:
+                for _ in body:
+                    pass
+            finally:
+                body.close()
+            return status[0]
+
+        try:
+            return await self.clients(lambda path: loop.run_in_executor(pool, request, path), paths, options)
+        finally:
+            pool.shutdown()
+
+    async def load_async(self, paths, options):
+        app = get_asgi_application()
+
+        async def request(path):
+            status, finished = [], asyncio.Event()
+            sent = False
+
+            async def receive():
+                nonlocal sent
+                if not sent:
+                    sent = True
+                    return {'type': 'http.request', 'body': b'', 'more_body': False}
+                await finished.wait()
+                return {'type': 'http.disconnect'}
+
+            async def send(message):
+                if message['type'] == 'http.response.start':
+                    status.append(message['status'])
+                elif not message.get('more_body'):
+                    finished.set()
+
+            await app(_scope(path), receive, send)
+            return status[0]
+
+        return await self.clients(request, paths, options)
+
+    def report(self, result):
+        db = result['db']
+        self.stdout.write(
+            f"{'⚡' if result['mode'] == 'async' else '🧵'} {result['mode']:5} {db['mode']:10}: "
+            f"{result['rps']:.0f} req/s, p50={result['p50']:.1f}ms p99={result['p99']:.1f}ms, "
+            f"{result['errors']}/{result['requests']} errors, {db['created']} DB connections opened"
+        )
@@ -1,238 +1,325 @@
-from django.core.management.base import BaseCommand
+import random
+import time
+from collections import namedtuple
+from datetime import datetime, timedelta, timezone as dt_timezone
+from multiprocessing import get_context
+
+from django.contrib.auth.hashers import make_password
 from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.core.management.color import no_style
+from django.db import connection, connections, transaction
 from faker import Faker
-import random
+
 from main.models import Profile, Question, Answer, Tag, QuestionLike, AnswerLike
-from django.db import transaction
-from django.db.models import Max
-from django.db.models import Sum, Count
+from main.ratings import rebuild, profile_expressions
+from main.counters import question_counter_expressions, tag_counter_expressions
+from main.search import search_vector_expression
+from main.pages import purge_all
+from main.sidebar import invalidate_sidebar
+from main.management.dataset import (
+    PROFILES, power_law, unit,
+    QUESTION_AUTHOR, ANSWER_AUTHOR, AUTHOR_RANKING, ANSWER_QUESTION, QUESTION_TAGS,
+    QUESTION_VOTES, ANSWER_VOTES, VOTE_ROUNDING, TAG_COUNT, MAX_TAGS_PER_QUESTION,
+)
+
+
+# Все id выдаются заранее (1..N после очистки), поэтому связи между
+# сущностями вычисляются, а не перечитываются из БД
+Plan = namedtuple(
+    'Plan',
+    'seed users tags questions answers question_likes answer_likes '
+    'author_exponent tag_exponent answer_exponent vote_exponent tag_count_exponent',
+)
+
+DATASET_START = datetime(2024, 1, 1, tzinfo=dt_timezone.utc)
+DATASET_SPAN = timedelta(days=730)
+
+_fake = None
+_password = None
+
+
+def pick_author(plan, salt, item_id):
+    authors = power_law(plan.users, plan.author_exponent, plan.seed, AUTHOR_RANKING)
+    return authors.sample(unit(plan.seed, salt, item_id))
+
+
+def pick_question(plan, answer_id):
+    questions = power_law(plan.questions, plan.answer_exponent, plan.seed, ANSWER_QUESTION)
+    return questions.sample(unit(plan.seed, ANSWER_QUESTION, answer_id))
+
+
+def pick_tags(rng, plan, question_id):
+    tags = power_law(plan.tags, plan.tag_exponent, plan.seed, QUESTION_TAGS)
+    # Число тегов — ранг степенного закона: малые значения самые частые
+    counts = power_law(min(MAX_TAGS_PER_QUESTION, plan.tags), plan.tag_count_exponent, plan.seed, TAG_COUNT)
+    wanted = counts.sample_rank(unit(plan.seed, TAG_COUNT, question_id))
+    chosen = []
+    # Несколько попыток на случай повторов головного тега — без бесконечного цикла
+    for _ in range(wanted * 4):
+        tag_id = tags.sample(rng.random())
+        if tag_id not in chosen:
+            chosen.append(tag_id)
+            if len(chosen) == wanted:
+                break
+    return chosen
+
+
+def created_at(item_id, total):
+    return DATASET_START + DATASET_SPAN * (item_id / total)
+
+
+def votes_for(plan, salt, total_likes, total_items, item_id):
+    # Ожидаемое число голосов — доля объекта в степенном законе,
+    # дробная часть округляется детерминированно
+    votes = power_law(total_items, plan.vote_exponent, plan.seed, salt)
+    expected = total_likes * votes.share(item_id)
+    whole = int(expected)
+    return whole + (1 if unit(plan.seed, VOTE_ROUNDING, item_id) < expected - whole else 0)
+
+
+def voters(rng, plan, author_id, count):
+    """count разных голосующих без автора — выборка без повторов, без циклов отбраковки"""
+    count = min(count, plan.users - 1)
+    return [uid + 1 if uid + 1 < author_id else uid + 2 for uid in rng.sample(range(plan.users - 1), count)]
+
+
+def batch_context(plan, stage, start):
+    global _fake, _password
+    if _fake is None:
+        _fake = Faker()
+        # Фиксированная соль — одинаковый хеш пароля при одинаковом seed
+        _password = make_password('password123', salt=f'filldb{plan.seed}')
+    _fake.seed_instance(f'{plan.seed}:{stage}:{start}')
+    return random.Random(f'{plan.seed}:{stage}:{start}'), _fake
+
+
+def copy_rows(model, fields, rows):
+    """Массовая вставка: COPY FROM STDIN на PostgreSQL, executemany на остальных БД"""
+    if not rows:
+        return 0
+    # Незаданные поля получают значения по умолчанию модели (в БД их нет)
+    defaults = [
+        field for field in model._meta.concrete_fields
+        if field.has_default() and field.name not in fields and not field.primary_key
+    ]
+    if defaults:
+        extra = tuple(field.get_default() for field in defaults)
+        fields = list(fields) + [field.name for field in defaults]
+        rows = [row + extra for row in rows]
+    table = connection.ops.quote_name(model._meta.db_table)
+    columns = ', '.join(connection.ops.quote_name(model._meta.get_field(f).column) for f in fields)
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            # psycopg 3: значения уходят как есть, в текст COPY их переводит драйвер
+            with cursor.copy(f'COPY {table} ({columns}) FROM STDIN') as copy:
+                for row in rows:
+                    copy.write_row(row)
+        else:
+            placeholders = ', '.join(['%s'] * len(fields))
+            cursor.executemany(f'INSERT INTO {table} ({columns}) VALUES ({placeholders})', rows)
+    return len(rows)
+
+
+def fill_users(plan, start, stop):
+    rng, fake = batch_context(plan, 'users', start)
+    users, profiles = [], []
+    for user_id in range(start, stop):
+        joined = created_at(user_id, plan.users)
+        users.append((user_id, f'user_{user_id}_{fake.user_name()}', fake.email(), _password,
+                      '', '', False, False, True, joined))
+        profiles.append((user_id, user_id, 0, 0))
+    copy_rows(User, ['id', 'username', 'email', 'password', 'first_name', 'last_name',
+                     'is_superuser', 'is_staff', 'is_active', 'date_joined'], users)
+    copy_rows(Profile, ['id', 'user', 'rating', 'answers_count'], profiles)
+    return len(users)
+
+
+def fill_tags(plan, start, stop):
+    rng, fake = batch_context(plan, 'tags', start)
+    rows = [(tag_id, f'tag_{tag_id}_{fake.word()}'[:50]) for tag_id in range(start, stop)]
+    return copy_rows(Tag, ['id', 'name'], rows)
+
+
+def fill_questions(plan, start, stop):
+    """Вопросы вместе с тегами и лайками: рейтинг известен сразу при вставке"""
+    rng, fake = batch_context(plan, 'questions', start)
+    questions, question_tags, likes = [], [], []
+    for question_id in range(start, stop):
+        author_id = pick_author(plan, QUESTION_AUTHOR, question_id)
+        asked = created_at(question_id, plan.questions)
+
+        rating = 0
+        count = votes_for(plan, QUESTION_VOTES, plan.question_likes, plan.questions, question_id)
+        for user_id in voters(rng, plan, author_id, count):
+            value = rng.choice((1, -1))
+            rating += value
+            likes.append((user_id, question_id, value, asked))
+
+        for tag_id in pick_tags(rng, plan, question_id):
+            question_tags.append((question_id, tag_id))
+
+        questions.append((question_id, fake.sentence()[:200], fake.text(max_nb_chars=1000),
+                          author_id, asked, asked, rating))
+
+    copy_rows(Question, ['id', 'title', 'content', 'author', 'created_at', 'updated_at', 'rating'], questions)
+    copy_rows(Question.tags.through, ['question', 'tag'], question_tags)
+    copy_rows(QuestionLike, ['user', 'question', 'value', 'created_at'], likes)
+    return len(questions) + len(question_tags) + len(likes)
+
+
+def fill_answers(plan, start, stop):
+    rng, fake = batch_context(plan, 'answers', start)
+    answers, likes = [], []
+    for answer_id in range(start, stop):
+        author_id = pick_author(plan, ANSWER_AUTHOR, answer_id)
+        question_id = pick_question(plan, answer_id)
+        answered = created_at(question_id, plan.questions) + timedelta(minutes=rng.randint(1, 600))
+
+        rating = 0
+        count = votes_for(plan, ANSWER_VOTES, plan.answer_likes, plan.answers, answer_id)
+        for user_id in voters(rng, plan, author_id, count):
+            value = rng.choice((1, -1))
+            rating += value
+            likes.append((user_id, answer_id, value, answered))
+
+        answers.append((answer_id, fake.text(max_nb_chars=500), author_id, question_id,
+                        answered, False, rating))
+
+    copy_rows(Answer, ['id', 'content', 'author', 'question', 'created_at', 'is_correct', 'rating'], answers)
+    copy_rows(AnswerLike, ['user', 'answer', 'value', 'created_at'], likes)
+    return len(answers) + len(likes)
+
+
+def fill_profiles(plan, start, stop):
+    # Итоги профилей — одним UPDATE с группировками на диапазон пользователей
+    rebuild(Profile.objects.filter(user_id__gte=start, user_id__lt=stop), profile_expressions())
+    return stop - start
+
+
+def fill_question_counters(plan, start, stop):
+    rebuild(Question.objects.filter(pk__gte=start, pk__lt=stop), question_counter_expressions())
+    return stop - start
+
+
+def fill_search_vectors(plan, start, stop):
+    Question.objects.filter(pk__gte=start, pk__lt=stop).update(search_vector=search_vector_expression())
+    return stop - start
+
+
+def fill_tag_counters(plan, start, stop):
+    rebuild(Tag.objects.filter(pk__gte=start, pk__lt=stop), tag_counter_expressions())
+    return stop - start
+
+
+def run_batch(task):
+    stage, plan, start, stop = task
+    with transaction.atomic():
+        return stage(plan, start, stop)
+
 
 class Command(BaseCommand):
     help = 'Fill database with sample data'
-    
+
     def add_arguments(self, parser):
         parser.add_argument('ratio', type=int, help='Fill ratio')
-    
+        parser.add_argument('--workers', type=int, default=None, help='Generator processes (default: CPU count)')
+        parser.add_argument('--batch-size', type=int, default=2000, help='Objects per batch / transaction')
+        parser.add_argument('--seed', type=int, default=None,
+                            help='Seed for a reproducible dataset (byte-identical with --workers 1)')
+        parser.add_argument('--profile', choices=sorted(PROFILES), default='uniform',
+                            help='Skew preset: uniform, zipf or production')
+        for name in ('authors', 'tags', 'answers', 'votes', 'tag_counts'):
+            parser.add_argument(f'--{name.replace("_", "-")}-exponent', type=float, default=None,
+                                help=f'Power-law exponent for {name.replace("_", " ")} (overrides --profile, 0 = uniform)')
+
     def handle(self, *args, **options):
         ratio = options['ratio']
-        fake = Faker()
-        
+        seed = options['seed'] if options['seed'] is not None else random.SystemRandom().randrange(2 ** 32)
+        exponents = dict(PROFILES[options['profile']])
+        for name in exponents:
+            if options[f'{name}_exponent'] is not None:
+                exponents[name] = options[f'{name}_exponent']
+        plan = Plan(
+            seed=seed,
+            users=ratio, tags=ratio, questions=ratio * 10, answers=ratio * 100,
+            question_likes=ratio * 100, answer_likes=ratio * 100,
+            author_exponent=exponents['authors'], tag_exponent=exponents['tags'],
+            answer_exponent=exponents['answers'], vote_exponent=exponents['votes'],
+            tag_count_exponent=exponents['tag_counts'],
+        )
+
         self.stdout.write(f'🚀 Starting to fill database with ratio: {ratio}')
         self.stdout.write(f'📊 Expected: Users: {ratio}, Questions: {ratio * 10}, Answers: {ratio * 100}, Tags: {ratio}, Likes: {ratio * 200}')
-        
+        self.stdout.write(f'🎲 Seed: {seed}, profile: {options["profile"]}, exponents: {exponents}')
+
         # Очищаем базу перед заполнением
         self.stdout.write('🗑️ Clearing existing data...')
-        with transaction.atomic():
-            AnswerLike.objects.all().delete()
-            QuestionLike.objects.all().delete()
-            Answer.objects.all().delete()
-            Question.objects.all().delete()
-            # Удаляем связи many-to-many перед удалением тегов
-            Question.tags.through.objects.all().delete()
-            Tag.objects.all().delete()
-            Profile.objects.all().delete()
-            User.objects.all().delete()
-        
+        self.clear()
         self.stdout.write(self.style.SUCCESS('✅ Database cleared'))
-        
-        with transaction.atomic():
-            # Создаем пользователей и профили пачками
-            self.stdout.write(f'👥 Creating {ratio} users and profiles...')
-            users = []
-            
-            for i in range(ratio):
-                username = f"user_{i}_{fake.user_name()}"
-                users.append(User(
-                    username=username,
-                    email=fake.email(),
-                    password='password123'
-                ))
-                
-                if (i + 1) % 1000 == 0:
-                    self.stdout.write(f'   Prepared {i + 1}/{ratio} users')
-            
-            # Bulk
-            User.objects.bulk_create(users, batch_size=1000)
-            self.stdout.write(self.style.SUCCESS(f'✅ Created {len(users)} users'))
-            
-            # Получаем ID созданных пользователей
-            user_ids = list(User.objects.values_list('id', flat=True))
-            
-            # Создаем профили
-            profiles = []
-            for user_id in user_ids:
-                profiles.append(Profile(user_id=user_id))
-            
-            Profile.objects.bulk_create(profiles, batch_size=1000)
-            self.stdout.write(self.style.SUCCESS(f'✅ Created {len(profiles)} profiles'))
-            
-            # Создаем теги пачками
-            self.stdout.write(f'🏷️ Creating {ratio} tags...')
-            tags = []
-            tag_names = set()
-            
-            for i in range(ratio):
-                tag_name = f"tag_{i}_{fake.word()}"
-                # Гарантируем уникальность имен
-                while tag_name in tag_names:
-                    tag_name = f"tag_{i}_{fake.word()}_{random.randint(1000, 9999)}"
-                tag_names.add(tag_name)
-                
-                tags.append(Tag(name=tag_name))
-                
-                if (i + 1) % 1000 == 0:
-                    self.stdout.write(f'   Prepared {i + 1}/{ratio} tags')
-            
-            Tag.objects.bulk_create(tags, batch_size=1000)
-            self.stdout.write(self.style.SUCCESS(f'✅ Created {len(tags)} tags'))
-            
-            # Получаем ID созданных тегов
-            tag_ids = list(Tag.objects.values_list('id', flat=True))
-            
-            # Создаем вопросы пачками
-            self.stdout.write(f'❓ Creating {ratio * 10} questions...')
-            questions = []
-            
-            for i in range(ratio * 10):
-                questions.append(Question(
-                    title=fake.sentence()[:200],
-                    content=fake.text(max_nb_chars=1000),
-                    author_id=random.choice(user_ids),
-                    rating=random.randint(0, 100)
-                ))
-                
-                if (i + 1) % 5000 == 0:
-                    self.stdout.write(f'   Prepared {i + 1}/{ratio * 10} questions')
-            
-            # Bulk
-            Question.objects.bulk_create(questions, batch_size=2000)
-            self.stdout.write(self.style.SUCCESS(f'✅ Created {len(questions)} questions'))
-            
-            # Получаем ID созданных вопросов
-            question_ids = list(Question.objects.values_list('id', flat=True))
-            
-            # Добавляем теги к вопросам (many-to-many)
-            self.stdout.write('🔗 Adding tags to questions...')
-            question_tag_relations = []
-            
-            for question_id in question_ids:
-                # 1-3 случайных тега на вопрос
-                num_tags = random.randint(1, min(3, len(tag_ids)))
-                for tag_id in random.sample(tag_ids, num_tags):
-                    question_tag_relations.append(Question.tags.through(
-                        question_id=question_id,
-                        tag_id=tag_id
-                    ))
-            
-            Question.tags.through.objects.bulk_create(question_tag_relations, batch_size=2000)
-            self.stdout.write(self.style.SUCCESS(f'✅ Added {len(question_tag_relations)} tag relations'))
-            
-            # Создаем ответы пачками
-            self.stdout.write(f'💬 Creating {ratio * 100} answers...')
-            answers = []
-            
-            for i in range(ratio * 100):
-                answers.append(Answer(
-                    content=fake.text(max_nb_chars=500),
-                    author_id=random.choice(user_ids),
-                    question_id=random.choice(question_ids),
-                    rating=random.randint(0, 50)
-                ))
-                
-                if (i + 1) % 10000 == 0:
-                    self.stdout.write(f'   Prepared {i + 1}/{ratio * 100} answers')
-            
-            Answer.objects.bulk_create(answers, batch_size=2000)
-            self.stdout.write(self.style.SUCCESS(f'✅ Created {len(answers)} answers'))
-            
-            # Получаем ID созданных ответов
-            answer_ids = list(Answer.objects.values_list('id', flat=True))
-            
-            # Создаем лайки для вопросов пачками
-            self.stdout.write(f'👍 Creating {ratio * 200} total likes...')
-            question_likes = []
-            answer_likes = []
-            
-            # Лайки для вопросов (~50%)
-            question_likes_target = ratio * 100
-            question_like_combinations = set()
-            
-            # Получаем информацию об авторах вопросов
-            question_authors = {q.id: q.author_id for q in Question.objects.only('id', 'author_id')}
-            
-            while len(question_likes) < question_likes_target:
-                user_id = random.choice(user_ids)
-                question_id = random.choice(question_ids)
-                
-                # Проверяем, не автор ли вопроса и не дубликат
-                if user_id != question_authors[question_id] and (user_id, question_id) not in question_like_combinations:
-                    question_like_combinations.add((user_id, question_id))
-                    question_likes.append(QuestionLike(
-                        user_id=user_id,
-                        question_id=question_id,
-                        value=random.choice([1, -1])
-                    ))
-                
-                if len(question_likes) % 5000 == 0 and len(question_likes) > 0:
-                    self.stdout.write(f'   Prepared {len(question_likes)}/{question_likes_target} question likes')
-            
-            if question_likes:
-                QuestionLike.objects.bulk_create(question_likes, batch_size=2000)
-            self.stdout.write(self.style.SUCCESS(f'✅ Created {len(question_likes)} question likes'))
-            
-            # Лайки для ответов (~50%)
-            answer_likes_target = ratio * 100
-            answer_like_combinations = set()
-            
-            # Получаем информацию об авторах ответов
-            answer_authors = {a.id: a.author_id for a in Answer.objects.only('id', 'author_id')}
-            
-            while len(answer_likes) < answer_likes_target:
-                user_id = random.choice(user_ids)
-                answer_id = random.choice(answer_ids)
-                
-                # Проверяем, не автор ли ответа и не дубликат
-                if user_id != answer_authors[answer_id] and (user_id, answer_id) not in answer_like_combinations:
-                    answer_like_combinations.add((user_id, answer_id))
-                    answer_likes.append(AnswerLike(
-                        user_id=user_id,
-                        answer_id=answer_id,
-                        value=random.choice([1, -1])
-                    ))
-                
-                if len(answer_likes) % 5000 == 0 and len(answer_likes) > 0:
-                    self.stdout.write(f'   Prepared {len(answer_likes)}/{answer_likes_target} answer likes')
-            
-            if answer_likes:
-                AnswerLike.objects.bulk_create(answer_likes, batch_size=2000)
-            self.stdout.write(self.style.SUCCESS(f'✅ Created {len(answer_likes)} answer likes'))
-
-            for user in User.objects.all():
-
-                profile = Profile.objects.get(user=user)
-
-                question_rating = Question.objects.filter(
-                    author=user
-                ).aggregate(total=Sum('rating'))['total'] or 0
-
-                answer_rating = Answer.objects.filter(
-                    author=user
-                ).aggregate(total=Sum('rating'))['total'] or 0
-                
-                answers_count = Answer.objects.filter(author=user).count()
-                
-                profile.rating = question_rating + answer_rating
-                profile.answers_count = answers_count
-                profile.save()
-
-        
+
+        # Воркеры открывают собственные соединения
+        connections.close_all()
+        with get_context('fork').Pool(options['workers']) as pool:
+            stages = [
+                ('👥 Users and profiles', fill_users, plan.users),
+                ('🏷️ Tags', fill_tags, plan.tags),
+                ('❓ Questions, tags and likes', fill_questions, plan.questions),
+                ('💬 Answers and likes', fill_answers, plan.answers),
+                ('📈 Profile stats', fill_profiles, plan.users),
+                ('🔢 Question answer counters', fill_question_counters, plan.questions),
+                ('🔢 Tag question counters', fill_tag_counters, plan.tags),
+                ('🔎 Search vectors', fill_search_vectors, plan.questions),
+            ]
+            for title, stage, total in stages:
+                self.run_stage(pool, title, stage, plan, total, options['batch_size'])
+
+        self.reset_sequences()
+        call_command('refresh_tag_ranking', stdout=self.stdout)
+        # TRUNCATE вернул pk и cache_version к началу: под теми же ключами
+        # в кэше лежат карточки и страницы старых данных
+        invalidate_sidebar()
+        purge_all()
+
         # Финальная статистика
         self.stdout.write(self.style.SUCCESS('🎉 Database filled successfully!'))
         self.stdout.write(self.style.SUCCESS(f'📊 Final stats:'))
-        self.stdout.write(self.style.SUCCESS(f'   👥 Users: {User.objects.count()}'))
-        self.stdout.write(self.style.SUCCESS(f'   🏷️ Tags: {Tag.objects.count()}'))
-        self.stdout.write(self.style.SUCCESS(f'   ❓ Questions: {Question.objects.count()}'))
-        self.stdout.write(self.style.SUCCESS(f'   💬 Answers: {Answer.objects.count()}'))
+        self.stdout.write(self.style.SUCCESS(f'   👥 Users: {plan.users}'))
+        self.stdout.write(self.style.SUCCESS(f'   🏷️ Tags: {plan.tags}'))
+        self.stdout.write(self.style.SUCCESS(f'   ❓ Questions: {plan.questions}'))
+        self.stdout.write(self.style.SUCCESS(f'   💬 Answers: {plan.answers}'))
         self.stdout.write(self.style.SUCCESS(f'   👍 Question likes: {QuestionLike.objects.count()}'))
         self.stdout.write(self.style.SUCCESS(f'   👍 Answer likes: {AnswerLike.objects.count()}'))
-        self.stdout.write(self.style.SUCCESS(f'   👍 Total likes: {QuestionLike.objects.count() + AnswerLike.objects.count()}'))
\ No newline at end of file
+
+    def run_stage(self, pool, title, stage, plan, total, batch_size):
+        started = time.monotonic()
+        tasks = (
+            (stage, plan, start, min(start + batch_size, total + 1))
+            for start in range(1, total + 1, batch_size)
+        )
+        rows = 0
+        for done in pool.imap_unordered(run_batch, tasks):
+            rows += done
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'✅ {title}: {rows} rows in {elapsed:.1f}s ({rows / max(elapsed, 1e-9):,.0f} rows/s)'
+        ))
+
+    def clear(self):
+        models = [AnswerLike, QuestionLike, Answer, Question.tags.through, Question, Tag, Profile, User]
+        if connection.vendor == 'postgresql':
+            tables = ', '.join(connection.ops.quote_name(model._meta.db_table) for model in models)
+            with connection.cursor() as cursor:
+                cursor.execute(f'TRUNCATE {tables} RESTART IDENTITY CASCADE')
+            return
+        with transaction.atomic():
+            for model in models:
+                model.objects.all().delete()
+
+    def reset_sequences(self):
+        # Строки вставлены с явными id — сдвигаем последовательности за них
+        models = [User, Profile, Tag, Question, Question.tags.through, Answer, QuestionLike, AnswerLike]
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sequence_reset_sql(no_style(), models):
+                cursor.execute(sql)
@@ -0,0 +1,35 @@
+# management/commands/fix_counters.py
+import time
+
+from main.models import Question, Tag
+from main.counters import question_counter_expressions, tag_counter_expressions
+from main.pages import purge_all
+from main.sidebar import invalidate_sidebar
+from main.management.commands.fix_ratings import Command as FixRatingsCommand, Stage
+
+
+STAGES = [
+    Stage('question answers_count', Question, None, question_counter_expressions),
+    Stage('tag questions_count', Tag, None, tag_counter_expressions),
+]
+
+
+class Command(FixRatingsCommand):
+    help = 'Verify and rebuild Question.answers_count and Tag.questions_count'
+    stages = STAGES
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=10000, help='Rows per UPDATE')
+        parser.add_argument('--workers', type=int, default=1, help='Parallel processes over id ranges')
+        parser.add_argument('--dry-run', action='store_true', help='Only report drifted rows')
+
+    def handle(self, *args, **options):
+        options['users'] = None
+        started = time.monotonic()
+        self.stdout.write('🔄 Checking counters (dry run)...' if options['dry_run'] else '🔄 Rebuilding counters...')
+        for stage in self.stages:
+            self.run_stage(stage, options)
+        if not options['dry_run']:
+            invalidate_sidebar()
+            purge_all()
+        self.stdout.write(self.style.SUCCESS(f'\n✅ Done in {time.monotonic() - started:.1f}s'))
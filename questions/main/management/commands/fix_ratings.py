@@ -1,49 +1,148 @@
 # management/commands/fix_ratings.py
-from django.core.management.base import BaseCommand
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+from django.core.management.base import BaseCommand, CommandError
 from django.contrib.auth.models import User
-from main.models import Profile, Question, Answer
-from django.db.models import Sum, Count
+from django.db import connections
+from django.db.models import Max, Min
+
+from main.models import Profile, Question, Answer, DirtyProfile
+from main.ratings import (
+    rebuild, question_rating_expressions, answer_rating_expressions,
+    profile_expressions, drain_dirty_profiles,
+)
+from main.pages import purge_all
+from main.sidebar import invalidate_sidebar
+
+
+# user_field — поле с id пользователя для --users
+Stage = namedtuple('Stage', 'name model user_field expressions')
+
+# Этапы идут строго по порядку: рейтинг профиля суммирует
+# уже исправленные рейтинги вопросов и ответов
+STAGES = [
+    Stage('questions', Question, 'author_id', question_rating_expressions),
+    Stage('answers', Answer, 'author_id', answer_rating_expressions),
+    Stage('profiles', Profile, 'user_id', profile_expressions),
+]
+
+
+def stage_queryset(stage, users=None):
+    queryset = stage.model.objects.all()
+    if users:
+        queryset = queryset.filter(**{f'{stage.user_field}__gte': users[0], f'{stage.user_field}__lte': users[1]})
+    return queryset
+
+
+def rebuild_chunk(stage, low, high, users, dry_run):
+    """Обработать диапазон id [low, high) одного этапа; выполняется в воркере"""
+    queryset = stage_queryset(stage, users).filter(pk__gte=low, pk__lt=high)
+    return queryset.count(), rebuild(queryset, stage.expressions(), dry_run=dry_run)
+
+
+def parse_users(value):
+    try:
+        low, _, high = value.partition('-')
+        return int(low), int(high or low)
+    except ValueError:
+        raise CommandError(f'--users expects a range like 1000-2000, got "{value}"')
+
 
 class Command(BaseCommand):
-    help = 'Update user ratings in profiles based on existing questions and answers'
-    
+    help = 'Rebuild question/answer ratings from likes, then profile rating and answers_count'
+    stages = STAGES
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=None, help='Rows per UPDATE (default: 10000)')
+        parser.add_argument('--workers', type=int, default=None, help='Parallel processes over id ranges (default: 1)')
+        parser.add_argument('--dry-run', action='store_true', help='Only report drifted rows')
+        parser.add_argument('--only-dirty', action='store_true', help='Only profiles queued in DirtyProfile')
+        parser.add_argument('--users', type=parse_users, default=None, help='User id range, e.g. 1000-2000')
+
     def handle(self, *args, **options):
-        self.stdout.write('🔄 Updating user ratings in profiles...')
-        
-        total_users = User.objects.count()
-        processed = 0
-        
-        for user in User.objects.all():
-            # Получаем профиль
-            profile, created = Profile.objects.get_or_create(user=user)
-            
-            # Считаем рейтинг вопросов
-            question_rating = Question.objects.filter(
-                author=user
-            ).aggregate(total=Sum('rating'))['total'] or 0
-            
-            # Считаем рейтинг ответов
-            answer_rating = Answer.objects.filter(
-                author=user
-            ).aggregate(total=Sum('rating'))['total'] or 0
-            
-            # Считаем количество ответов
-            answers_count = Answer.objects.filter(author=user).count()
-            
-            # Обновляем профиль
-            profile.rating = question_rating + answer_rating
-            profile.answers_count = answers_count
-            profile.save()
-            
-            processed += 1
-            
-            if processed % 100 == 0:
-                self.stdout.write(f'   Processed {processed}/{total_users} users')
-        
+        if options['only_dirty']:
+            # Очередь разбирается пачками flush_profiles — эти флаги к ней не относятся
+            conflicting = [
+                flag for flag, name in (('--workers', 'workers'), ('--chunk-size', 'chunk_size'), ('--users', 'users'))
+                if options[name] is not None
+            ]
+            if conflicting:
+                raise CommandError(f'--only-dirty cannot be combined with {", ".join(conflicting)}')
+        dry_run = options['dry_run']
+        started = time.monotonic()
+        self.stdout.write('🔄 Checking ratings (dry run)...' if dry_run else '🔄 Rebuilding ratings...')
+
+        if options['only_dirty']:
+            self.fix_dirty(dry_run)
+        else:
+            self.create_missing_profiles(options['users'], dry_run)
+            for stage in self.stages:
+                self.run_stage(stage, options)
+        if not dry_run:
+            invalidate_sidebar()
+            purge_all()
+
         # Показываем результат
         self.stdout.write('\n🏆 Top 5 users by rating:')
         top_users = Profile.objects.select_related('user').order_by('-rating')[:5]
         for i, profile in enumerate(top_users, 1):
             self.stdout.write(f'   {i}. {profile.user.username}: rating={profile.rating}, answers={profile.answers_count}')
-        
-        self.stdout.write(self.style.SUCCESS(f'\n✅ Successfully updated ratings for {processed} users'))
\ No newline at end of file
+
+        self.stdout.write(self.style.SUCCESS(f'\n✅ Done in {time.monotonic() - started:.1f}s'))
+
+    def create_missing_profiles(self, users, dry_run):
+        missing = User.objects.filter(profile__isnull=True)
+        if users:
+            missing = missing.filter(id__range=users)
+        if dry_run:
+            self.stdout.write(f'   users without profile: {missing.count()}')
+            return
+        created = Profile.objects.bulk_create(
+            [Profile(user_id=user_id) for user_id in missing.values_list('id', flat=True).iterator()],
+            batch_size=1000,
+            ignore_conflicts=True,
+        )
+        self.stdout.write(f'   created missing profiles: {len(created)}')
+
+    def fix_dirty(self, dry_run):
+        started = time.monotonic()
+        if dry_run:
+            user_ids = DirtyProfile.objects.values('user_id')
+            drift = rebuild(Profile.objects.filter(user_id__in=user_ids), profile_expressions(), dry_run=True)
+            self.stdout.write(f'   dirty profiles: {DirtyProfile.objects.count()}, drifted: {drift}')
+            return
+        flushed, _ = drain_dirty_profiles()
+        self.report('dirty profiles', flushed, None, time.monotonic() - started)
+
+    def run_stage(self, stage, options):
+        bounds = stage_queryset(stage, options['users']).aggregate(low=Min('pk'), high=Max('pk'))
+        if bounds['low'] is None:
+            return
+
+        chunk = options['chunk_size'] or 10000
+        workers = options['workers'] or 1
+        chunks = [
+            (stage, low, low + chunk, options['users'], options['dry_run'])
+            for low in range(bounds['low'], bounds['high'] + 1, chunk)
+        ]
+
+        started = time.monotonic()
+        if workers > 1:
+            # Дочерние процессы не должны делить сокет с родителем
+            connections.close_all()
+            with ProcessPoolExecutor(workers, mp_context=get_context('fork')) as pool:
+                results = list(pool.map(rebuild_chunk, *zip(*chunks)))
+        else:
+            results = [rebuild_chunk(*args) for args in chunks]
+
+        rows = sum(result[0] for result in results)
+        drift = sum(result[1] for result in results)
+        self.report(stage.name, rows, drift, time.monotonic() - started)
+
+    def report(self, name, rows, drift, elapsed):
+        rate = rows / elapsed if elapsed else 0
+        drift_note = '' if drift is None else f', drifted {drift}'
+        self.stdout.write(f'   {name}: {rows} rows{drift_note} in {elapsed:.2f}s ({rate:,.0f} rows/s)')
@@ -0,0 +1,46 @@
+# management/commands/flush_profiles.py
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from main.ratings import drain_dirty_profiles, dirty_queue_stats
+
+
+class Command(BaseCommand):
+    help = 'Recompute profiles queued in DirtyProfile (PROFILE_RATING_MODE = "deferred")'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval', type=float, default=None,
+            help='Seconds between flushes (default: PROFILE_RATING_MAX_STALENESS / 2)',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=None,
+            help='Profiles per UPDATE (default: PROFILE_FLUSH_BATCH_SIZE)',
+        )
+        parser.add_argument('--once', action='store_true', help='Drain the queue once and exit (for cron)')
+
+    def handle(self, *args, **options):
+        max_staleness = getattr(settings, 'PROFILE_RATING_MAX_STALENESS', 30)
+        # Очередь разбирается полностью за цикл, поэтому отметка ждёт не
+        # дольше интервала плюс время одного прохода
+        interval = options['interval'] or max_staleness / 2
+
+        if not options['once']:
+            self.stdout.write(f'🔄 Flushing dirty profiles every {interval:g}s (staleness bound {max_staleness}s)')
+
+        while True:
+            stats = dirty_queue_stats()
+            flushed, elapsed = drain_dirty_profiles(options['batch_size'])
+
+            line = (f'   queue_depth={stats["depth"]} oldest_age={stats["oldest_age"]:.1f}s '
+                    f'flushed={flushed} flush_latency={elapsed * 1000:.1f}ms')
+            if stats['oldest_age'] > max_staleness:
+                self.stdout.write(self.style.WARNING(line + ' ⚠️ staleness bound exceeded'))
+            elif flushed or options['once']:
+                self.stdout.write(line)
+
+            if options['once']:
+                break
+            time.sleep(max(interval - elapsed, 0))
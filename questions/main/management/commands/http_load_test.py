@@ -0,0 +1,116 @@
+# management/commands/http_load_test.py
+import asyncio
+import statistics
+import time
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+
+from main.models import Question, Tag
+
+
+class Client:
+    """Один клиент HTTP/1.1 с keep-alive; переподключается, если сервер закрыл соединение"""
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.reader = self.writer = None
+
+    async def get(self, path):
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+            return await self.request(path)
+        try:
+            return await self.request(path)
+        except (OSError, asyncio.IncompleteReadError, IndexError):
+            # Сервер закрыл простаивавшее соединение (например, воркер ушёл
+            # на перезапуск по max_requests) — как браузер, повторяем один раз
+            self.close()
+            return await self.get(path)
+
+    async def request(self, path):
+        self.writer.write(f'GET {path} HTTP/1.1\r\nHost: {self.host}\r\n\r\n'.encode())
+        await self.writer.drain()
+        status = int((await self.reader.readline()).split()[1])
+        headers = {}
+        while (line := await self.reader.readline()) not in (b'\r\n', b''):
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip().lower()
+        if 'content-length' in headers:
+            await self.reader.readexactly(int(headers['content-length']))
+        elif headers.get('transfer-encoding') == 'chunked':
+            while size := int((await self.reader.readline()).strip(), 16):
+                await self.reader.readexactly(size + 2)
+            await self.reader.readline()
+        else:
+            await self.reader.read()
+            headers['connection'] = 'close'
+        if headers.get('connection') == 'close':
+            self.close()
+        return status
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.reader = self.writer = None
+
+
+class Command(BaseCommand):
+    help = (
+        'Load a running server over HTTP with keep-alive clients and report req/s and latency '
+        '(compare runserver with the gunicorn profile, see README)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('url', nargs='?', default='http://127.0.0.1:8000', help='Server base URL')
+        parser.add_argument('--requests', type=int, default=2000, help='Total requests')
+        parser.add_argument('--concurrency', type=int, default=32, help='Concurrent keep-alive clients')
+
+    def handle(self, *args, **options):
+        url = urlsplit(options['url'])
+        question = Question.objects.order_by('-id').values_list('pk', flat=True).first()
+        tag = Tag.objects.order_by('-questions_count').values_list('name', flat=True).first()
+        if question is None or tag is None:
+            raise CommandError('No questions — run fill_db first')
+        paths = ['/', '/?sort=hot', f'/tag/{tag}/', f'/question/{question}/']
+        latencies, errors, elapsed = asyncio.run(
+            self.load(url.hostname, url.port or 80, paths, options)
+        )
+
+        self.stdout.write(
+            f'🚀 {len(latencies)} requests in {elapsed:.2f}s: {len(latencies) / elapsed:.0f} req/s, '
+            f'{errors} errors'
+        )
+        if latencies:
+            latencies.sort()
+            p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+            self.stdout.write(
+                f'⏱  latency ms: p50={statistics.median(latencies):.1f} p99={p99:.1f} max={latencies[-1]:.1f}'
+            )
+
+    async def load(self, host, port, paths, options):
+        remaining = iter(range(options['requests']))
+        latencies, errors = [], 0
+
+        async def run():
+            nonlocal errors
+            client = Client(host, port)
+            try:
+                for number in remaining:
+                    started = time.monotonic()
+                    try:
+                        status = await client.get(paths[number % len(paths)])
+                    except (OSError, ValueError, IndexError, asyncio.IncompleteReadError):
+                        client.close()
+                        status = None
+                    if status == 200:
+                        latencies.append((time.monotonic() - started) * 1000)
+                    else:
+                        errors += 1
+            finally:
+                client.close()
+
+        started = time.monotonic()
+        await asyncio.gather(*(run() for _ in range(options['concurrency'])))
+        return latencies, errors, time.monotonic() - started
@@ -0,0 +1,47 @@
+# management/commands/refresh_hot_scores.py
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db.models import Max, Min
+from django.utils import timezone
+
+from main.hot import hot_score_expression
+from main.models import Question
+from main.pages import purge
+from main.ratings import rebuild
+
+
+class Command(BaseCommand):
+    help = 'Recompute Question.hot_score in chunks (after changing HOT_* settings or to repair drift)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=None, help='Only questions asked in the last N days')
+        parser.add_argument('--chunk-size', type=int, default=10000, help='Questions per UPDATE')
+        parser.add_argument('--interval', type=float, default=None, help='Repeat every N seconds instead of exiting')
+
+    def handle(self, *args, **options):
+        while True:
+            self.refresh(options)
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
+
+    def refresh(self, options):
+        questions = Question.objects.all()
+        if options['days']:
+            questions = questions.filter(created_at__gte=timezone.now() - timedelta(days=options['days']))
+
+        started = time.monotonic()
+        bounds = questions.aggregate(low=Min('pk'), high=Max('pk'))
+        changed = 0
+        if bounds['low'] is not None:
+            for low in range(bounds['low'], bounds['high'] + 1, options['chunk_size']):
+                chunk = questions.filter(pk__gte=low, pk__lt=low + options['chunk_size'])
+                changed += rebuild(chunk, {'hot_score': hot_score_expression()})
+        if changed:
+            purge(['hot'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f'✅ Hot scores: {changed} questions changed in {time.monotonic() - started:.2f}s'
+        ))
@@ -0,0 +1,55 @@
+# management/commands/refresh_tag_ranking.py
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db.models import Max, Min
+from django.utils import timezone
+
+from main.models import Tag
+from main.counters import tag_popularity_expressions
+from main.ratings import rebuild
+from main.sidebar import invalidate_sidebar
+
+
+class Command(BaseCommand):
+    help = 'Recompute Tag.popularity over a recent time window (run on a schedule)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=None, help='Window size (default: TAG_RANKING_WINDOW_DAYS)')
+        parser.add_argument('--answer-weight', type=float, default=None)
+        parser.add_argument('--vote-weight', type=float, default=None)
+        parser.add_argument('--chunk-size', type=int, default=10000, help='Tags per UPDATE')
+        parser.add_argument('--interval', type=float, default=None, help='Repeat every N seconds instead of exiting')
+
+    def handle(self, *args, **options):
+        while True:
+            self.refresh(options)
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
+
+    def refresh(self, options):
+        days = options['days'] or settings.TAG_RANKING_WINDOW_DAYS
+        answer_weight = options['answer_weight']
+        vote_weight = options['vote_weight']
+        expressions = tag_popularity_expressions(
+            since=timezone.now() - timedelta(days=days),
+            answer_weight=settings.TAG_RANKING_ANSWER_WEIGHT if answer_weight is None else answer_weight,
+            vote_weight=settings.TAG_RANKING_VOTE_WEIGHT if vote_weight is None else vote_weight,
+        )
+
+        started = time.monotonic()
+        bounds = Tag.objects.aggregate(low=Min('pk'), high=Max('pk'))
+        changed = 0
+        if bounds['low'] is not None:
+            for low in range(bounds['low'], bounds['high'] + 1, options['chunk_size']):
+                tags = Tag.objects.filter(pk__gte=low, pk__lt=low + options['chunk_size'])
+                changed += rebuild(tags, expressions)
+        invalidate_sidebar()
+
+        top = ', '.join(Tag.objects.order_by(*Tag.POPULAR_ORDERING).values_list('name', flat=True)[:5])
+        self.stdout.write(self.style.SUCCESS(
+            f'✅ Tag ranking over {days}d: {changed} tags changed in {time.monotonic() - started:.2f}s. Top: {top}'
+        ))
@@ -0,0 +1,115 @@
+# management/commands/sse_load_test.py
+import asyncio
+import statistics
+import time
+
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand, CommandError
+
+from main import live
+from main.models import Question
+
+
+class Stream:
+    """Один SSE-клиент, подключённый напрямую к ASGI-приложению"""
+
+    def __init__(self, app, path):
+        self.app = app
+        self.path = path
+        self.status = None
+        self.arrivals = {}  # номер события -> время получения
+        self.closed = asyncio.Event()
+        self.sent_request = False
+
+    async def receive(self):
+        if not self.sent_request:
+            self.sent_request = True
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+        await self.closed.wait()
+        return {'type': 'http.disconnect'}
+
+    async def send(self, message):
+        if message['type'] == 'http.response.start':
+            self.status = message['status']
+        elif message['type'] == 'http.response.body':
+            now = time.monotonic()
+            for line in message.get('body', b'').split(b'\n'):
+                if line.startswith(b'data: {"seq": '):
+                    self.arrivals[int(line[len(b'data: {"seq": '):].rstrip(b'}'))] = now
+
+    async def run(self):
+        scope = {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1',
+            'method': 'GET', 'scheme': 'http', 'path': self.path, 'raw_path': self.path.encode(),
+            'query_string': b'', 'headers': [(b'host', b'localhost')],
+            'client': ('127.0.0.1', 0), 'server': ('localhost', 80),
+        }
+        await self.app(scope, self.receive, self.send)
+
+
+class Command(BaseCommand):
+    help = (
+        'Hold many open SSE streams of one question against the ASGI app in-process '
+        'and measure event fan-out (clients share the server\'s CPU, so latencies are an upper bound)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('question_id', type=int, nargs='?', help='Question to subscribe to (default: latest)')
+        parser.add_argument('--streams', type=int, default=1000, help='Open streams')
+        parser.add_argument('--events', type=int, default=20, help='Events to publish')
+        parser.add_argument('--interval', type=float, default=0.05, help='Seconds between events')
+        parser.add_argument('--timeout', type=float, default=30, help='Seconds to wait for connects and delivery')
+
+    def handle(self, *args, **options):
+        question_id = options['question_id'] or Question.objects.values_list('pk', flat=True).last()
+        if question_id is None:
+            raise CommandError('No questions — run fill_db first')
+        asyncio.run(self.load(question_id, options))
+
+    async def load(self, question_id, options):
+        app = get_asgi_application()
+        streams = [Stream(app, f'/question/{question_id}/events/') for _ in range(options['streams'])]
+
+        started = time.monotonic()
+        tasks = [asyncio.create_task(stream.run()) for stream in streams]
+        deadline = started + options['timeout']
+        while live.subscriber_count(question_id) < len(streams) and time.monotonic() < deadline:
+            if all(task.done() for task in tasks):
+                break
+            await asyncio.sleep(0.05)
+        connected = live.subscriber_count(question_id)
+        self.stdout.write(f'🔌 {connected}/{len(streams)} streams open in {time.monotonic() - started:.2f}s')
+
+        published = {}
+        for seq in range(options['events']):
+            published[seq] = time.monotonic()
+            live.publish(question_id, 'load', {'seq': seq})
+            await asyncio.sleep(options['interval'])
+
+        expected = options['events'] * connected
+        while sum(len(stream.arrivals) for stream in streams) < expected and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+
+        for stream in streams:
+            stream.closed.set()
+        await asyncio.wait(tasks, timeout=5)
+        leaked = live.subscriber_count(question_id)
+
+        latencies = sorted(
+            (arrived - published[seq]) * 1000
+            for stream in streams for seq, arrived in stream.arrivals.items()
+        )
+        delivered = len(latencies)
+        failed = sum(1 for stream in streams if stream.status != 200)
+        self.stdout.write(
+            f'📨 {delivered}/{expected} events delivered, {failed} streams failed, {leaked} left subscribed'
+        )
+        if latencies:
+            p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+            self.stdout.write(
+                f'⏱  latency ms: p50={statistics.median(latencies):.1f} p99={p99:.1f} max={latencies[-1]:.1f}'
+            )
+        if delivered == expected and not (failed or leaked):
+            self.stdout.write(self.style.SUCCESS('✅ SSE load test passed'))
+        else:
+            self.stdout.write(self.style.ERROR('❌ SSE load test failed'))
@@ -0,0 +1,100 @@
+"""Распределения для генератора тестовых данных (manage.py fill_db).
+
+Все выборы детерминированы: значение зависит только от seed, «соли»
+(что выбираем) и id объекта, поэтому любой процесс-воркер получает те же
+авторов, вопросы и число голосов, не читая ничего из БД.
+"""
+import math
+from functools import lru_cache
+
+
+# Показатели степенных законов; 0 — равномерное распределение.
+#   authors  — кто пишет вопросы и ответы (power users)
+#   tags     — какие теги ставят на вопросы (head tags)
+#   answers  — на какие вопросы отвечают (горячие вопросы)
+#   votes    — сколько голосов получает вопрос или ответ
+#   tag_counts — сколько тегов у вопроса, от 1 до MAX_TAGS_PER_QUESTION:
+#                чаще один-два, реже полный набор
+PROFILES = {
+    'uniform': {'authors': 0.0, 'tags': 0.0, 'answers': 0.0, 'votes': 0.0, 'tag_counts': 0.0},
+    'zipf': {'authors': 1.0, 'tags': 1.0, 'answers': 1.0, 'votes': 1.0, 'tag_counts': 1.0},
+    'production': {'authors': 1.1, 'tags': 1.3, 'answers': 0.9, 'votes': 1.4, 'tag_counts': 1.2},
+}
+
+MAX_TAGS_PER_QUESTION = 5
+
+# Соли для независимых выборов
+QUESTION_AUTHOR, ANSWER_AUTHOR, ANSWER_QUESTION, QUESTION_TAGS = 1, 2, 3, 4
+QUESTION_VOTES, ANSWER_VOTES, VOTE_ROUNDING, AUTHOR_RANKING = 5, 6, 7, 8
+TAG_COUNT = 9
+
+_MASK = (1 << 64) - 1
+
+
+def splitmix(x):
+    x = (x + 0x9E3779B97F4A7C15) & _MASK
+    x = ((x ^ (x >> 30)) * 0xBF58476D1CE4E5B9) & _MASK
+    x = ((x ^ (x >> 27)) * 0x94D049BB133111EB) & _MASK
+    return x ^ (x >> 31)
+
+
+def unit(seed, salt, item_id):
+    """Псевдослучайное число из [0, 1), одинаковое в любом процессе"""
+    return splitmix(splitmix(seed * 16 + salt) ^ item_id) / 2 ** 64
+
+
+class PowerLaw:
+    """Непрерывное приближение закона Ципфа над объектами 1..n.
+
+    Ранги переставлены биекцией rank -> id, чтобы популярность не
+    совпадала с возрастом объекта (id 1 не обязан быть самым горячим).
+    Выборка и доля объекта считаются за O(1) без таблиц весов.
+    """
+
+    def __init__(self, n, exponent, seed, salt):
+        self.n = n
+        self.s = exponent
+        self.step = self._coprime_step(n, splitmix(seed * 16 + salt))
+        self.inverse_step = pow(self.step, -1, n) if n > 1 else 0
+        self.offset = splitmix(seed * 16 + salt + 1) % n
+
+    @staticmethod
+    def _coprime_step(n, x):
+        step = x % n or 1
+        while math.gcd(step, n) != 1:
+            step = step % n + 1
+        return step
+
+    def _cdf(self, x):
+        # Доля веса рангов [1, x) при плотности x^-s на [1, n + 1)
+        if self.s == 1:
+            return math.log(x) / math.log(self.n + 1)
+        return (x ** (1 - self.s) - 1) / ((self.n + 1) ** (1 - self.s) - 1)
+
+    def rank_to_id(self, rank):
+        return ((rank - 1) * self.step + self.offset) % self.n + 1
+
+    def id_to_rank(self, item_id):
+        return ((item_id - 1 - self.offset) * self.inverse_step) % self.n + 1
+
+    def sample_rank(self, u):
+        """Ранг (1 — самый частый) для равномерного u из [0, 1)"""
+        if self.s == 1:
+            x = (self.n + 1) ** u
+        else:
+            x = (1 + u * ((self.n + 1) ** (1 - self.s) - 1)) ** (1 / (1 - self.s))
+        return min(int(x), self.n)
+
+    def sample(self, u):
+        """id объекта для равномерного u из [0, 1)"""
+        return self.rank_to_id(self.sample_rank(u))
+
+    def share(self, item_id):
+        """Доля объекта в общем весе; сумма по всем объектам равна 1"""
+        rank = self.id_to_rank(item_id)
+        return self._cdf(rank + 1) - self._cdf(rank)
+
+
+@lru_cache(maxsize=None)
+def power_law(n, exponent, seed, salt):
+    return PowerLaw(n, exponent, seed, salt)
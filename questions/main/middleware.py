@@ -0,0 +1,70 @@
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.utils.decorators import sync_and_async_middleware
+
+from main import db_router
+from main.fragments import miss_cost
+
+
+def _add_header(request, response):
+    counters = getattr(request, 'fragment_stats', None)
+    if counters:
+        response['X-Fragment-Cache'] = (
+            f"hits={counters['hits']}; misses={counters['misses']}; "
+            f"render_ms={counters['render_seconds'] * 1000:.1f}; "
+            f"saved_ms={counters['hits'] * miss_cost() * 1000:.1f}"
+        )
+    return response
+
+
+@sync_and_async_middleware
+def fragment_stats(get_response):
+    """Заголовок X-Fragment-Cache со счётчиками кэша фрагментов за запрос;
+    saved_ms — попадания, умноженные на среднюю цену промаха.
+    Умеет и async: под ASGI асинхронные вьюхи не уходят в поток ради неё"""
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            return _add_header(request, await get_response(request))
+    else:
+        def middleware(request):
+            return _add_header(request, get_response(request))
+    return middleware
+
+
+def show_toolbar(request):
+    """Тулбар только при DEBUG; SSE-потоки бесконечны — тулбару там нечего
+    показывать, а хранит он каждый"""
+    return settings.DEBUG and not request.path.endswith('/events/')
+
+
+def _begin(request):
+    db_router.begin(
+        request.method not in ('GET', 'HEAD', 'OPTIONS') or db_router.STICKY_COOKIE in request.COOKIES
+    )
+
+
+def _stick(response):
+    if db_router.wrote():
+        response.set_cookie(
+            db_router.STICKY_COOKIE, '1', max_age=db_router.sticky_seconds(), httponly=True, samesite='Lax'
+        )
+    return response
+
+
+@sync_and_async_middleware
+def replica_stickiness(get_response):
+    """Изменяющие запросы читают с primary; записавший клиент получает cookie
+    и ещё REPLICA_STICKY_SECONDS секунд читает с primary, см. main/db_router.py"""
+    if not db_router.replicas_enabled():
+        raise MiddlewareNotUsed
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            _begin(request)
+            return _stick(await get_response(request))
+    else:
+        def middleware(request):
+            _begin(request)
+            return _stick(get_response(request))
+    return middleware
+
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.7 on 2026-10-18 09:50
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def fill_counters(apps, schema_editor):
+    Question = apps.get_model('main', 'Question')
+    Tag = apps.get_model('main', 'Tag')
+    Answer = apps.get_model('main', 'Answer')
+    QuestionTags = Question.tags.through
+
+    def counted(model, key):
+        return Coalesce(Subquery(
+            model.objects.filter(**{key: OuterRef('pk')}).order_by().values(key)
+            .annotate(n=Count('id')).values('n')
+        ), 0)
+
+    Question.objects.update(answers_count=counted(Answer, 'question_id'))
+    Tag.objects.update(questions_count=counted(QuestionTags, 'tag_id'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0003_dirtyprofile'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='question',
+            name='answers_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='tag',
+            name='questions_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.7 on 2026-10-18 09:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0004_question_answers_count_tag_questions_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tag',
+            name='popularity',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='tag',
+            index=models.Index(fields=['-popularity', '-questions_count'], name='tag_popularity_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.7 on 2026-10-18 09:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0005_tag_popularity'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='answer',
+            name='cache_version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='question',
+            name='cache_version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.7 on 2026-10-18 09:59
+
+from django.db import migrations, models
+
+# Формула main/hot.py на момент миграции, с константами по умолчанию:
+# HOT_ANSWER_WEIGHT = 2, HOT_SCORE_PERIOD = 45000, HOT_EPOCH = 2025-01-01 UTC.
+# Дальнейшие изменения формулы пересчитывает manage.py refresh_hot_scores
+FILL_HOT_SCORES = """
+    UPDATE main_question SET hot_score =
+        SIGN((rating + 2 * answers_count)::double precision)
+        * LOG(GREATEST(ABS((rating + 2 * answers_count)::double precision), 1.0))
+        + (EXTRACT(EPOCH FROM created_at)::double precision - 1735689600.0) / 45000.0
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0006_fragment_cache_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='question',
+            name='hot_score',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='question',
+            index=models.Index(fields=['-hot_score', '-id'], name='question_hot_idx'),
+        ),
+        migrations.RunSQL(FILL_HOT_SCORES, migrations.RunSQL.noop),
+    ]
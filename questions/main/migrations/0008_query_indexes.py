@@ -0,0 +1,39 @@
+# Generated by Django 5.2.7 on 2026-10-18 10:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0007_question_hot_score'),
+    ]
+
+    operations = [
+        # Связующая таблица тегов создаётся Django автоматически, её Meta не
+        # расширить — индекс для страницы тега добавляем напрямую
+        migrations.RunSQL(
+            'CREATE INDEX question_tags_tag_question_idx ON main_question_tags (tag_id, question_id DESC)',
+            'DROP INDEX question_tags_tag_question_idx',
+        ),
+        migrations.AddIndex(
+            model_name='answer',
+            index=models.Index(fields=['question', '-rating', '-created_at'], name='answer_question_top_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='answer',
+            index=models.Index(fields=['author', 'rating'], name='answer_author_rating_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='profile',
+            index=models.Index(fields=['-rating'], name='profile_rating_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='question',
+            index=models.Index(fields=['-created_at', '-id'], name='question_new_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='question',
+            index=models.Index(fields=['author', 'rating'], name='question_author_rating_idx'),
+        ),
+    ]
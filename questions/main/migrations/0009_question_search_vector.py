@@ -0,0 +1,40 @@
+# Generated by Django 5.2.7 on 2026-10-18 10:02
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations
+
+# Вектор main/search.py на момент миграции: заголовок (A), текст (B) и
+# имена тегов (C), конфигурация 'russian' — SEARCH_CONFIG по умолчанию
+FILL_SEARCH_VECTORS = """
+    UPDATE main_question SET search_vector =
+        setweight(to_tsvector('russian'::regconfig, COALESCE(title, '')), 'A')
+        || setweight(to_tsvector('russian'::regconfig, COALESCE(content, '')), 'B')
+        || setweight(to_tsvector('russian'::regconfig, COALESCE((
+            SELECT string_agg(main_tag.name, ' ')
+            FROM main_question_tags
+            JOIN main_tag ON main_tag.id = main_question_tags.tag_id
+            WHERE main_question_tags.question_id = main_question.id
+        ), '')), 'C')
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0008_query_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='question',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        # Векторы до индекса: GIN строится один раз по готовым данным
+        migrations.RunSQL(FILL_SEARCH_VECTORS, migrations.RunSQL.noop),
+        migrations.AddIndex(
+            model_name='question',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='question_search_idx'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.7 on 2026-10-18 10:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0009_question_search_vector'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='answer',
+            index=models.Index(fields=['author', '-id'], name='answer_author_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='question',
+            index=models.Index(fields=['author', '-id'], name='question_author_recent_idx'),
+        ),
+    ]
@@ -1,46 +1,95 @@
-from django.db import models
+from contextvars import ContextVar
+
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
+from django.db import models, transaction
 from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
-from django.db.models.signals import post_save, post_delete
+from django.db.models.signals import post_save, post_delete, pre_delete, m2m_changed
 from django.dispatch import receiver
+from django.utils import timezone
 from django.db.models import Sum
 
+from . import typeahead
+from .ratings import add_profile_delta
+from .fragments import touch
+from .hot import hot_score_expression
+from .search import reindex_questions, search_vector_expression
+from .pages import expire_question, expire_answers
+from .counters import change_answers_count, change_questions_count, linked_tag_ids
+from .vote_buffer import change_rating
+from .profiles import expire_user_stats
+from .live import announce_answer
+
 
 class Profile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
     avatar = models.ImageField(upload_to='avatars/', null=True, blank=True)
     rating = models.IntegerField(default=0)  # Добавляем рейтинг
     answers_count = models.IntegerField(default=0)  # Добавляем количество ответов
+
+    class Meta:
+        indexes = [
+            # Лучшие пользователи в сайдбаре
+            models.Index(fields=['-rating'], name='profile_rating_idx'),
+        ]
     
     def __str__(self):
         return f"Profile of {self.user.username} - Rating: {self.rating}"
     
     def update_rating(self):
-        answers_rating = Answer.objects.filter(author=self.user).aggregate(
-            total=models.Sum('rating')
-        )['total'] or 0
-
-        self.answers_count = Answer.objects.filter(author=self.user).count()
-        
-        self.rating = answers_rating
-        self.save()
+        # Полный пересчёт; массово — manage.py fix_ratings
+        from .ratings import recompute_profiles
+        recompute_profiles([self.user_id])
+        self.refresh_from_db(fields=['rating', 'answers_count'])
         return self.rating
 
+class DirtyProfile(models.Model):
+    """Очередь профилей, чей рейтинг нужно пересчитать (PROFILE_RATING_MODE = 'deferred')"""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True)
+    marked_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    def __str__(self):
+        return f"Dirty profile of user {self.user_id}"
+
 class Tag(models.Model):
     name = models.CharField(max_length=50, unique=True)
+    questions_count = models.IntegerField(default=0)  # ведётся сигналами, см. main/counters.py
+    popularity = models.FloatField(default=0)  # manage.py refresh_tag_ranking
+
+    POPULAR_ORDERING = ('-popularity', '-questions_count')
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-popularity', '-questions_count'], name='tag_popularity_idx'),
+        ]
     
     def __str__(self):
         return self.name
 
-class QuestionManager(models.Manager):
+class QuestionQuerySet(models.QuerySet):
+    def cards(self):
+        """Всё для карточки в списке — автор, число ответов, теги — за два запроса на страницу"""
+        return self.select_related('author').prefetch_related(
+            models.Prefetch('tags', queryset=Tag.objects.only('id', 'name'))
+        )
+
+class QuestionManager(models.Manager.from_queryset(QuestionQuerySet)):
+    # Ключи сортировки для keyset-пагинации: последний ключ уникален
+    NEW_ORDERING = ('-created_at', '-id')
+    BEST_ORDERING = ('-hot_score', '-id')
+    # id выдаются по порядку создания, поэтому «новые по тегу» — это -id:
+    # такой порядок отдаёт индекс (tag_id, question_id) связующей таблицы
+    TAG_ORDERING = ('-id',)
+
     def new_questions(self):
-        return self.order_by('-created_at')
+        return self.order_by(*self.NEW_ORDERING)
     
     def best_questions(self):
-        return self.order_by('-rating')
+        return self.order_by(*self.BEST_ORDERING)
     
-    def questions_by_tag(self, tag_name):
-        return self.filter(tags__name=tag_name).order_by('-created_at')
+    def questions_by_tag(self, tag):
+        return self.filter(tags=tag).order_by(*self.TAG_ORDERING)
 
 class Question(models.Model):
     title = models.CharField(max_length=255)
@@ -50,15 +99,33 @@ class Question(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     rating = models.IntegerField(default=0)
+    answers_count = models.IntegerField(default=0)  # ведётся сигналами, см. main/counters.py
+    cache_version = models.PositiveIntegerField(default=0)  # ключ кэша фрагментов, см. main/fragments.py
+    hot_score = models.FloatField(default=0)  # см. main/hot.py
+    search_vector = SearchVectorField(null=True, editable=False)  # см. main/search.py
     
     objects = QuestionManager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-hot_score', '-id'], name='question_hot_idx'),
+            models.Index(fields=['-created_at', '-id'], name='question_new_idx'),
+            # Сумма рейтинга автора (profile_expressions) — только по индексу
+            models.Index(fields=['author', 'rating'], name='question_author_rating_idx'),
+            # Последние вопросы на странице профиля
+            models.Index(fields=['author', '-id'], name='question_author_recent_idx'),
+            GinIndex(fields=['search_vector'], name='question_search_idx'),
+        ]
     
     def __str__(self):
         return self.title
     
     def update_rating(self):
-        likes = QuestionLike.objects.filter(question=self)
-        self.rating = sum(like.value for like in likes)
+        # Полный пересчёт по таблице лайков — только для ремонта данных,
+        # обычные голоса применяются дельтой в QuestionLike.save()
+        self.rating = QuestionLike.objects.filter(question=self).aggregate(
+            total=Sum('value')
+        )['total'] or 0
         self.save()
     
     def get_absolute_url(self):
@@ -71,13 +138,25 @@ class Answer(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     is_correct = models.BooleanField(default=False)
     rating = models.IntegerField(default=0)
+    cache_version = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            # Ответы на странице вопроса
+            models.Index(fields=['question', '-rating', '-created_at'], name='answer_question_top_idx'),
+            models.Index(fields=['author', 'rating'], name='answer_author_rating_idx'),
+            models.Index(fields=['author', '-id'], name='answer_author_recent_idx'),
+        ]
     
     def __str__(self):
         return f"Answer to {self.question.title}"
     
     def update_rating(self):
-        likes = AnswerLike.objects.filter(answer=self)
-        self.rating = sum(like.value for like in likes)
+        # Полный пересчёт по таблице лайков — только для ремонта данных,
+        # обычные голоса применяются дельтой в AnswerLike.save()
+        self.rating = AnswerLike.objects.filter(answer=self).aggregate(
+            total=Sum('value')
+        )['total'] or 0
         self.save()
 
 class QuestionLike(models.Model):
@@ -95,8 +174,17 @@ class QuestionLike(models.Model):
     
     def save(self, *args, **kwargs):
         self.clean()
-        super().save(*args, **kwargs)
-        self.question.update_rating()
+        with transaction.atomic():
+            previous = _locked_vote_value(self)
+            # Сначала дельта, затем строка лайка: post_save-обработчики
+            # уже видят актуальный рейтинг; ошибка вставки откатит обе
+            self.apply_delta(self.value - previous)
+            super().save(*args, **kwargs)
+
+    def apply_delta(self, delta):
+        # Атомарный UPDATE ... SET rating = rating + delta без чтения лайков,
+        # профиль автора получает ту же дельту при коммите
+        change_rating('question', self.question_id, delta, self.question.author_id)
 
 class AnswerLike(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
@@ -113,59 +201,182 @@ class AnswerLike(models.Model):
     
     def save(self, *args, **kwargs):
         self.clean()
-        super().save(*args, **kwargs)
-        self.answer.update_rating()
+        with transaction.atomic():
+            previous = _locked_vote_value(self)
+            # Сначала дельта, затем строка лайка: post_save-обработчики
+            # уже видят актуальный рейтинг; ошибка вставки откатит обе
+            self.apply_delta(self.value - previous)
+            super().save(*args, **kwargs)
+
+    def apply_delta(self, delta):
+        # Атомарный UPDATE ... SET rating = rating + delta без чтения лайков,
+        # профиль автора получает ту же дельту при коммите
+        change_rating('answer', self.answer_id, delta, self.answer.author_id, self.answer.question_id)
+
 
+def _locked_vote_value(like):
+    """Текущее значение голоса в БД (0 для нового) с блокировкой строки"""
+    if like.pk is None:
+        return 0
+    value = type(like).objects.select_for_update().filter(
+        pk=like.pk
+    ).values_list('value', flat=True).first()
+    return value or 0
 
 
+# Вопросы и ответы, которые сейчас удаляет коллектор: (модель, pk).
+# Контекст, а не поток — как в db_router
+_deleting_posts = ContextVar('deleting_posts', default=frozenset())
+
+
+def _target_deleted(like):
+    """Цель лайка удаляется тем же delete(): каскад от вопроса, ответа или их автора"""
+    if isinstance(like, QuestionLike):
+        return (Question, like.question_id) in _deleting_posts.get()
+    return (Answer, like.answer_id) in _deleting_posts.get()
+
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def expire_tag_suggestions(sender, **kwargs):
+    typeahead.expire()
+
 @receiver(post_save, sender=User)
 def create_user_profile(sender, instance, created, **kwargs):
     if created:
         Profile.objects.create(user=instance)
 
+@receiver(post_delete, sender=QuestionLike)
+@receiver(post_delete, sender=AnswerLike)
+def revert_vote(sender, instance, **kwargs):
+    # Снятый голос откатывается той же дельтой. Если цель удаляется вместе
+    # с лайком, её рейтинг целиком спишет с автора discount_deleted_post
+    if _target_deleted(instance):
+        return
+    instance.apply_delta(-instance.value)
+
+@receiver(post_save, sender=Question)
+def index_question(sender, instance, created, **kwargs):
+    # Поисковый вектор — при создании и каждой правке, hot_score — при создании
+    changes = {'search_vector': search_vector_expression()}
+    if created:
+        changes['hot_score'] = hot_score_expression()
+    Question.objects.filter(pk=instance.pk).update(**changes)
+
 @receiver(post_save, sender=Question)
 @receiver(post_save, sender=Answer)
+def count_new_post(sender, instance, created, **kwargs):
+    # Рейтинг профиля ведётся дельтами, без агрегатов по всем постам автора
+    if created:
+        add_profile_delta(
+            instance.author_id,
+            rating=instance.rating,
+            answers_count=1 if sender is Answer else 0,
+        )
+
+@receiver(pre_delete, sender=Question)
+@receiver(pre_delete, sender=Answer)
+def lock_deleted_rating(sender, instance, origin=None, **kwargs):
+    # instance.delete() у объекта из памяти: голоса после его загрузки
+    # изменили рейтинг в БД, а списать с профиля надо именно его.
+    # Каскадные строки коллектор только что прочитал сам
+    if origin is instance:
+        instance.rating = sender.objects.select_for_update().filter(
+            pk=instance.pk
+        ).values_list('rating', flat=True).first() or 0
+
+@receiver(pre_delete, sender=Question)
+@receiver(pre_delete, sender=Answer)
+def remember_deleted_post(sender, instance, **kwargs):
+    # Коллектор шлёт pre_delete всем строкам до удаления лайков
+    _deleting_posts.set(_deleting_posts.get() | {(sender, instance.pk)})
+
 @receiver(post_delete, sender=Question)
 @receiver(post_delete, sender=Answer)
-@receiver(post_save, sender=QuestionLike)
-@receiver(post_save, sender=AnswerLike)
-@receiver(post_delete, sender=QuestionLike)
-@receiver(post_delete, sender=AnswerLike)
-def update_user_profile_rating(sender, instance, **kwargs):
-    from django.db.models import Sum
-    
-    # Определяем пользователя для обновления
-    if hasattr(instance, 'author'):
-        user = instance.author
-    elif isinstance(instance, QuestionLike):
-        user = instance.question.author
-    elif isinstance(instance, AnswerLike):
-        user = instance.answer.author
-    else:
-        return
-    
-    # Обновляем рейтинг
-    try:
-        profile = Profile.objects.get(user=user)
-        
-        # Считаем рейтинг вопросов
-        question_rating = Question.objects.filter(
-            author=user
-        ).aggregate(total=Sum('rating'))['total'] or 0
-        
-        # Считаем рейтинг ответов
-        answer_rating = Answer.objects.filter(
-            author=user
-        ).aggregate(total=Sum('rating'))['total'] or 0
-        
-        # Считаем количество ответов
-        answers_count = Answer.objects.filter(author=user).count()
-        
-        # Обновляем профиль
-        profile.rating = question_rating + answer_rating
-        profile.answers_count = answers_count
-        profile.save()
-        
-    except Profile.DoesNotExist:
-        # Создаем профиль, если его нет
-        Profile.objects.create(user=user)
\ No newline at end of file
+def discount_deleted_post(sender, instance, **kwargs):
+    _deleting_posts.set(_deleting_posts.get() - {(sender, instance.pk)})
+    add_profile_delta(
+        instance.author_id,
+        rating=-instance.rating,
+        answers_count=-1 if sender is Answer else 0,
+    )
+
+@receiver(post_save, sender=Question)
+@receiver(post_save, sender=Answer)
+def expire_edited_fragment(sender, instance, created, **kwargs):
+    # Правка через save(): версия в памяти могла устареть, поэтому F-UPDATE
+    if not created:
+        touch(sender, [instance.pk])
+    if sender is Question:
+        expire_question(instance.pk)
+    elif not created:
+        expire_answers(instance.question_id)
+
+@receiver(post_save, sender=Question)
+@receiver(post_save, sender=Answer)
+@receiver(post_delete, sender=Question)
+@receiver(post_delete, sender=Answer)
+def expire_author_stats(sender, instance, **kwargs):
+    # Новый, удалённый или принятый пост меняет счётчики профиля автора
+    expire_user_stats([instance.author_id])
+
+@receiver(post_save, sender=Answer)
+def count_answer(sender, instance, created, **kwargs):
+    if created:
+        change_answers_count(instance.question_id, 1)
+        announce_answer(instance)
+
+@receiver(post_delete, sender=Answer)
+def discount_answer(sender, instance, **kwargs):
+    change_answers_count(instance.question_id, -1)
+
+@receiver(m2m_changed, sender=Question.tags.through)
+def count_tagged_questions(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'post_add' and pk_set:
+        if reverse:
+            change_questions_count([instance.pk], len(pk_set))
+            touch(Question, pk_set)
+            reindex_questions(pk_set)
+            for question_id in pk_set:
+                expire_question(question_id)
+        else:
+            change_questions_count(pk_set, 1)
+            touch(Question, [instance.pk])
+            reindex_questions([instance.pk])
+            expire_question(instance.pk)
+            expire_user_stats([instance.author_id])
+
+    # remove() присылает запрошенные id, а не реально связанные —
+    # запоминаем настоящие связи до удаления
+    elif action in ('pre_remove', 'pre_clear'):
+        if reverse:
+            links = sender.objects.filter(tag_id=instance.pk)
+            if pk_set is not None:
+                links = links.filter(question_id__in=pk_set)
+            question_ids = list(links.values_list('question_id', flat=True))
+            instance._unlinked_tags = ([instance.pk], -len(question_ids), question_ids)
+        else:
+            instance._unlinked_tags = (linked_tag_ids(instance.pk, pk_set), -1, [instance.pk])
+
+    elif action in ('post_remove', 'post_clear'):
+        tag_ids, delta, question_ids = instance.__dict__.pop('_unlinked_tags', ([], 0, []))
+        if tag_ids and delta:
+            change_questions_count(tag_ids, delta)
+            touch(Question, question_ids)
+            reindex_questions(question_ids)
+            for question_id in question_ids:
+                expire_question(question_id, extra_tag_ids=tag_ids)
+            if not reverse:
+                expire_user_stats([instance.author_id])
+
+@receiver(pre_delete, sender=Question)
+def remember_question_tags(sender, instance, **kwargs):
+    # Связи с тегами удаляются каскадом без m2m_changed
+    instance._deleted_tags = linked_tag_ids(instance.pk)
+
+@receiver(post_delete, sender=Question)
+def discount_question_tags(sender, instance, **kwargs):
+    tag_ids = instance.__dict__.pop('_deleted_tags', [])
+    change_questions_count(tag_ids, -1)
+    expire_question(instance.pk, extra_tag_ids=tag_ids)
@@ -0,0 +1,201 @@
+"""Полностраничный кэш для анонимных читателей.
+
+Страница зависит от групп: 'new', 'hot', 'tag:<имя>', 'question:<id>'
+(и общей 'all'). Ключ страницы содержит текущие версии её групп, так что
+сброс — это инкремент версии: изменённый вопрос сбрасывает свою страницу
+и списки, где видна его карточка, голос за ответ — только страницу
+вопроса. Версии читаются одним get_many, поэтому попадание не делает ни
+одного запроса к БД.
+
+Кэшируются только GET-ответы 200 без cookie сессии, без Set-Cookie и без
+CSRF-токена в разметке.
+
+Сайдбар (main/sidebar.py) в кэш страницы не попадает: он меняется от
+голосов за чужие посты и сбрасывается своими событиями. Перед записью
+его разметка между метками SIDEBAR_START/SIDEBAR_END вырезается, а при
+попадании вставляется свежая из кэша сайдбара.
+
+С репликами (main/db_router.py) сброс группы ещё и помечается на
+REPLICA_STICKY_SECONDS: пока метка жива, страницы группы рендерятся с
+primary — иначе отставшая реплика положила бы в кэш страницу без только
+что появившегося ответа до конца PAGE_CACHE_TTL.
+"""
+import copy
+import hashlib
+import time
+from functools import partial, wraps
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q
+from django.template.loader import render_to_string
+
+from . import db_router, fragments, sidebar
+
+GROUP_KEY = 'page:group:'
+PURGED_KEY = 'page:purged:'
+
+# Метки стоят в includes/sidebar.html
+SIDEBAR_START = b'<!--sidebar-->'
+SIDEBAR_END = b'<!--/sidebar-->'
+SIDEBAR_TEMPLATE = 'includes/sidebar.html'
+
+
+def _versions(groups):
+    """Версии групп и признак недавнего сброса одной из них — одним get_many"""
+    keys = [GROUP_KEY + group for group in groups]
+    purged_keys = [PURGED_KEY + group for group in groups] if db_router.replicas_enabled() else []
+    versions = cache.get_many(keys + purged_keys)
+    for key in keys:
+        if key not in versions:
+            # Начальная версия уникальна: после вытеснения счётчика
+            # старые ключи страниц не оживут
+            cache.add(key, time.time_ns(), None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys], any(key in versions for key in purged_keys)
+
+
+def purge(groups):
+    for group in groups:
+        try:
+            cache.incr(GROUP_KEY + group)
+        except ValueError:
+            pass  # версии ещё нет — и страниц с ней тоже
+    if db_router.replicas_enabled():
+        cache.set_many({PURGED_KEY + group: 1 for group in groups}, db_router.sticky_seconds())
+
+
+def purge_all():
+    """Сбросить все страницы и фрагменты — после массовых переписываний базы"""
+    purge(['all'])
+    fragments.expire_all()
+
+
+def _purge_question(question_id, extra_tag_ids):
+    from .models import Tag
+    # Карточка вопроса есть в обоих списках и на страницах его тегов
+    names = Tag.objects.filter(Q(question=question_id) | Q(pk__in=extra_tag_ids)).values_list('name', flat=True)
+    purge(['new', 'hot', f'question:{question_id}', *(f'tag:{name}' for name in set(names))])
+
+
+def expire_question(question_id, extra_tag_ids=()):
+    """После коммита сбросить страницы, где показан вопрос (extra_tag_ids — отвязанные теги)"""
+    transaction.on_commit(partial(_purge_question, question_id, list(extra_tag_ids)))
+
+
+def expire_answers(question_id):
+    """После коммита сбросить страницу вопроса — списки ответы не показывают"""
+    transaction.on_commit(partial(purge, [f'question:{question_id}']))
+
+
+def _cacheable(request):
+    return (
+        getattr(settings, 'PAGE_CACHE_TTL', 300) > 0
+        and request.method in ('GET', 'HEAD')
+        and settings.SESSION_COOKIE_NAME not in request.COOKIES
+    )
+
+
+def _page_key(request, page_groups):
+    """Ключ страницы и признак «рендерить с primary»"""
+    versions, purged = _versions(page_groups)
+    path = hashlib.md5(request.get_full_path().encode()).hexdigest()
+    return f'page:{path}:{".".join(str(version) for version in versions)}', purged
+
+
+def _storable(request, response):
+    return (
+        response.status_code == 200
+        and not response.cookies
+        and not request.META.get('CSRF_COOKIE_USED')
+    )
+
+
+def _without_sidebar(response):
+    """Копия ответа для кэша: на месте сайдбара — пустые метки"""
+    start = response.content.find(SIDEBAR_START)
+    end = response.content.find(SIDEBAR_END, start)
+    if start == -1 or end == -1:
+        return response
+    stored = copy.copy(response)
+    stored.content = response.content[:start] + SIDEBAR_START + response.content[end:]
+    return stored
+
+
+def _hole(response):
+    return response.content.find(SIDEBAR_START + SIDEBAR_END)
+
+
+def _fill(response, position, html):
+    # Отрендеренный шаблон сам обрамлён метками — берём то, что между ними
+    html = html.encode()
+    inner = html[html.find(SIDEBAR_START) + len(SIDEBAR_START):html.rfind(SIDEBAR_END)]
+    cut = position + len(SIDEBAR_START)
+    response.content = response.content[:cut] + inner + response.content[cut:]
+    return response
+
+
+def _with_sidebar(response):
+    position = _hole(response)
+    if position == -1:
+        return response
+    html = render_to_string(SIDEBAR_TEMPLATE, {
+        'popular_tags': sidebar.popular_tags(), 'best_users': sidebar.best_users(),
+    })
+    return _fill(response, position, html)
+
+
+async def _awith_sidebar(response):
+    position = _hole(response)
+    if position == -1:
+        return response
+    html = render_to_string(SIDEBAR_TEMPLATE, {
+        'popular_tags': await sidebar.apopular_tags(), 'best_users': await sidebar.abest_users(),
+    })
+    return _fill(response, position, html)
+
+
+def anonymous_page_cache(groups):
+    """Декоратор вьюхи (обычной или async); groups(request, **kwargs) — группы, от которых зависит страница"""
+    def decorator(view):
+        if iscoroutinefunction(view):
+            @wraps(view)
+            async def async_wrapper(request, *args, **kwargs):
+                if not _cacheable(request):
+                    return await view(request, *args, **kwargs)
+
+                key, purged = await sync_to_async(_page_key)(request, ['all', *groups(request, **kwargs)])
+                response = await cache.aget(key)
+                if response is not None:
+                    response['X-Page-Cache'] = 'hit'
+                    return await _awith_sidebar(response)
+
+                with db_router.use_primary(purged):
+                    response = await view(request, *args, **kwargs)
+                if _storable(request, response):
+                    await cache.aset(key, _without_sidebar(response), settings.PAGE_CACHE_TTL)
+                    response['X-Page-Cache'] = 'miss'
+                return response
+            return async_wrapper
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if not _cacheable(request):
+                return view(request, *args, **kwargs)
+
+            key, purged = _page_key(request, ['all', *groups(request, **kwargs)])
+            response = cache.get(key)
+            if response is not None:
+                response['X-Page-Cache'] = 'hit'
+                return _with_sidebar(response)
+
+            with db_router.use_primary(purged):
+                response = view(request, *args, **kwargs)
+            if _storable(request, response):
+                cache.set(key, _without_sidebar(response), settings.PAGE_CACHE_TTL)
+                response['X-Page-Cache'] = 'miss'
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,124 @@
+"""Keyset-пагинация (по курсору) для списков вопросов.
+
+Вместо OFFSET n и COUNT(*) страница выбирается условием по ключу
+сортировки последней показанной строки, например
+(created_at, id) < (:created_at, :id) — стоимость не зависит от глубины,
+а вставки новых вопросов не сдвигают уже открытые страницы.
+"""
+import base64
+import json
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Q
+
+
+class KeysetPage:
+    is_keyset = True
+
+    def __init__(self, object_list, keys, has_next, has_previous):
+        self.object_list = object_list
+        self.keys = keys
+        self.has_next = has_next
+        self.has_previous = has_previous
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_other_pages(self):
+        return self.has_next or self.has_previous
+
+    @property
+    def next_cursor(self):
+        # Пустая страница (устаревший курсор за краем списка) — курсоров нет
+        if not (self.has_next and self.object_list):
+            return None
+        return encode_cursor('next', self.object_list[-1], self.keys)
+
+    @property
+    def previous_cursor(self):
+        if not (self.has_previous and self.object_list):
+            return None
+        return encode_cursor('prev', self.object_list[0], self.keys)
+
+
+def encode_cursor(direction, obj, keys):
+    values = [getattr(obj, key.lstrip('-')) for key in keys]
+    payload = json.dumps([direction] + [v.isoformat() if hasattr(v, 'isoformat') else v for v in values])
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, model, keys):
+    """(направление, значения ключей) или None для битого курсора"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        direction, *raw = json.loads(base64.urlsafe_b64decode(padded))
+        if direction not in ('next', 'prev') or len(raw) != len(keys):
+            return None
+        values = [_to_python(model, key.lstrip('-'), v) for key, v in zip(keys, raw)]
+        return direction, values
+    except (ValueError, TypeError, ValidationError):
+        return None
+
+
+def _to_python(model, name, value):
+    try:
+        field = model._meta.get_field(name)
+    except FieldDoesNotExist:
+        # Ключ — аннотация (например, rank поиска): число из JSON как есть
+        if not isinstance(value, (int, float)):
+            raise ValueError(name)
+        return value
+    return field.to_python(value)
+
+
+def _after(keys, values, reverse=False):
+    """Условие «строго после курсора» в порядке keys (или до него при reverse)"""
+    condition = Q()
+    equal = Q()
+    for key, value in zip(keys, values):
+        name = key.lstrip('-')
+        descending = key.startswith('-') != reverse
+        condition |= equal & Q(**{f'{name}__{"lt" if descending else "gt"}': value})
+        equal &= Q(**{name: value})
+    return condition
+
+
+def _keyset_query(queryset, keys, cursor):
+    """(срез queryset для страницы, направление) — строк на одну больше per_page"""
+    decoded = decode_cursor(cursor, queryset.model, keys) if cursor else None
+    if decoded is None:
+        return queryset.order_by(*keys), None
+    direction, values = decoded
+    if direction == 'next':
+        return queryset.filter(_after(keys, values)).order_by(*keys), direction
+    reversed_keys = [key[1:] if key.startswith('-') else f'-{key}' for key in keys]
+    return queryset.filter(_after(keys, values, reverse=True)).order_by(*reversed_keys), direction
+
+
+def _keyset_result(rows, keys, direction, per_page):
+    if not rows:
+        # Курсор старше последней строки или новее первой: ссылок дальше нет
+        return KeysetPage([], keys, False, False)
+    if direction is None:
+        return KeysetPage(rows[:per_page], keys, len(rows) > per_page, False)
+    if direction == 'next':
+        return KeysetPage(rows[:per_page], keys, len(rows) > per_page, True)
+    return KeysetPage(rows[:per_page][::-1], keys, True, len(rows) > per_page)
+
+
+def keyset_page(queryset, keys, cursor=None, per_page=10):
+    """Страница queryset, упорядоченного по keys (последний ключ — уникальный)"""
+    query, direction = _keyset_query(queryset, keys, cursor)
+    return _keyset_result(list(query[:per_page + 1]), keys, direction, per_page)
+
+
+async def akeyset_page(queryset, keys, cursor=None, per_page=10):
+    """То же для async-вьюх: строки читаются через async ORM"""
+    query, direction = _keyset_query(queryset, keys, cursor)
+    return _keyset_result([obj async for obj in query[:per_page + 1]], keys, direction, per_page)
@@ -0,0 +1,67 @@
+"""Статистика пользователя для страницы профиля.
+
+Все числа — один запрос: рейтинг и число ответов берутся из Profile
+(их ведут main/ratings.py), число вопросов, принятых ответов и топ тегов —
+коррелированными подзапросами по индексам автора. Результат лежит в кэше
+PROFILE_STATS_TTL секунд и сбрасывается после коммита любой активности
+пользователя: поста, правки, смены тегов его вопроса, изменения рейтинга.
+"""
+from functools import partial
+
+from django.conf import settings
+from django.contrib.postgres.expressions import ArraySubquery
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, OuterRef
+from django.db.models.functions import Coalesce
+
+STATS_KEY = 'profile:stats:'
+TOP_TAGS_LIMIT = 5
+
+
+def _load_stats(user_id):
+    from django.contrib.auth.models import User
+    from .models import Answer, Question
+    from .ratings import grouped
+    top_tags = (
+        Question.tags.through.objects.filter(question__author_id=OuterRef('pk'))
+        .values('tag__name')
+        .annotate(uses=Count('id'))
+        .order_by('-uses', 'tag__name')
+        .values('tag__name')[:TOP_TAGS_LIMIT]
+    )
+    return (
+        User.objects.filter(pk=user_id)
+        .annotate(
+            questions_count=grouped(Question, 'author_id', 'pk', Count('id')),
+            accepted_count=grouped(Answer.objects.filter(is_correct=True), 'author_id', 'pk', Count('id')),
+            top_tags=ArraySubquery(top_tags),
+        )
+        .values(
+            'date_joined', 'questions_count', 'accepted_count', 'top_tags',
+            rating=Coalesce('profile__rating', 0), answers_count=Coalesce('profile__answers_count', 0),
+        )
+        .first()
+    )
+
+
+def user_stats(user_id):
+    """Словарь статистики пользователя (None, если его нет)"""
+    key = f'{STATS_KEY}{user_id}'
+    stats = cache.get(key)
+    if stats is None:
+        stats = _load_stats(user_id)
+        if stats is not None:
+            cache.set(key, stats, getattr(settings, 'PROFILE_STATS_TTL', 300))
+    return stats
+
+
+def _delete(user_ids):
+    cache.delete_many([f'{STATS_KEY}{user_id}' for user_id in user_ids])
+
+
+def expire_user_stats(user_ids):
+    """После коммита сбросить кэш статистики пользователей"""
+    user_ids = [user_id for user_id in user_ids if user_id]
+    if user_ids:
+        transaction.on_commit(partial(_delete, user_ids))
@@ -0,0 +1,241 @@
+"""Инкрементальное обновление Profile.rating и Profile.answers_count.
+
+Обработчики сигналов не пересчитывают профиль автора агрегатами, а
+передают сюда дельту. Дельты копятся до коммита транзакции, суммируются
+по пользователю и записываются одним UPDATE на профиль. Если транзакция
+или точка сохранения откатывается, её дельты пропадают вместе с ней.
+
+При PROFILE_RATING_MODE = 'deferred' профиль не обновляется вовсе:
+пользователь попадает в очередь DirtyProfile, а команда flush_profiles
+пересчитывает очередь пачками раз в несколько секунд.
+"""
+import threading
+import time
+from collections import defaultdict
+from functools import partial
+
+from django.conf import settings
+from django.core.signals import request_finished
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import Count, F, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import sidebar
+from .profiles import expire_user_stats
+from .hot import hot_score_expression
+
+
+_local = threading.local()
+
+
+class _Batch:
+    """Дельты соединения, ещё не записанные в профили"""
+
+    def __init__(self):
+        self.pending = defaultdict(lambda: [0, 0])
+        self.registered = 0  # номер последней запланированной дельты
+
+    def take(self):
+        pending, self.pending = self.pending, defaultdict(lambda: [0, 0])
+        return pending
+
+
+def _batch(using):
+    batches = _local.__dict__.setdefault('batches', {})
+    if using not in batches:
+        batches[using] = _Batch()
+    return batches[using]
+
+
+def add_profile_delta(user_id, rating=0, answers_count=0, using=DEFAULT_DB_ALIAS):
+    """Запланировать изменение профиля пользователя на момент коммита"""
+    if not user_id or not (rating or answers_count):
+        return
+    batch = _batch(using)
+    batch.registered += 1
+    # Каждая дельта — отдельный on_commit: Django сам выбросит её при
+    # откате точки сохранения. Вне транзакции хук выполнится сразу
+    transaction.on_commit(
+        partial(_stage, batch, batch.registered, user_id, rating, answers_count, using),
+        using=using,
+    )
+
+
+def _stage(batch, number, user_id, rating, answers_count, using):
+    delta = batch.pending[user_id]
+    delta[0] += rating
+    delta[1] += answers_count
+    # Хуки выполняются в порядке регистрации, так что хук последней дельты
+    # транзакции идёт после всех сложений — он и пишет. Если последние
+    # дельты откатились с точкой сохранения, остальные запишет следующая
+    # запись этого соединения или конец запроса (flush_leftover_deltas)
+    if number == batch.registered:
+        flush_profile_deltas(using)
+
+
+@receiver(request_finished)
+def flush_leftover_deltas(sender, **kwargs):
+    for using, batch in list(getattr(_local, 'batches', {}).items()):
+        if batch.pending and not transaction.get_connection(using).in_atomic_block:
+            flush_profile_deltas(using)
+
+
+def flush_profile_deltas(using=DEFAULT_DB_ALIAS):
+    """Записать накопленные дельты: один UPDATE на каждый затронутый профиль"""
+    from .models import Profile
+
+    pending = _batch(using).take()
+    if not pending:
+        return
+
+    if deferred_mode():
+        mark_dirty(pending, using=using)
+        return
+
+    with transaction.atomic(using=using):
+        # Фиксированный порядок блокировок исключает взаимные дедлоки
+        for user_id in sorted(pending):
+            rating, answers_count = pending[user_id]
+            if rating or answers_count:
+                Profile.objects.using(using).filter(user_id=user_id).update(
+                    rating=F('rating') + rating,
+                    answers_count=F('answers_count') + answers_count,
+                )
+    sidebar.profiles_changed(pending, raised=[user_id for user_id, (rating, _) in pending.items() if rating > 0])
+    expire_user_stats(pending)
+
+
+def deferred_mode():
+    return getattr(settings, 'PROFILE_RATING_MODE', 'delta') == 'deferred'
+
+
+def mark_dirty(user_ids, using=DEFAULT_DB_ALIAS):
+    """Поставить профили в очередь на пересчёт; повторная отметка ничего не стоит"""
+    from .models import DirtyProfile
+
+    DirtyProfile.objects.using(using).bulk_create(
+        [DirtyProfile(user_id=user_id) for user_id in sorted(user_ids)],
+        ignore_conflicts=True,
+    )
+
+
+def grouped(source, key, outer, aggregate, output_field=None):
+    """Коррелированный подзапрос: агрегат по строкам source (модель или queryset), где key = outer"""
+    rows = source._default_manager.all() if isinstance(source, type) else source
+    return Coalesce(
+        Subquery(
+            rows.filter(**{key: OuterRef(outer)})
+            .order_by()
+            .values(key)
+            .annotate(value=aggregate)
+            .values('value')
+        ),
+        0,
+        output_field=output_field,
+    )
+
+
+def question_rating_expressions():
+    from .models import QuestionLike
+    rating = grouped(QuestionLike, 'question_id', 'pk', Sum('value'))
+    return {'rating': rating, 'hot_score': hot_score_expression(rating=rating)}
+
+
+def answer_rating_expressions():
+    from .models import AnswerLike
+    return {'rating': grouped(AnswerLike, 'answer_id', 'pk', Sum('value'))}
+
+
+def profile_expressions():
+    from .models import Answer, Question
+    return {
+        'rating': grouped(Question, 'author_id', 'user_id', Sum('rating'))
+        + grouped(Answer, 'author_id', 'user_id', Sum('rating')),
+        'answers_count': grouped(Answer, 'author_id', 'user_id', Count('id')),
+    }
+
+
+def rebuild(queryset, expressions, dry_run=False):
+    """Привести денормализованные поля queryset к значениям expressions.
+
+    Перезаписываются только расходящиеся строки — одним UPDATE на весь
+    queryset. Возвращает число таких строк; при dry_run только считает их.
+    """
+    computed = {f'computed_{name}': expression for name, expression in expressions.items()}
+    drift = Q()
+    for name in expressions:
+        drift |= ~Q(**{name: F(f'computed_{name}')})
+    drifted = queryset.annotate(**computed).filter(drift)
+    if dry_run:
+        return drifted.count()
+    changes = dict(expressions)
+    if any(field.name == 'cache_version' for field in queryset.model._meta.fields):
+        # Исправленная строка должна перерисоваться, см. main/fragments.py
+        changes['cache_version'] = F('cache_version') + 1
+    return queryset.filter(pk__in=drifted.values('pk')).update(**changes)
+
+
+def recompute_profiles(user_ids, using=DEFAULT_DB_ALIAS):
+    """Пересчитать rating и answers_count профилей одним UPDATE с подзапросами"""
+    from .models import Profile
+
+    changed = rebuild(
+        Profile.objects.using(using).filter(user_id__in=user_ids),
+        profile_expressions(),
+    )
+    if changed:
+        transaction.on_commit(partial(sidebar.profiles_changed, user_ids, raised=user_ids), using=using)
+        expire_user_stats(user_ids)
+    return changed
+
+
+def flush_dirty_profiles(batch_size=None, using=DEFAULT_DB_ALIAS):
+    """Пересчитать одну пачку из очереди, самые старые отметки первыми.
+
+    Строки очереди блокируются с SKIP LOCKED, так что несколько
+    обработчиков не мешают друг другу. Возвращает число пересчитанных профилей.
+    """
+    from .models import DirtyProfile
+
+    batch_size = batch_size or getattr(settings, 'PROFILE_FLUSH_BATCH_SIZE', 1000)
+    with transaction.atomic(using=using):
+        user_ids = list(
+            DirtyProfile.objects.using(using)
+            .select_for_update(skip_locked=True)
+            .order_by('marked_at')
+            .values_list('user_id', flat=True)[:batch_size]
+        )
+        if not user_ids:
+            return 0
+        # Отметка, поставленная после этого момента, дождётся коммита и
+        # вставится заново — изменение не потеряется
+        DirtyProfile.objects.using(using).filter(user_id__in=user_ids).delete()
+        recompute_profiles(user_ids, using=using)
+    return len(user_ids)
+
+
+def dirty_queue_stats(using=DEFAULT_DB_ALIAS):
+    """Метрики очереди: глубина и возраст самой старой отметки в секундах"""
+    from .models import DirtyProfile
+
+    queue = DirtyProfile.objects.using(using)
+    oldest = queue.order_by('marked_at').values_list('marked_at', flat=True).first()
+    return {
+        'depth': queue.count(),
+        'oldest_age': (timezone.now() - oldest).total_seconds() if oldest else 0.0,
+    }
+
+
+def drain_dirty_profiles(batch_size=None, using=DEFAULT_DB_ALIAS):
+    """Обработать всю очередь; возвращает (профилей, секунд)"""
+    batch_size = batch_size or getattr(settings, 'PROFILE_FLUSH_BATCH_SIZE', 1000)
+    started = time.monotonic()
+    total = 0
+    while True:
+        flushed = flush_dirty_profiles(batch_size, using=using)
+        total += flushed
+        # Неполная пачка — очередь пуста (или остаток держит другой обработчик)
+        if flushed < batch_size:
+            return total, time.monotonic() - started
@@ -0,0 +1,66 @@
+"""Полнотекстовый поиск по вопросам (PostgreSQL).
+
+Question.search_vector — взвешенный tsvector: заголовок (A), текст (B) и
+имена тегов (C), под ним GIN-индекс. Вектор пересчитывается одним UPDATE
+при создании и правке вопроса и при смене его тегов, без периодической
+переиндексации. Выдача упорядочена по ts_rank и листается курсором.
+"""
+from django.conf import settings
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import SearchHeadline, SearchQuery, SearchRank, SearchVector
+from django.db.models import F, FloatField, OuterRef, Subquery, TextField, Value
+from django.db.models.functions import Cast, Coalesce
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+# Ключи сортировки выдачи для keyset-пагинации
+SEARCH_ORDERING = ('-rank', '-id')
+
+# Маркеры подсветки: ts_headline не экранирует текст, поэтому сначала
+# экранируем, а потом заменяем маркеры на теги
+_START, _STOP = '\x02', '\x03'
+
+
+def search_vector_expression():
+    from .models import Question
+    config = settings.SEARCH_CONFIG
+    tag_names = Subquery(
+        Question.tags.through.objects.filter(question_id=OuterRef('pk'))
+        .order_by()
+        .values('question_id')
+        .annotate(names=StringAgg('tag__name', ' '))
+        .values('names')
+    )
+    return (
+        SearchVector('title', config=config, weight='A')
+        + SearchVector('content', config=config, weight='B')
+        + SearchVector(Coalesce(tag_names, Value(''), output_field=TextField()), config=config, weight='C')
+    )
+
+
+def reindex_questions(question_ids):
+    from .models import Question
+    if question_ids:
+        Question.objects.filter(pk__in=question_ids).update(search_vector=search_vector_expression())
+
+
+def search_questions(text):
+    """Вопросы, подходящие под запрос, с rank и подсвеченным фрагментом headline"""
+    from .models import Question
+    config = settings.SEARCH_CONFIG
+    query = SearchQuery(text, config=config, search_type='websearch')
+    return (
+        Question.objects.filter(search_vector=query)
+        .annotate(
+            # ts_rank возвращает real: в double, чтобы курсор сравнивался точно
+            rank=Cast(SearchRank(F('search_vector'), query), FloatField()),
+            headline=SearchHeadline(
+                'content', query, config=config,
+                start_sel=_START, stop_sel=_STOP, max_words=35, min_words=15,
+            ),
+        )
+    )
+
+
+def highlight(headline):
+    return mark_safe(escape(headline).replace(_START, '<mark>').replace(_STOP, '</mark>'))
@@ -0,0 +1,105 @@
+"""Данные сайдбара: популярные теги и лучшие пользователи.
+
+Оба списка хранятся в общем кэше SIDEBAR_CACHE_TTL секунд и считаются
+только когда шаблон действительно к ним обращается. Кэш сбрасывается
+явно, если изменился участник топа или кто-то мог в него войти; пересчёты
+целиком (refresh_tag_ranking, fix_ratings, fill_db) сбрасывают его всегда.
+"""
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+
+TAGS_KEY = 'sidebar:popular_tags'
+USERS_KEY = 'sidebar:best_users'
+TAGS_LIMIT = 10
+USERS_LIMIT = 5
+
+
+def _board(key, load):
+    board = cache.get(key)
+    if board is None:
+        board = load()
+        cache.set(key, board, getattr(settings, 'SIDEBAR_CACHE_TTL', 60))
+    return board
+
+
+async def _aboard(key, load):
+    board = await cache.aget(key)
+    if board is None:
+        board = await sync_to_async(load)()
+        await cache.aset(key, board, getattr(settings, 'SIDEBAR_CACHE_TTL', 60))
+    return board
+
+
+def _load_tags():
+    from .models import Tag
+    tags = list(Tag.objects.only('name', 'popularity').order_by(*Tag.POPULAR_ORDERING)[:TAGS_LIMIT])
+    return {
+        'items': tags,
+        'ids': {tag.pk for tag in tags},
+        'floor': tags[-1].popularity if len(tags) == TAGS_LIMIT else None,
+    }
+
+
+def _load_users():
+    from .models import Profile
+    profiles = Profile.objects.select_related('user').order_by('-rating')[:USERS_LIMIT]
+    users = [
+        {
+            'id': profile.user.id,
+            'username': profile.user.username,
+            'rating': profile.rating,
+            'answers_count': profile.answers_count,
+            'avatar': profile.avatar.name,
+        }
+        for profile in profiles
+    ]
+    return {
+        'items': users,
+        'ids': {user['id'] for user in users},
+        'floor': users[-1]['rating'] if len(users) == USERS_LIMIT else None,
+    }
+
+
+def popular_tags():
+    return _board(TAGS_KEY, _load_tags)['items']
+
+
+def best_users():
+    return _board(USERS_KEY, _load_users)['items']
+
+
+async def apopular_tags():
+    return (await _aboard(TAGS_KEY, _load_tags))['items']
+
+
+async def abest_users():
+    return (await _aboard(USERS_KEY, _load_users))['items']
+
+
+def _touch(key, changed, raised, entrants):
+    """Сбросить топ, если изменился его участник или кто-то из raised мог в него войти"""
+    board = cache.get(key)
+    if board is None:
+        return
+    outsiders = set(raised) - board['ids']
+    if not board['ids'].isdisjoint(changed) or (
+        outsiders and (board['floor'] is None or entrants(outsiders, board['floor']))
+    ):
+        cache.delete(key)
+
+
+def tags_changed(tag_ids, raised=()):
+    from .models import Tag
+    _touch(TAGS_KEY, tag_ids, raised,
+           lambda ids, floor: Tag.objects.filter(pk__in=ids, popularity__gte=floor).exists())
+
+
+def profiles_changed(user_ids, raised=()):
+    from .models import Profile
+    _touch(USERS_KEY, user_ids, raised,
+           lambda ids, floor: Profile.objects.filter(user_id__in=ids, rating__gte=floor).exists())
+
+
+def invalidate_sidebar():
+    cache.delete_many([TAGS_KEY, USERS_KEY])
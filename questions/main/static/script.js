@@ -0,0 +1,86 @@
+// Подсказки тегов: последний тег в поле (через запятую) дополняется из /tags/suggest/
+document.querySelectorAll('[data-tag-suggest]').forEach((input) => {
+    const list = document.getElementById(input.getAttribute('list'));
+    let timer = null;
+    let controller = null;
+
+    input.addEventListener('input', () => {
+        clearTimeout(timer);
+        timer = setTimeout(() => {
+            const parts = input.value.split(',');
+            const last = parts.pop().trim();
+            const head = parts.map((part) => part.trim()).filter(Boolean);
+            if (controller) controller.abort();
+            controller = new AbortController();
+            fetch(`${input.dataset.tagSuggest}?q=${encodeURIComponent(last)}`, {signal: controller.signal})
+                .then((response) => response.json())
+                .then((data) => {
+                    list.replaceChildren(...data.tags.map((tag) => {
+                        const option = document.createElement('option');
+                        option.value = [...head, tag.name].join(', ');
+                        option.label = `${tag.name} (${tag.questions_count})`;
+                        return option;
+                    }));
+                })
+                .catch(() => {});
+        }, 100);
+    });
+});
+
+// Голосование ▲/▼: повторный клик тем же знаком снимает голос
+document.addEventListener('click', (event) => {
+    const button = event.target.closest('[data-vote]');
+    if (!button) return;
+    const box = button.closest('[data-vote-id]');
+    const token = document.querySelector('meta[name="csrf-token"]');
+    fetch(document.querySelector('meta[name="vote-url"]').content, {
+        method: 'POST',
+        headers: {'Content-Type': 'application/json', 'X-CSRFToken': token ? token.content : ''},
+        body: JSON.stringify({kind: box.dataset.voteKind, id: box.dataset.voteId, value: Number(button.dataset.vote)}),
+    })
+        .then((response) => {
+            // Не JSON — HTML-страница 403 от CSRF: токен на странице устарел, берём свежий
+            if (!(response.headers.get('Content-Type') || '').startsWith('application/json')) {
+                window.location.reload();
+                return null;
+            }
+            return response.json().then((data) => ({status: response.status, data}));
+        })
+        .then((result) => {
+            if (!result) return;
+            const {status, data} = result;
+            if (status === 401) {
+                window.location = `${data.login_url}?next=${encodeURIComponent(window.location.pathname)}`;
+                return;
+            }
+            if (status !== 200) return;
+            box.querySelector('.vote-count').textContent = data.rating;
+            box.querySelectorAll('[data-vote]').forEach((other) => {
+                other.classList.toggle('active', Number(other.dataset.vote) === data.vote);
+            });
+        })
+        .catch(() => {});
+});
+
+// Живая страница вопроса: новые ответы и рейтинги по SSE
+document.querySelectorAll('[data-live-answers]').forEach((box) => {
+    const source = new EventSource(box.dataset.liveAnswers);
+    source.addEventListener('vote', (event) => {
+        const data = JSON.parse(event.data);
+        const count = document.querySelector(
+            `[data-vote-kind="${data.kind}"][data-vote-id="${data.id}"] .vote-count`);
+        if (count) count.textContent = data.rating;
+    });
+    source.addEventListener('answer', (event) => {
+        const data = JSON.parse(event.data);
+        const card = document.createElement('div');
+        card.className = 'alert alert-info';
+        const author = document.createElement('strong');
+        author.textContent = `${data.author}: `;
+        card.append(author, data.content);
+        box.prepend(card);
+        const counter = document.querySelector('[data-answers-count]');
+        counter.textContent = Number(counter.textContent) + 1;
+    });
+    source.addEventListener('resync', () => window.location.reload());
+});
@@ -0,0 +1,53 @@
+import time
+
+from django import template
+
+from main import fragments
+
+register = template.Library()
+
+
+class FragmentNode(template.Node):
+    def __init__(self, nodelist, name, obj, vary_on):
+        self.nodelist = nodelist
+        self.name = name
+        self.obj = obj
+        self.vary_on = vary_on
+
+    def render(self, context):
+        request = context.get('request')
+        key = fragments.fragment_key(
+            self.name.resolve(context),
+            self.obj.resolve(context),
+            *[var.resolve(context) for var in self.vary_on],
+            request=request,
+        )
+        html = fragments.get_fragment(key)
+        if html is not None:
+            fragments.record(request, hit=True)
+            return html
+
+        started = time.perf_counter()
+        html = self.nodelist.render(context)
+        fragments.record(request, hit=False, render_seconds=time.perf_counter() - started)
+        fragments.set_fragment(key, html)
+        return html
+
+
+@register.tag
+def fragment(parser, token):
+    """{% fragment 'имя' объект [доп. ключи...] %} ... {% endfragment %}
+
+    Объект должен иметь поле cache_version, см. main/fragments.py.
+    """
+    bits = token.split_contents()
+    if len(bits) < 3:
+        raise template.TemplateSyntaxError(f"'{bits[0]}' tag requires a name and an object")
+    nodelist = parser.parse(('endfragment',))
+    parser.delete_first_token()
+    return FragmentNode(
+        nodelist,
+        parser.compile_filter(bits[1]),
+        parser.compile_filter(bits[2]),
+        [parser.compile_filter(bit) for bit in bits[3:]],
+    )
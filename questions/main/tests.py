@@ -1,3 +1,1244 @@
-from django.test import TestCase
+import asyncio
+import base64
+import json
+import random
+import re
+import threading
+from collections import Counter
+from datetime import timedelta
+from io import StringIO
+from unittest import skipUnless
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.wsgi import get_wsgi_application
+from django.core.management import CommandError, call_command
+from django.http import Http404
+from django.db import connection, connections, transaction
+from django.db.models import F
+from django.test import AsyncRequestFactory, Client, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.html import escape
+
+from . import async_views, counters, db_router, live, ratings, sidebar, vote_buffer
+from .dbpool import pool_stats
+from .management.commands import fill_db
+from .management.commands.bench_views import _environ
+from .fragments import fragment_key
+from .pagination import encode_cursor
+from .models import Question, Answer, Tag, Profile, QuestionLike, AnswerLike, DirtyProfile
+from .profiles import user_stats
+
+
+def make_questions(author, tags, count):
+    for i in range(count):
+        question = Question.objects.create(title=f'Вопрос {i}', content='Текст', author=author)
+        question.tags.set(tags)
+        Answer.objects.create(content='Ответ', author=author, question=question)
+
+
+@override_settings(PAGE_CACHE_TTL=0)
+class QuestionListQueriesTest(TestCase):
+    """Число запросов на страницу списка не зависит от числа карточек"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create(username='author')
+        cls.tags = [Tag.objects.create(name='python'), Tag.objects.create(name='django')]
+
+    def setUp(self):
+        cache.clear()
+
+    def count_queries(self, url):
+        # Первый запрос прогревает кэш сайдбара
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries)
+
+    def assert_constant_queries(self, url, expected):
+        make_questions(self.author, self.tags, 1)
+        self.assertEqual(self.count_queries(url), expected)
+        make_questions(self.author, self.tags, 15)
+        self.assertEqual(self.count_queries(url), expected)
+
+    def test_index(self):
+        # карточки + теги; сайдбар берётся из кэша
+        self.assert_constant_queries('/', 2)
+
+    def test_hot(self):
+        self.assert_constant_queries('/?sort=hot', 2)
+
+    def test_questions_by_tag(self):
+        # + сам тег; число вопросов берётся из Tag.questions_count
+        self.assert_constant_queries('/tag/python/', 3)
+
+    def test_cards_are_ready_to_render(self):
+        make_questions(self.author, self.tags, 3)
+        with self.assertNumQueries(2):
+            cards = list(Question.objects.new_questions().cards()[:10])
+            for card in cards:
+                self.assertEqual(card.answers_count, 1)
+                self.assertEqual(card.author.username, 'author')
+                self.assertEqual(sorted(tag.name for tag in card.tags.all()), ['django', 'python'])
+
+
+class CountersTest(TestCase):
+    """Question.answers_count и Tag.questions_count следуют за изменениями"""
+
+    def setUp(self):
+        self.author = User.objects.create(username='author')
+        self.python = Tag.objects.create(name='python')
+        self.django = Tag.objects.create(name='django')
+        self.question = Question.objects.create(title='Вопрос', content='Текст', author=self.author)
+
+    def assert_counts(self, answers, python, django):
+        self.question.refresh_from_db()
+        self.python.refresh_from_db()
+        self.django.refresh_from_db()
+        self.assertEqual(
+            (self.question.answers_count, self.python.questions_count, self.django.questions_count),
+            (answers, python, django),
+        )
+
+    def test_answers(self):
+        answer = Answer.objects.create(content='Ответ', author=self.author, question=self.question)
+        Answer.objects.create(content='Ответ', author=self.author, question=self.question)
+        self.assert_counts(2, 0, 0)
+        answer.delete()
+        self.assert_counts(1, 0, 0)
+
+    def test_tags(self):
+        self.question.tags.add(self.python, self.django)
+        self.question.tags.add(self.python)
+        self.assert_counts(0, 1, 1)
+        self.question.tags.remove(self.python)
+        self.question.tags.remove(self.python)
+        self.assert_counts(0, 0, 1)
+        self.python.question_set.add(self.question)
+        self.assert_counts(0, 1, 1)
+        self.question.tags.clear()
+        self.assert_counts(0, 0, 0)
+
+    def test_question_delete(self):
+        self.question.tags.set([self.python])
+        self.question.delete()
+        self.python.refresh_from_db()
+        self.assertEqual(self.python.questions_count, 0)
+
+
+class VoteRatingTest(TestCase):
+    """Голоса меняют рейтинг дельтой: рейтинг всегда равен сумме голосов"""
+
+    def setUp(self):
+        self.author = User.objects.create(username='author')
+        self.voters = [User.objects.create(username=f'voter{i}') for i in range(4)]
+        with self.captureOnCommitCallbacks(execute=True):
+            self.question = Question.objects.create(title='Вопрос', content='Текст', author=self.author)
+            self.answer = Answer.objects.create(content='Ответ', author=self.author, question=self.question)
+
+    def assert_consistent(self):
+        self.question.refresh_from_db()
+        self.answer.refresh_from_db()
+        question_votes = sum(QuestionLike.objects.values_list('value', flat=True))
+        answer_votes = sum(AnswerLike.objects.values_list('value', flat=True))
+        self.assertEqual(self.question.rating, question_votes)
+        self.assertEqual(self.answer.rating, answer_votes)
+        self.assertEqual(Profile.objects.get(user=self.author).rating, question_votes + answer_votes)
+        return question_votes, answer_votes
+
+    def test_mixed_operations(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            likes = [QuestionLike.objects.create(user=voter, question=self.question, value=1) for voter in self.voters]
+            AnswerLike.objects.create(user=self.voters[0], answer=self.answer, value=-1)
+            AnswerLike.objects.create(user=self.voters[1], answer=self.answer, value=1)
+        self.assertEqual(self.assert_consistent(), (4, 0))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            likes[0].value = -1  # переворот: дельта -2
+            likes[0].save()
+            likes[1].delete()  # снятие: дельта -1
+            likes[2].save()  # повторное сохранение без изменений
+            AnswerLike.objects.get(user=self.voters[0]).delete()
+        self.assertEqual(self.assert_consistent(), (1, 1))
+
+    def test_own_vote_rejected(self):
+        with self.assertRaises(ValidationError):
+            QuestionLike.objects.create(user=self.author, question=self.question, value=1)
+        self.assertEqual(self.assert_consistent(), (0, 0))
+
+    def test_cascade_delete_skips_revert(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            for voter in self.voters:
+                QuestionLike.objects.create(user=voter, question=self.question, value=1)
+                AnswerLike.objects.create(user=voter, answer=self.answer, value=1)
+        self.assertEqual(Profile.objects.get(user=self.author).rating, 8)
+
+        # Вопрос уносит с собой ответ и все лайки; профиль теряет рейтинг
+        # постов один раз, а не ещё и по каждому лайку
+        with self.captureOnCommitCallbacks(execute=True):
+            Answer.objects.get(pk=self.answer.pk).delete()
+        self.assertEqual(Profile.objects.get(user=self.author).rating, 4)
+        with self.captureOnCommitCallbacks(execute=True):
+            Question.objects.get(pk=self.question.pk).delete()
+        self.assertEqual(Profile.objects.get(user=self.author).rating, 0)
+
+    def test_user_delete_cascade(self):
+        # Удаление пользователя уносит его вопрос, чужие ответы на него
+        # и лайки этих ответов; голоса самого пользователя откатываются
+        answerer, other = User.objects.create(username='answerer'), User.objects.create(username='other')
+        with self.captureOnCommitCallbacks(execute=True):
+            foreign = Answer.objects.create(content='Чужой ответ', author=answerer, question=self.question)
+            for voter in self.voters[:3]:
+                AnswerLike.objects.create(user=voter, answer=foreign, value=1)
+            elsewhere = Question.objects.create(title='Другой', content='Текст', author=other)
+            AnswerLike.objects.create(
+                user=self.author, value=1,
+                answer=Answer.objects.create(content='Ответ', author=answerer, question=elsewhere),
+            )
+            QuestionLike.objects.create(user=self.author, question=elsewhere, value=-1)
+        self.assertEqual(Profile.objects.get(user=answerer).rating, 4)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.author.delete()
+        self.assertEqual(Profile.objects.get(user=answerer).rating, 0)
+        self.assertEqual(Profile.objects.get(user=other).rating, 0)
+        self.assertEqual(Question.objects.get(pk=elsewhere.pk).rating, 0)
+
+    def test_stale_instance_delete(self):
+        stale = Answer.objects.get(pk=self.answer.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            for voter in self.voters:
+                AnswerLike.objects.create(user=voter, answer=self.answer, value=1)
+        # В памяти у stale рейтинг 0, в БД — 4: списывается тот, что в БД
+        with self.captureOnCommitCallbacks(execute=True):
+            stale.delete()
+        self.assertEqual(Profile.objects.get(user=self.author).rating, 0)
+
+    def test_deltas_coalesced(self):
+        with CaptureQueriesContext(connection) as queries:
+            with self.captureOnCommitCallbacks(execute=True):
+                for voter in self.voters:
+                    QuestionLike.objects.create(user=voter, question=self.question, value=1)
+                    AnswerLike.objects.create(user=voter, answer=self.answer, value=1)
+        profile_updates = [q for q in queries if q['sql'].startswith('UPDATE "main_profile"')]
+        self.assertEqual(len(profile_updates), 1)
+        self.assert_consistent()
+
+    def test_savepoint_rollback_drops_deltas(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            QuestionLike.objects.create(user=self.voters[0], question=self.question, value=1)
+            try:
+                with transaction.atomic():
+                    AnswerLike.objects.create(user=self.voters[0], answer=self.answer, value=1)
+                    raise ValueError
+            except ValueError:
+                pass
+            QuestionLike.objects.create(user=self.voters[1], question=self.question, value=1)
+        self.assertEqual(self.assert_consistent(), (2, 0))
+
+    def test_rolled_back_tail_written_later(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            QuestionLike.objects.create(user=self.voters[0], question=self.question, value=1)
+            try:
+                with transaction.atomic():
+                    QuestionLike.objects.create(user=self.voters[1], question=self.question, value=1)
+                    raise ValueError
+            except ValueError:
+                pass
+        # Хук последней дельты откатился — первая ждёт следующей записи
+        self.assertEqual(Profile.objects.get(user=self.author).rating, 0)
+        with self.captureOnCommitCallbacks(execute=True):
+            AnswerLike.objects.create(user=self.voters[2], answer=self.answer, value=1)
+        self.assertEqual(self.assert_consistent(), (1, 1))
+
+
+class ConcurrentVotesTest(TransactionTestCase):
+    """Одновременные голоса и перевороты не теряют дельт"""
+
+    def test_concurrent_votes(self):
+        author = User.objects.create(username='author')
+        question = Question.objects.create(title='Вопрос', content='Текст', author=author)
+        voters = [User.objects.create(username=f'voter{i}') for i in range(8)]
+        barrier = threading.Barrier(len(voters))
+
+        def vote(voter):
+            try:
+                barrier.wait()
+                like = QuestionLike.objects.create(user=voter, question=question, value=1)
+                barrier.wait()
+                # Половина голосующих разом переворачивает голос
+                if voter.pk % 2:
+                    like.value = -1
+                    like.save()
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=vote, args=(voter,)) for voter in voters]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        question.refresh_from_db()
+        self.assertEqual(QuestionLike.objects.count(), len(voters))
+        self.assertEqual(question.rating, sum(QuestionLike.objects.values_list('value', flat=True)))
+        self.assertEqual(Profile.objects.get(user=author).rating, question.rating)
+
+
+@override_settings(PROFILE_RATING_MODE='deferred')
+class DirtyProfileQueueTest(TransactionTestCase):
+    """Отложенный режим: профили пересчитываются из очереди DirtyProfile"""
+
+    def setUp(self):
+        self.authors = [User.objects.create(username=f'author{i}') for i in range(2)]
+        self.voters = [User.objects.create(username=f'voter{i}') for i in range(3)]
+        self.questions = [
+            Question.objects.create(title='Вопрос', content='Текст', author=author) for author in self.authors
+        ]
+        DirtyProfile.objects.all().delete()
+
+    def vote_all(self):
+        for question in self.questions:
+            for voter in self.voters:
+                QuestionLike.objects.create(user=voter, question=question, value=1)
+
+    def test_marks_collapse_and_flush_recomputes(self):
+        self.vote_all()
+        # Шесть голосов — по одной строке очереди на автора, профиль ещё не тронут
+        self.assertEqual(sorted(DirtyProfile.objects.values_list('user_id', flat=True)),
+                         [author.pk for author in self.authors])
+        self.assertEqual(Profile.objects.get(user=self.authors[0]).rating, 0)
+
+        call_command('flush_profiles', '--once', stdout=StringIO())
+        self.assertFalse(DirtyProfile.objects.exists())
+        for author in self.authors:
+            self.assertEqual(Profile.objects.get(user=author).rating, len(self.voters))
+
+    def test_locked_rows_left_for_next_run(self):
+        self.vote_all()
+        locked, release = threading.Event(), threading.Event()
+
+        def hold_lock():
+            # Другой обработчик взял первого автора и ещё не закоммитил
+            try:
+                with transaction.atomic():
+                    list(DirtyProfile.objects.select_for_update().filter(user=self.authors[0]))
+                    locked.set()
+                    release.wait(10)
+            finally:
+                connection.close()
+
+        thread = threading.Thread(target=hold_lock)
+        thread.start()
+        try:
+            locked.wait(10)
+            self.assertEqual(ratings.flush_dirty_profiles(), 1)
+            self.assertEqual(list(DirtyProfile.objects.values_list('user_id', flat=True)), [self.authors[0].pk])
+        finally:
+            release.set()
+            thread.join()
+        self.assertEqual(Profile.objects.get(user=self.authors[1]).rating, len(self.voters))
+
+        self.assertEqual(ratings.flush_dirty_profiles(), 1)
+        self.assertEqual(Profile.objects.get(user=self.authors[0]).rating, len(self.voters))
+
+
+class FixRatingsTest(TestCase):
+    """fix_ratings находит и исправляет расхождения с голосами"""
+
+    def setUp(self):
+        self.authors = [User.objects.create(username=f'author{i}') for i in range(2)]
+        voter = User.objects.create(username='voter')
+        with self.captureOnCommitCallbacks(execute=True):
+            for author in self.authors:
+                question = Question.objects.create(title='Вопрос', content='Текст', author=author)
+                QuestionLike.objects.create(user=voter, question=question, value=1)
+        # Рассинхрон, например после падения процесса с буфером голосов
+        Question.objects.update(rating=5)
+        Profile.objects.filter(user__in=self.authors).update(rating=7)
+
+    def ratings(self):
+        return [
+            (Question.objects.get(author=author).rating, Profile.objects.get(user=author).rating)
+            for author in self.authors
+        ]
+
+    def fix(self, *args):
+        out = StringIO()
+        call_command('fix_ratings', *args, stdout=out)
+        return out.getvalue()
+
+    def test_dry_run_reports_without_writing(self):
+        output = self.fix('--dry-run')
+        self.assertIn('questions: 2 rows, drifted 2', output)
+        self.assertIn('profiles: 3 rows, drifted 2', output)
+        self.assertEqual(self.ratings(), [(5, 7), (5, 7)])
+
+    def test_rebuild(self):
+        self.assertIn('questions: 2 rows, drifted 2', self.fix())
+        self.assertEqual(self.ratings(), [(1, 1), (1, 1)])
+        self.assertIn('questions: 2 rows, drifted 0', self.fix('--dry-run'))
+
+    def test_users_range(self):
+        author = self.authors[0].pk
+        self.fix('--users', f'{author}-{author}')
+        self.assertEqual(self.ratings(), [(1, 1), (5, 7)])
+
+    def test_only_dirty_rejects_range_flags(self):
+        for flags in (['--workers', '2'], ['--chunk-size', '10'], ['--users', '1-2']):
+            with self.assertRaisesMessage(CommandError, flags[0]):
+                self.fix('--only-dirty', *flags)
+
+
+class FillDbTest(TransactionTestCase):
+    """fill_db заполняет базу через COPY текущего драйвера"""
+
+    def fill(self, *args):
+        call_command('fill_db', '3', '--workers', '1', '--seed', '1', *args, stdout=StringIO())
+
+    def test_small_dataset(self):
+        self.fill()
+        self.assertEqual(
+            (User.objects.count(), Profile.objects.count(), Tag.objects.count(),
+             Question.objects.count(), Answer.objects.count()),
+            (3, 3, 3, 30, 300),
+        )
+        self.assertTrue(QuestionLike.objects.exists())
+        self.assertTrue(Question.tags.through.objects.exists())
+
+    def test_denormalized_fields_match(self):
+        self.fill()
+        # Рейтинги и счётчики, посчитанные при генерации, совпадают с пересчётом
+        checks = [
+            (Question, ratings.question_rating_expressions()),
+            (Answer, ratings.answer_rating_expressions()),
+            (Profile, ratings.profile_expressions()),
+            (Question, counters.question_counter_expressions()),
+            (Tag, counters.tag_counter_expressions()),
+        ]
+        for model, expressions in checks:
+            self.assertEqual(ratings.rebuild(model.objects.all(), expressions, dry_run=True), 0, model)
+        # Лайк — не от автора, не больше одного на пользователя (unique_together)
+        self.assertFalse(QuestionLike.objects.filter(user=F('question__author')).exists())
+        self.assertFalse(AnswerLike.objects.filter(user=F('answer__author')).exists())
+
+    def newest_card(self):
+        question = Question.objects.order_by('-id').first()
+        return f'/question/{question.pk}/', escape(question.title)
+
+    def test_refill_purges_cache(self):
+        cache.clear()
+        self.fill()
+        old_url, old_title = self.newest_card()
+        self.assertContains(self.client.get('/'), old_title)
+        # Новые данные получают те же pk и cache_version, что и старые
+        self.fill('--seed', '2')
+        url, title = self.newest_card()
+        self.assertEqual(url, old_url)
+        self.assertNotEqual(title, old_title)
+        response = self.client.get('/')
+        self.assertContains(response, title)
+        self.assertNotContains(response, old_title)
+
+    def snapshot(self):
+        return [
+            list(User.objects.order_by('pk').values_list('pk', 'username', 'email')),
+            list(Question.objects.order_by('pk').values_list('pk', 'title', 'author_id', 'rating')),
+            list(Question.tags.through.objects.order_by('question_id', 'tag_id').values_list('question_id', 'tag_id')),
+            list(Answer.objects.order_by('pk').values_list('pk', 'question_id', 'author_id', 'rating')),
+            list(QuestionLike.objects.order_by('question_id', 'user_id').values_list('question_id', 'user_id', 'value')),
+        ]
+
+    def test_same_seed_same_data(self):
+        self.fill('--profile', 'production')
+        first = self.snapshot()
+        self.fill('--profile', 'production')
+        self.assertEqual(self.snapshot(), first)
+
+    def test_tag_counts_skewed(self):
+        def counts(exponent):
+            plan = fill_db.Plan(1, 100, 50, 2000, 1, 1, 1, 0.0, 1.3, 0.0, 0.0, exponent)
+            rng = random.Random(1)
+            return Counter(len(fill_db.pick_tags(rng, plan, question_id)) for question_id in range(1, 2001))
+
+        uniform, skewed = counts(0.0), counts(1.2)
+        self.assertEqual(set(uniform), {1, 2, 3, 4, 5})
+        self.assertLess(max(uniform.values()) - min(uniform.values()), 150)
+        self.assertGreater(skewed[1], 3 * skewed[5])
+
+
+@override_settings(PAGE_CACHE_TTL=0)
+class TagRankingTest(TestCase):
+    """Сайдбар показывает теги по предрассчитанной популярности"""
+
+    def setUp(self):
+        cache.clear()
+
+    def test_recent_activity_wins(self):
+        author = User.objects.create(username='author')
+        old, fresh = Tag.objects.create(name='old'), Tag.objects.create(name='fresh')
+        make_questions(author, [old], 3)
+        Question.objects.update(created_at=timezone.now() - timedelta(days=30))
+        make_questions(author, [fresh], 1)
+
+        call_command('refresh_tag_ranking', days=7, stdout=StringIO())
+        old.refresh_from_db()
+        fresh.refresh_from_db()
+        self.assertEqual(old.popularity, 0)
+        self.assertEqual(fresh.popularity, 1.5)  # вопрос + 0.5 за ответ
+
+        response = self.client.get('/')
+        self.assertEqual([tag.name for tag in response.context['popular_tags']], ['fresh', 'old'])
+
+
+@override_settings(PAGE_CACHE_TTL=0)
+class SidebarCacheTest(TestCase):
+    """Сайдбар считается лениво и сбрасывается при изменении топа"""
+
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create(username='author')
+        self.tag = Tag.objects.create(name='python')
+
+    def sidebar(self):
+        response = self.client.get('/')
+        return (
+            [tag.name for tag in response.context['popular_tags']],
+            [(user['username'], user['rating']) for user in response.context['best_users']],
+        )
+
+    def test_not_queried_without_sidebar(self):
+        with CaptureQueriesContext(connection) as context:
+            self.client.get('/no-such-page/')
+        self.assertFalse(any('main_tag' in query['sql'] for query in context.captured_queries))
+
+    def test_invalidated_on_changes(self):
+        self.assertEqual(self.sidebar(), (['python'], [('author', 0)]))
+        with self.assertNumQueries(0):
+            list(sidebar.popular_tags()), list(sidebar.best_users())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            newcomer = Tag.objects.create(name='django')
+            question = Question.objects.create(title='Вопрос', content='Текст', author=self.author)
+            question.tags.add(newcomer)
+            reader = User.objects.create(username='reader')
+            QuestionLike.objects.create(user=reader, question=question, value=1)
+        self.assertEqual(self.sidebar(), (['django', 'python'], [('author', 1), ('reader', 0)]))
+
+
+@override_settings(PAGE_CACHE_TTL=0)
+class FragmentCacheTest(TestCase):
+    """Карточки берутся из кэша, пока не изменилась их версия"""
+
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create(username='author')
+        self.reader = User.objects.create(username='reader')
+        make_questions(self.author, [Tag.objects.create(name='python')], 3)
+        self.question = Question.objects.latest('id')
+
+    def fragment_counts(self, url):
+        header = self.client.get(url)['X-Fragment-Cache']
+        counters = dict(part.split('=') for part in header.split('; '))
+        return int(counters['hits']), int(counters['misses'])
+
+    def test_cards(self):
+        self.assertEqual(self.fragment_counts('/'), (0, 3))
+        self.assertEqual(self.fragment_counts('/'), (3, 0))
+
+        QuestionLike.objects.create(user=self.reader, question=self.question, value=1)
+        self.assertEqual(self.fragment_counts('/'), (2, 1))
+        self.assertContains(self.client.get('/'), '<span class="vote-count">1</span>')
+
+        self.question.tags.add(Tag.objects.create(name='django'))
+        Answer.objects.create(content='Ответ', author=self.reader, question=Question.objects.earliest('id'))
+        self.assertEqual(self.fragment_counts('/'), (1, 2))
+
+    def test_answers(self):
+        url = f'/question/{self.question.pk}/'
+        self.assertEqual(self.fragment_counts(url), (0, 1))
+        answer = self.question.answer_set.get()
+        AnswerLike.objects.create(user=self.reader, answer=answer, value=-1)
+        self.assertEqual(self.fragment_counts(url), (0, 1))
+        answer.refresh_from_db()
+        answer.content = 'Исправленный ответ'
+        answer.save()
+        self.assertContains(self.client.get(url), 'Исправленный ответ')
+        self.assertEqual(self.fragment_counts(url), (1, 0))
+
+    def test_fragments_are_whole_elements(self):
+        answer = self.question.answer_set.get()
+        tag = Tag.objects.get(name='python')
+        for url, name, obj in (('/', 'question_card', self.question),
+                               (f'/tag/{tag.name}/', 'tag_question_card', self.question),
+                               (f'/question/{self.question.pk}/', 'answer_block', answer)):
+            self.client.get(url)
+            html = cache.get(fragment_key(name, obj)).strip()
+            # Один корневой элемент, все теги внутри закрыты
+            self.assertTrue(html.startswith('<div class="question__root">'), html[:40])
+            self.assertTrue(html.endswith('</div>'))
+            self.assertEqual(html.count('<div'), html.count('</div>'))
+
+
+@override_settings(PAGE_CACHE_TTL=0)
+class KeysetPaginationTest(TestCase):
+    """Курсоры: обход без пропусков при равных ключах, устаревшие и битые курсоры"""
+
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create(username='author')
+        for i in range(25):
+            Question.objects.create(title=f'Вопрос {i}', content='Текст', author=author)
+        # Все строки равны по первому ключу — порядок держится на id
+        Question.objects.update(created_at=timezone.now(), hot_score=1.0)
+        cls.ids = list(Question.objects.order_by('-id').values_list('pk', flat=True))
+
+    def page(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response.context['page_obj']
+
+    def test_ties_on_sort_key(self):
+        for base in ('/?', '/?sort=hot&'):
+            page, seen = self.page(base), []
+            while True:
+                seen += [question.pk for question in page]
+                if not page.has_next:
+                    break
+                page = self.page(f'{base}cursor={page.next_cursor}')
+            self.assertEqual(seen, self.ids)
+
+            back = []
+            while page.has_previous:
+                page = self.page(f'{base}cursor={page.previous_cursor}')
+                back = [question.pk for question in page] + back
+            self.assertEqual(back, self.ids[:20])
+
+    def test_stale_cursor_gives_empty_page(self):
+        oldest = Question.objects.get(pk=self.ids[-1])
+        newest = Question.objects.get(pk=self.ids[0])
+        for base, keys in (('/?', Question.objects.NEW_ORDERING), ('/?sort=hot&', Question.objects.BEST_ORDERING)):
+            for cursor in (encode_cursor('next', oldest, keys), encode_cursor('prev', newest, keys)):
+                page = self.page(f'{base}cursor={cursor}')
+                self.assertEqual(len(page), 0)
+                self.assertFalse(page.has_other_pages())
+                self.assertIsNone(page.next_cursor)
+                self.assertIsNone(page.previous_cursor)
+
+    def test_bad_cursor_gives_first_page(self):
+        bad_date = base64.urlsafe_b64encode(json.dumps(['next', 'not-a-date', 5]).encode()).decode()
+        for cursor in ('garbage', bad_date, 'W10'):
+            page = self.page(f'/?cursor={cursor}')
+            self.assertEqual([question.pk for question in page], self.ids[:10])
+
+
+class PageCacheTest(TestCase):
+    """Анонимные страницы отдаются из кэша и сбрасываются событиями"""
+
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create(username='author')
+        self.reader = User.objects.create(username='reader')
+        make_questions(self.author, [Tag.objects.create(name='python')], 2)
+        self.question = Question.objects.latest('id')
+        self.urls = ['/', '/?sort=hot', '/tag/python/', f'/question/{self.question.pk}/']
+
+    def page_cache(self):
+        return [self.client.get(url).get('X-Page-Cache') for url in self.urls]
+
+    def test_hit_without_queries(self):
+        self.assertEqual(self.page_cache(), ['miss'] * 4)
+        for url in self.urls:
+            with self.assertNumQueries(0):
+                self.assertEqual(self.client.get(url)['X-Page-Cache'], 'hit')
+
+    def test_question_vote_purges_its_pages(self):
+        self.page_cache()
+        with self.captureOnCommitCallbacks(execute=True):
+            QuestionLike.objects.create(user=self.reader, question=self.question, value=1)
+        self.assertEqual(self.page_cache(), ['miss'] * 4)
+        self.assertContains(self.client.get('/?sort=hot'), '<span class="vote-count">1</span>')
+
+    def test_answer_vote_purges_only_question_page(self):
+        self.page_cache()
+        with self.captureOnCommitCallbacks(execute=True):
+            AnswerLike.objects.create(user=self.reader, answer=self.question.answer_set.get(), value=1)
+        self.assertEqual(self.page_cache(), ['hit', 'hit', 'hit', 'miss'])
+
+    def test_sidebar_fresh_on_hit(self):
+        other = Question.objects.create(title='Чужой вопрос', content='Текст', author=self.reader)
+        self.page_cache()
+        # Голос за пост читателя сдвигает топ пользователей, но не трогает
+        # страницы вопроса автора — они отдаются из кэша с новым сайдбаром
+        with self.captureOnCommitCallbacks(execute=True):
+            QuestionLike.objects.create(user=self.author, question=other, value=1)
+        url = f'/question/{self.question.pk}/'
+        response = self.client.get(url)
+        self.assertEqual(response['X-Page-Cache'], 'hit')
+        self.assertContains(response, f'>{self.reader.username}</a> (1)')
+        self.assertEqual(response.content.count(b'<!--sidebar-->'), 1)
+        self.assertEqual(response.content, self.client.get(url).content)
+
+    def test_bypassed_for_logged_in(self):
+        self.client.force_login(self.reader)
+        self.assertEqual(self.page_cache(), [None] * 4)
+
+
+class HotScoreTest(TestCase):
+    """hot_score учитывает голоса, ответы и свежесть"""
+
+    def setUp(self):
+        self.author = User.objects.create(username='author')
+        self.voters = [User.objects.create(username=f'voter{i}') for i in range(10)]
+
+    def hot_titles(self):
+        return list(Question.objects.best_questions().values_list('title', flat=True))
+
+    def test_activity_and_age(self):
+        old = Question.objects.create(title='old', content='Текст', author=self.author)
+        Question.objects.filter(pk=old.pk).update(created_at=timezone.now() - timedelta(days=1))
+        call_command('refresh_hot_scores', stdout=StringIO())
+        Question.objects.create(title='new', content='Текст', author=self.author)
+        self.assertEqual(self.hot_titles(), ['new', 'old'])
+
+        # Сутки свежести (~2 периода) стоят сотни голосов — десятка мало
+        for voter in self.voters:
+            QuestionLike.objects.create(user=voter, question=old, value=1)
+        self.assertEqual(self.hot_titles(), ['new', 'old'])
+
+        Question.objects.filter(pk=old.pk).update(created_at=timezone.now() - timedelta(minutes=5))
+        call_command('refresh_hot_scores', stdout=StringIO())
+        self.assertEqual(self.hot_titles(), ['old', 'new'])
+
+    def test_incremental_updates_match_refresh(self):
+        question = Question.objects.create(title='q', content='Текст', author=self.author)
+        QuestionLike.objects.create(user=self.voters[0], question=question, value=1)
+        Answer.objects.create(content='Ответ', author=self.voters[1], question=question)
+        question.refresh_from_db()
+        self.assertGreater(question.hot_score, 0)
+        call_command('refresh_hot_scores', stdout=StringIO())
+        self.assertEqual(Question.objects.get(pk=question.pk).hot_score, question.hot_score)
+
+
+# Таблицы, растущие с данными: по ним нельзя ни Seq Scan, ни Sort
+LARGE_TABLES = {
+    'auth_user', 'main_profile', 'main_question', 'main_question_tags',
+    'main_answer', 'main_questionlike', 'main_answerlike',
+}
+
+
+@skipUnless(connection.vendor == 'postgresql', 'EXPLAIN plans are PostgreSQL-specific')
+@override_settings(PAGE_CACHE_TTL=0)
+class QueryPlanTest(TestCase):
+    """Горячие запросы идут по индексам.
+
+    В тестовой БД таблицы крошечные, поэтому Seq Scan и Sort запрещаются
+    планировщику: если они всё же остались в плане, подходящего индекса нет.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create(username='author')
+        make_questions(cls.author, [Tag.objects.create(name='python')], 12)
+        cls.question = Question.objects.latest('id')
+
+    def setUp(self):
+        cache.clear()
+
+    def captured(self, action):
+        with CaptureQueriesContext(connection) as context:
+            action()
+        return [
+            query['sql'] for query in context.captured_queries
+            if query['sql'].lstrip().upper().startswith(('SELECT', 'UPDATE'))
+        ]
+
+    def assert_indexed(self, queries):
+        self.assertTrue(queries)
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+            cursor.execute('SET LOCAL enable_sort = off')
+            for sql in queries:
+                cursor.execute(f'EXPLAIN {sql}')
+                plan = '\n'.join(row[0] for row in cursor.fetchall())
+                scanned = set(re.findall(r'Seq Scan on (\w+)', plan))
+                self.assertFalse(scanned & LARGE_TABLES, f'{sql}\n{plan}')
+                self.assertNotRegex(plan, r'\bSort\b', f'{sql}\n{plan}')
+
+    def pages(self, url):
+        """Первая и следующая (по курсору) страницы списка"""
+        first = self.captured(lambda: self.client.get(url))
+        cursor = self.client.get(url).context['page_obj'].next_cursor
+        separator = '&' if '?' in url else '?'
+        return first + self.captured(lambda: self.client.get(f'{url}{separator}cursor={cursor}'))
+
+    def test_new(self):
+        self.assert_indexed(self.pages('/'))
+
+    def test_hot(self):
+        self.assert_indexed(self.pages('/?sort=hot'))
+
+    def test_tag(self):
+        self.assert_indexed(self.pages('/tag/python/'))
+
+    def test_question(self):
+        self.assert_indexed(self.captured(lambda: self.client.get(f'/question/{self.question.pk}/')))
+
+    def test_user_profile(self):
+        # Статистика в кэше; здесь проверяются списки последних постов
+        user_stats(self.author.pk)
+        self.assert_indexed(self.pages('/user/author/'))
+        self.assert_indexed(self.pages('/user/author/?tab=answers'))
+
+    def test_profile_recompute(self):
+        profile = Profile.objects.get(user=self.author)
+        self.assert_indexed(self.captured(profile.update_rating))
+
+
+@skipUnless(connection.vendor == 'postgresql', 'Full-text search is PostgreSQL-specific')
+@override_settings(PAGE_CACHE_TTL=0)
+class SearchTest(TestCase):
+    """Поиск по заголовку, тексту и тегам с ранжированием и курсором"""
+
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create(username='author')
+
+    def ask(self, title, content='Текст', tags=()):
+        question = Question.objects.create(title=title, content=content, author=self.author)
+        question.tags.set(tags)
+        return question
+
+    def found(self, query):
+        return [question.title for question in self.client.get('/search/', {'q': query}).context['page_obj']]
+
+    def test_ranking_and_incremental_index(self):
+        self.ask('Кэширование страниц', content='Про индексы ни слова')
+        in_title = self.ask('Как работают индексы в PostgreSQL')
+        self.ask('Про <script>', content='Составные индексы <b>нужны</b> для сортировки')
+        self.assertEqual(self.found('индекс'), ['Как работают индексы в PostgreSQL', 'Про <script>', 'Кэширование страниц'])
+
+        response = self.client.get('/search/', {'q': 'сортировка'})
+        self.assertContains(response, 'для <mark>сортировки</mark>')
+        self.assertNotContains(response, '<b>')
+
+        in_title.title = 'Вопрос без ключевых слов'
+        in_title.save()
+        self.assertEqual(self.found('postgresql'), [])
+        in_title.tags.add(Tag.objects.create(name='postgresql'))
+        self.assertEqual(self.found('postgresql'), ['Вопрос без ключевых слов'])
+
+    def test_cursor_pages(self):
+        for i in range(25):
+            self.ask(f'Вопрос про миграции {i}', content='миграции ' * (i % 4))
+        titles, url, params = [], '/search/', {'q': 'миграции'}
+        while True:
+            page = self.client.get(url, params).context['page_obj']
+            titles += [question.title for question in page]
+            if not page.has_next:
+                break
+            params = {'q': 'миграции', 'cursor': page.next_cursor}
+        self.assertEqual(len(titles), 25)
+        self.assertEqual(len(set(titles)), 25)
+
+    def test_old_page_links_ranked(self):
+        for i in range(25):
+            self.ask(f'Вопрос про миграции {i}', content='миграции ' * (i % 4))
+        by_cursor = self.found('миграции')
+        pages = [self.client.get('/search/', {'q': 'миграции', 'page': number}).context['page_obj'] for number in (1, 2, 3)]
+        titles = [question.title for page in pages for question in page]
+        self.assertEqual(titles[:10], by_cursor)
+        self.assertEqual(len(set(titles)), 25)
+        response = self.client.get('/search/', {'q': 'миграции', 'page': 1})
+        self.assertContains(response, 'href="?q=%D0%BC%D0%B8%D0%B3%D1%80%D0%B0%D1%86%D0%B8%D0%B8&page=2"')
+
+    def test_admin_search(self):
+        self.ask('Как работают индексы в PostgreSQL')
+        self.ask('Кэширование страниц')
+        self.client.force_login(User.objects.create(username='admin', is_staff=True, is_superuser=True))
+
+        def found(term):
+            return sorted(self.client.get('/admin/main/question/', {'q': term}).context['cl'].result_list.values_list('title', flat=True))
+
+        # Слово — полнотекстовым поиском, часть слова — обычным icontains
+        self.assertEqual(found('индекс'), ['Как работают индексы в PostgreSQL'])
+        self.assertEqual(found('широван'), ['Кэширование страниц'])
+        self.assertEqual(found('нет такого'), [])
+
+
+class TagSuggestionsTest(TestCase):
+    """Подсказки тегов: префикс по популярности, затем опечатки"""
+
+    def setUp(self):
+        for name, popularity in [('django', 5), ('django-orm', 9), ('docker', 7), ('python', 3)]:
+            Tag.objects.create(name=name, popularity=popularity)
+
+    def suggest(self, query, **params):
+        response = self.client.get('/tags/suggest/', {'q': query, **params})
+        return [tag['name'] for tag in response.json()['tags']]
+
+    def test_prefix_then_fuzzy(self):
+        self.assertEqual(self.suggest('dj'), ['django-orm', 'django'])
+        self.assertEqual(self.suggest('D'), ['django-orm', 'docker', 'django'])
+        self.assertEqual(self.suggest('pythn'), ['python'])
+        self.assertEqual(self.suggest('', limit=2), ['django-orm', 'docker'])
+
+    def test_served_from_memory(self):
+        self.suggest('dj')
+        with self.assertNumQueries(0):
+            self.suggest('do')
+        Tag.objects.create(name='djangorestframework', popularity=1)
+        self.assertEqual(self.suggest('djangor')[0], 'djangorestframework')
+
+    def test_admin_search_not_limited(self):
+        # Админка ищет обычным icontains: все совпадения, в том числе в середине имени
+        Tag.objects.bulk_create(Tag(name=f'tag-{i}-orm') for i in range(120))
+        self.client.force_login(User.objects.create(username='admin', is_staff=True, is_superuser=True))
+        response = self.client.get('/admin/main/tag/', {'q': 'orm'})
+        self.assertEqual(response.context['cl'].result_count, 121)
+
+
+class VoteTest(TestCase):
+    """AJAX-голосование: вставка, переворот и снятие голоса одним оператором"""
+
+    def setUp(self):
+        self.author = User.objects.create(username='author')
+        self.voter = User.objects.create(username='voter')
+        self.question = Question.objects.create(title='Вопрос', content='Текст', author=self.author)
+        self.answer = Answer.objects.create(content='Ответ', author=self.author, question=self.question)
+        self.client.force_login(self.voter)
+
+    def vote(self, kind, target, value):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(
+                '/vote/', {'kind': kind, 'id': target.pk, 'value': value}, content_type='application/json'
+            )
+
+    def test_insert_flip_toggle(self):
+        self.assertEqual(self.vote('question', self.question, 1).json(), {'rating': 1, 'vote': 1})
+        self.assertEqual(self.vote('question', self.question, -1).json(), {'rating': -1, 'vote': -1})
+        self.assertEqual(QuestionLike.objects.get().value, -1)
+        self.assertEqual(self.vote('question', self.question, -1).json(), {'rating': 0, 'vote': 0})
+        self.assertFalse(QuestionLike.objects.exists())
+
+        self.vote('answer', self.answer, 1)
+        self.assertEqual(self.vote('answer', self.answer, 0).json(), {'rating': 0, 'vote': 0})
+        self.vote('answer', self.answer, -1)
+        self.assertEqual(AnswerLike.objects.get().value, -1)
+        self.assertEqual(Answer.objects.get().rating, -1)
+        self.assertEqual(Profile.objects.get(user=self.author).rating, -1)
+
+    def test_rejected_votes(self):
+        self.assertEqual(self.vote('question', self.question, 2).status_code, 400)
+        self.assertEqual(self.vote('comment', self.question, 1).status_code, 400)
+        self.assertEqual(self.vote('answer', Answer(pk=self.answer.pk + 1), 1).status_code, 404)
+        self.client.force_login(self.author)
+        self.assertEqual(self.vote('question', self.question, 1).status_code, 403)
+        self.client.logout()
+        self.assertEqual(self.vote('question', self.question, 1).status_code, 401)
+        self.assertEqual(Question.objects.get().rating, 0)
+        self.assertEqual(self.client.get('/vote/').status_code, 405)
+
+    def test_csrf(self):
+        client = Client(enforce_csrf_checks=True)
+        url = f'/question/{self.question.pk}/'
+        body = {'kind': 'question', 'id': self.question.pk, 'value': 1}
+        # Аноним без токена получает JSON 401 со ссылкой на вход, а не 403 от CSRF
+        self.assertNotContains(client.get(url), 'name="csrf-token"')
+        response = client.post('/vote/', body, content_type='application/json')
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.json()['login_url'], settings.LOGIN_URL)
+
+        client.force_login(self.voter)
+        self.assertEqual(client.post('/vote/', body, content_type='application/json').status_code, 403)
+        token = re.search(r'name="csrf-token" content="([^"]+)"', client.get(url).content.decode()).group(1)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = client.post('/vote/', body, content_type='application/json', HTTP_X_CSRFTOKEN=token)
+        self.assertEqual(response.json(), {'rating': 1, 'vote': 1})
+
+
+@override_settings(VOTE_RATING_MODE='buffered', VOTE_FLUSH_INTERVAL=0)
+class VoteBufferTest(TransactionTestCase):
+    """Буферный режим: лайки пишутся сразу, рейтинг — одним UPDATE на цель.
+
+    Без обёртки TestCase: дельты попадают в буфер только после настоящего коммита.
+    """
+
+    def setUp(self):
+        self.author = User.objects.create(username='author')
+        self.question = Question.objects.create(title='Вопрос', content='Текст', author=self.author)
+        self.voters = [User.objects.create(username=f'voter{i}') for i in range(5)]
+
+    def test_aggregated_flush(self):
+        for voter in self.voters:
+            QuestionLike.objects.create(user=voter, question=self.question, value=1)
+        QuestionLike.objects.filter(user=self.voters[0]).delete()
+        self.assertEqual(QuestionLike.objects.count(), 4)
+        self.assertEqual(Question.objects.get().rating, 0)
+        self.assertEqual(vote_buffer.pending_delta('question', self.question.pk), 4)
+
+        with CaptureQueriesContext(connection) as context:
+            self.assertEqual(vote_buffer.flush_votes(), 1)
+        updates = [query['sql'] for query in context.captured_queries if query['sql'].startswith('UPDATE')]
+        self.assertEqual(len(updates), 2)  # вопрос и профиль автора
+        self.assertEqual(Question.objects.get().rating, 4)
+        self.assertEqual(Profile.objects.get(user=self.author).rating, 4)
+        self.assertEqual(vote_buffer.pending_delta('question', self.question.pk), 0)
+
+    def test_endpoint_shows_pending_votes(self):
+        self.client.force_login(self.voters[0])
+        response = self.client.post(
+            '/vote/', {'kind': 'question', 'id': self.question.pk, 'value': 1}, content_type='application/json'
+        )
+        self.assertEqual(response.json(), {'rating': 1, 'vote': 1})
+        self.assertEqual(Question.objects.get().rating, 0)
+        vote_buffer.flush_votes()
+
+
+class ProfileStatsTest(TestCase):
+    """Статистика профиля: один запрос, кэш и сброс по активности автора"""
+
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create(username='author')
+        self.reader = User.objects.create(username='reader')
+        python, django = Tag.objects.create(name='python'), Tag.objects.create(name='django')
+        with self.captureOnCommitCallbacks(execute=True):
+            make_questions(self.author, [python], 2)
+            make_questions(self.author, [python, django], 1)
+        Answer.objects.filter(question=Question.objects.first()).update(is_correct=True)
+
+    def test_stats(self):
+        with self.assertNumQueries(1):
+            stats = user_stats(self.author.pk)
+        self.assertEqual(
+            (stats['questions_count'], stats['answers_count'], stats['accepted_count'], stats['top_tags']),
+            (3, 3, 1, ['python', 'django']),
+        )
+        with self.assertNumQueries(0):
+            user_stats(self.author.pk)
+        self.assertEqual(user_stats(self.reader.pk)['questions_count'], 0)
+        self.assertIsNone(user_stats(0))
+
+    def test_expired_by_activity(self):
+        user_stats(self.author.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            QuestionLike.objects.create(user=self.reader, question=Question.objects.first(), value=1)
+        self.assertEqual(user_stats(self.author.pk)['rating'], 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            Question.objects.create(title='Ещё', content='Текст', author=self.author)
+        self.assertEqual(user_stats(self.author.pk)['questions_count'], 4)
+
+    def test_page(self):
+        response = self.client.get('/user/author/?tab=answers')
+        self.assertContains(response, 'Принятых ответов')
+        self.assertEqual(len(response.context['page_obj']), 3)
+        self.assertEqual(self.client.get('/user/nobody/').status_code, 404)
+
+
+class LiveUpdatesTest(TestCase):
+    """SSE-поток вопроса: события из путей записи доходят до подписчиков"""
+
+    def setUp(self):
+        self.author = User.objects.create(username='author')
+        self.reader = User.objects.create(username='reader')
+        self.question = Question.objects.create(title='Вопрос', content='Текст', author=self.author)
+
+    async def test_stream(self):
+        response = await self.async_client.get(f'/question/{self.question.pk}/events/')
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        stream = aiter(response.streaming_content)
+        self.assertTrue((await anext(stream)).startswith(b'retry:'))
+        self.assertEqual(live.publish(self.question.pk, 'vote', {'kind': 'question', 'id': 1, 'rating': 3}), 1)
+        self.assertEqual(await anext(stream), b'event: vote\ndata: {"kind": "question", "id": 1, "rating": 3}\n\n')
+        # Отключение клиента: ASGI-сервер отменяет задачу, ждущую событие
+        waiting = asyncio.ensure_future(anext(stream))
+        await asyncio.sleep(0)
+        waiting.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await waiting
+        self.assertEqual(live.subscriber_count(self.question.pk), 0)
+
+    def vote_and_answer(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            QuestionLike.objects.create(user=self.reader, question=self.question, value=1)
+            Answer.objects.create(content='Новый ответ', author=self.reader, question=self.question)
+
+    async def test_write_paths_publish(self):
+        subscriber = live.subscribe(self.question.pk)
+        try:
+            await sync_to_async(self.vote_and_answer)()
+            await asyncio.sleep(0)
+            queue = subscriber[1]
+            events = [queue.get_nowait() for _ in range(queue.qsize())]
+        finally:
+            live.unsubscribe(self.question.pk, subscriber)
+        self.assertEqual(len(events), 2)
+        self.assertIn(b'"rating": 1', events[0])
+        self.assertTrue(events[1].startswith(b'event: answer\n'))
+        self.assertIn('Новый ответ'.encode(), events[1])
+
+    @override_settings(PAGE_CACHE_TTL=0)
+    async def test_page_subscribes_under_asgi(self):
+        response = await self.async_client.get(f'/question/{self.question.pk}/')
+        self.assertContains(response, 'data-live-answers')
+
+
+@override_settings(ALLOWED_HOSTS=['localhost'], PAGE_CACHE_TTL=0)
+class LiveUnderWsgiTest(TransactionTestCase):
+    """Под WSGI страница не подписывается, а /events/ не занимает поток воркера"""
+
+    def setUp(self):
+        author = User.objects.create(username='author')
+        self.question = Question.objects.create(title='Вопрос', content='Текст', author=author)
+
+    def wsgi_get(self, path):
+        status, body = [], []
+
+        def request():
+            response = get_wsgi_application()(
+                _environ(path), lambda line, headers, exc_info=None: status.append(int(line[:3]))
+            )
+            try:
+                body.extend(response)
+            finally:
+                response.close()
+
+        worker = threading.Thread(target=request, daemon=True)
+        worker.start()
+        worker.join(5)
+        self.assertFalse(worker.is_alive(), f'{path} не закончил ответ')
+        return status[0], b''.join(body)
+
+    def test_events_end_at_once(self):
+        self.assertEqual(self.wsgi_get(f'/question/{self.question.pk}/events/'), (204, b''))
+        self.assertEqual(live.subscriber_count(), 0)
+
+    def test_page_does_not_subscribe(self):
+        status, body = self.wsgi_get(f'/question/{self.question.pk}/')
+        self.assertEqual(status, 200)
+        self.assertNotIn(b'data-live-answers', body)
+
+
+class DbMetricsTest(TransactionTestCase):
+    """Метрики соединений: новые соединения и пул считаются, отдаёт их только персоналу"""
+
+    @skipUnless(settings.DB_CONN_MODE != 'pool', 'без пула')
+    def test_counts_new_connections(self):
+        before = pool_stats()['created']
+        connection.close()
+        User.objects.exists()
+        self.assertEqual(pool_stats()['created'], before + 1)
+
+    @skipUnless(settings.DB_CONN_MODE == 'pool', 'DB_CONN_MODE=pool')
+    def test_pool_stats(self):
+        with connection.cursor():
+            stats = pool_stats()
+            self.assertGreaterEqual(stats['in_use'], 1)
+        self.assertEqual(stats['in_use'] + stats['available'], stats['size'])
+        self.assertLessEqual(stats['size'], stats['max_size'])
+
+    def test_staff_only(self):
+        self.assertEqual(self.client.get('/metrics/db/').status_code, 302)
+        self.client.force_login(User.objects.create(username='admin', is_staff=True))
+        self.assertEqual(self.client.get('/metrics/db/').json()['mode'], settings.DB_CONN_MODE)
+
+
+class LaggingRouter(db_router.ReplicaRouter):
+    lag_checks = 0
+
+    def replica_lag(self, alias):
+        self.lag_checks += 1
+        return 30
+
+
+@override_settings(
+    DATABASE_ROUTERS=['main.db_router.ReplicaRouter'], DB_REPLICAS=['replica'], REPLICA_MAX_LAG=0,
+)
+class ReplicaRouterTest(TransactionTestCase):
+    """Чтения на реплике, записи и чтения после своей записи — на primary"""
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        self.author = User.objects.create(username='author')
+        self.voter = User.objects.create(username='voter')
+        self.question = Question.objects.create(title='Вопрос', content='Текст', author=self.author)
+        self.answer = Answer.objects.create(content='Ответ', author=self.author, question=self.question)
+        cache.clear()  # вместе с метками сброса от setUp
+        db_router.begin(False)
+
+    def replica_queries(self, path, client=None):
+        with CaptureQueriesContext(connections['replica']) as queries:
+            self.assertEqual((client or self.client).get(path).status_code, 200)
+        return len(queries)
+
+    def test_routing(self):
+        self.assertEqual(Question.objects.all().db, 'replica')
+        with transaction.atomic():
+            self.assertEqual(Question.objects.all().db, 'default')
+        with db_router.use_primary():
+            self.assertEqual(Question.objects.all().db, 'default')
+        self.assertEqual(Question.objects.all().db, 'replica')
+        Tag.objects.create(name='python')
+        self.assertEqual(Question.objects.all().db, 'default')
+        self.assertEqual(db_router.ReplicaRouter().replica_lag('replica'), 0)
+
+    @override_settings(REPLICA_MAX_LAG=2, REPLICA_LAG_CHECK_INTERVAL=60)
+    def test_lagging_replica_skipped(self):
+        router = LaggingRouter()
+        self.assertEqual(router.db_for_read(Question), 'default')
+        self.assertEqual(router.db_for_read(Question), 'default')
+        self.assertEqual(router.lag_checks, 1)
+
+    def test_read_your_writes(self):
+        page = f'/question/{self.question.pk}/'
+        self.client.force_login(self.voter)
+        response = self.client.post(
+            '/vote/', {'kind': 'answer', 'id': self.answer.pk, 'value': 1}, content_type='application/json'
+        )
+        self.assertEqual(response.cookies[db_router.STICKY_COOKIE]['max-age'], settings.REPLICA_STICKY_SECONDS)
+        # Свой голос читаем с primary, пока жива cookie
+        self.assertEqual(self.replica_queries(page), 0)
+        del self.client.cookies[db_router.STICKY_COOKIE]
+        self.assertGreater(self.replica_queries(page), 0)
+
+        # Аноним: сброшенную голосом страницу вопроса рендерит primary, список — реплика
+        anonymous = Client()
+        self.assertEqual(self.replica_queries(page, anonymous), 0)
+        self.assertGreater(self.replica_queries('/', anonymous), 0)
+
+
+@override_settings(PAGE_CACHE_TTL=0)
+class AsyncViewsTest(TestCase):
+    """Async-версии страниц отдают ту же разметку, что и синхронные"""
+
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create(username='author')
+        make_questions(self.author, [Tag.objects.create(name='python')], 12)
+        self.question = Question.objects.latest('id')
+
+    async def compare(self, path, view, **kwargs):
+        # Синхронная версия — тоже под ASGI: от обработчика зависит подписка на SSE
+        expected = (await self.async_client.get(path)).content
+        response = await view(AsyncRequestFactory().get(path), **kwargs)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, expected)
+
+    async def test_pages(self):
+        await self.compare('/', async_views.index)
+        await self.compare('/?sort=hot', async_views.index)
+        await self.compare('/tag/python/', async_views.questions_by_tag, tag_name='python')
+        await self.compare(f'/question/{self.question.pk}/', async_views.question_detail, question_id=self.question.pk)
+        cursor = (await sync_to_async(self.client.get)('/')).context['page_obj'].next_cursor
+        await self.compare(f'/?cursor={cursor}', async_views.index)
+
+    async def test_not_found(self):
+        with self.assertRaises(Http404):
+            await async_views.questions_by_tag(AsyncRequestFactory().get('/tag/nope/'), tag_name='nope')
 
-# Create your tests here.
@@ -0,0 +1,116 @@
+"""Подсказки тегов для поля ввода (autocomplete).
+
+Все теги держатся в памяти процесса: список, отсортированный по имени,
+для поиска по префиксу (bisect) и инвертированный индекс триграмм для
+нечёткого совпадения, как в pg_trgm. Индекс перечитывается из БД не чаще
+раза в TAG_TYPEAHEAD_REFRESH секунд, поэтому подсказка не ходит в БД.
+"""
+import heapq
+import re
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter, defaultdict
+
+from django.conf import settings
+
+# Минимальное сходство для нечёткого совпадения (порог pg_trgm по умолчанию)
+SIMILARITY_THRESHOLD = 0.3
+
+
+def words(text):
+    return re.findall(r'[^\W_]+', text.lower())
+
+
+def trigrams(word):
+    padded = f'  {word} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class TagIndex:
+    def __init__(self, rows):
+        """rows — (name, popularity, questions_count)"""
+        rows = sorted(rows, key=lambda row: row[0].lower())
+        self.keys = [name.lower() for name, _, _ in rows]
+        self.names = [name for name, _, _ in rows]
+        self.scores = [(popularity, count) for _, popularity, count in rows]
+        self.counts = [count for _, _, count in rows]
+        # Триграммы по словам имени: «django_orm» находится и по «orn»
+        self.word_tags = []
+        self.word_sizes = []
+        self.postings = defaultdict(list)
+        for i, key in enumerate(self.keys):
+            for word in words(key):
+                grams = trigrams(word)
+                for gram in grams:
+                    self.postings[gram].append(len(self.word_tags))
+                self.word_tags.append(i)
+                self.word_sizes.append(len(grams))
+        self.top = heapq.nlargest(100, range(len(rows)), key=self.scores.__getitem__)
+
+    def prefix(self, text, limit):
+        low = bisect_left(self.keys, text)
+        high = bisect_left(self.keys, text + '￿')
+        return heapq.nlargest(limit, range(low, high), key=self.scores.__getitem__)
+
+    def fuzzy(self, text, limit):
+        grams = set().union(*map(trigrams, words(text)))
+        shared = Counter()
+        for gram in grams:
+            shared.update(self.postings.get(gram, ()))
+        best = {}
+        for word, common in shared.items():
+            similarity = common / (len(grams) + self.word_sizes[word] - common)
+            i = self.word_tags[word]
+            if similarity >= SIMILARITY_THRESHOLD and similarity > best.get(i, 0):
+                best[i] = similarity
+        return heapq.nlargest(limit, best, key=lambda i: (best[i], self.scores[i]))
+
+    def suggest(self, text, limit):
+        """Сначала теги с этим префиксом, затем похожие — по популярности"""
+        text = text.strip().lower()
+        if not text:
+            found = self.top[:limit]
+        else:
+            found = self.prefix(text, limit)
+            if len(found) < limit:
+                seen = set(found)
+                found += [i for i in self.fuzzy(text, limit) if i not in seen][:limit - len(found)]
+        return [{'name': self.names[i], 'questions_count': self.counts[i]} for i in found]
+
+
+_index = None
+_loaded_at = 0.0
+_lock = threading.Lock()
+
+
+def load_index():
+    from .models import Tag
+    return TagIndex(Tag.objects.values_list('name', 'popularity', 'questions_count'))
+
+
+def get_index():
+    """Текущий индекс; устаревший перестраивает один поток, остальные
+    пока отвечают по старому"""
+    global _index, _loaded_at
+    fresh = time.monotonic() - _loaded_at < getattr(settings, 'TAG_TYPEAHEAD_REFRESH', 60)
+    if _index is not None and fresh:
+        return _index
+    if _lock.acquire(blocking=_index is None):
+        try:
+            if _index is None or time.monotonic() - _loaded_at >= getattr(settings, 'TAG_TYPEAHEAD_REFRESH', 60):
+                _index = load_index()
+                _loaded_at = time.monotonic()
+        finally:
+            _lock.release()
+    return _index
+
+
+def expire():
+    """Перечитать индекс при следующем запросе (в этом процессе)"""
+    global _loaded_at
+    _loaded_at = 0.0
+
+
+def suggest_tags(text, limit=10):
+    return get_index().suggest(text, limit)
@@ -1,16 +1,25 @@
+from django.conf import settings
 from django.contrib import admin
 from django.urls import path, include
-from . import views
+from . import async_views, views
+
+# С ASYNC_VIEWS=1 читающие страницы обслуживают async-версии, см. main/async_views.py
+read_views = async_views if settings.ASYNC_VIEWS else views
 
 
 urlpatterns = [
-    path('', views.index, name='index'),
-    path('question/<int:question_id>/', views.question_detail, name='question'),
+    path('', read_views.index, name='index'),
+    path('question/<int:question_id>/', read_views.question_detail, name='question'),
+    path('question/<int:question_id>/events/', views.question_events, name='question_events'),
     path('ask/', views.ask_question, name='ask'),
     path('login/', views.login_view, name='login'),
     path('signup/', views.signup_view, name='signup'),
     path('logout/', views.logout_view, name='logout'),
     path('profile/', views.profile, name='profile'),
-    path('tag/<str:tag_name>/', views.questions_by_tag, name='questions_by_tag'),
+    path('search/', views.search, name='search'),
+    path('vote/', views.vote, name='vote'),
+    path('tags/suggest/', views.tag_suggestions, name='tag_suggestions'),
+    path('metrics/db/', views.db_metrics, name='db_metrics'),
+    path('tag/<str:tag_name>/', read_views.questions_by_tag, name='questions_by_tag'),
     path('user/<str:username>/', views.user_profile, name='user_profile'),
 ]
\ No newline at end of file
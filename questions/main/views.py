@@ -1,14 +1,32 @@
+from django.conf import settings
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth import login, authenticate, logout
 from django.contrib.auth.forms import UserCreationForm, AuthenticationForm
 from django.contrib.auth.decorators import login_required
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib import messages
 from django.core.paginator import Paginator
+from django.core.exceptions import PermissionDenied
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
+from django.views.decorators.http import require_POST
+import json
 import random
-from django.http import Http404
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.contrib.auth.models import User
 from .models import Question, Tag, Answer
+from . import live
+from .dbpool import pool_stats
+from .pagination import keyset_page
+from .pages import anonymous_page_cache
+from .profiles import user_stats
+from .search import SEARCH_ORDERING, search_questions, highlight
+from .typeahead import suggest_tags
+from .votes import VOTE_KINDS, cast_vote
 
 
+# Последние посты в профиле — по индексам (author, -id)
+PROFILE_ORDERING = ('-id',)
+
 # Глобальная переменная для хранения вопросов
 GLOBAL_QUESTIONS = []
 
@@ -216,27 +234,30 @@ def signup(request):
 def login_view(request):
     return render(request, 'login.html')
 
+@login_required
 def profile(request):
-    return render(request, 'profile.html')
+    return render(request, 'profile.html', {'stats': user_stats(request.user.pk)})
 
 def ask_question(request):
     return render(request, 'ask.html')
 
 
 def user_profile(request, username):
-    """Страница профиля пользователя (заглушка)"""
-    # Пока просто заглушка, потом заменим на реальные данные из БД
-    context = {
-        'username' : username,
-        'user_data' : {
-            'rating' : 205,
-            'questions_count' : 45,
-            'answers_count' : 113,
-            'member_since' : '2021' 
-        }
-    }
-
-    return render(request, 'user_profile.html', context)
+    """Профиль: статистика из кэша (main/profiles.py), последние вопросы или ответы по курсору"""
+    user_id = get_object_or_404(User.objects.values_list('pk', flat=True), username=username)
+    tab = 'answers' if request.GET.get('tab') == 'answers' else 'questions'
+    if tab == 'answers':
+        posts = Answer.objects.filter(author_id=user_id).select_related('question').only(
+            'content', 'rating', 'is_correct', 'created_at', 'question__title'
+        )
+    else:
+        posts = Question.objects.filter(author_id=user_id).only('title', 'rating', 'answers_count', 'created_at')
+    return render(request, 'user_profile.html', {
+        'username': username,
+        'stats': user_stats(user_id),
+        'tab': tab,
+        'page_obj': paginate(posts, request, keys=PROFILE_ORDERING),
+    })
 
 def custom_404(request, exception):
     return render(request, '404.html', {"exception": exception}, status=404)
@@ -248,52 +269,144 @@ def custom_500(request):
     return render(request, '500.html', status=500)
 
 
-def paginate(objects_list, request, per_page=10):
+def paginate(objects_list, request, per_page=10, keys=None, count=None):
+    # С keys — курсорная пагинация (?cursor=...), старые ссылки ?page=N
+    # по-прежнему обслуживает Paginator; count — готовый счётчик вместо COUNT(*)
+    if keys is not None and 'page' not in request.GET:
+        return keyset_page(objects_list, keys, request.GET.get('cursor'), per_page)
+    if keys is not None:
+        # Тот же порядок, что у курсора: без него, например, поиск листался бы
+        # по неупорядоченной выборке
+        objects_list = objects_list.order_by(*keys)
     paginator = Paginator(objects_list, per_page)
+    if count is not None:
+        paginator.count = count
     page_number = request.GET.get('page')
     return paginator.get_page(page_number)
 
+@anonymous_page_cache(lambda request: ['hot' if request.GET.get('sort') == 'hot' else 'new'])
 def index(request):
     sort_type = request.GET.get('sort', 'new')  # получаем параметр сортировки
     
     if sort_type == 'hot':
-        questions = Question.objects.best_questions()
+        questions = Question.objects.best_questions().cards()
+        keys = Question.objects.BEST_ORDERING
     else:
-        questions = Question.objects.new_questions()
+        questions = Question.objects.new_questions().cards()
+        keys = Question.objects.NEW_ORDERING
     
-    page_obj = paginate(questions, request)
+    page_obj = paginate(questions, request, keys=keys)
     
     return render(request, 'index.html', {
         'page_obj': page_obj,
         'current_sort': sort_type
     })
 
+@anonymous_page_cache(lambda request: ['hot'])
 def hot_questions(request):
-    questions = Question.objects.best_questions()
-    page_obj = paginate(questions, request)
+    questions = Question.objects.best_questions().cards()
+    page_obj = paginate(questions, request, keys=Question.objects.BEST_ORDERING)
     return render(request, 'index.html', {
         'page_obj': page_obj,
         'current_sort': 'hot'
     })
 
+@anonymous_page_cache(lambda request, tag_name: [f'tag:{tag_name}'])
 def questions_by_tag(request, tag_name):
     """Вопросы по тегу"""
     tag = get_object_or_404(Tag, name=tag_name)
-    questions = Question.objects.questions_by_tag(tag_name)
-    page_obj = paginate(questions, request)
+    questions = Question.objects.questions_by_tag(tag).cards()
+    page_obj = paginate(questions, request, keys=Question.objects.TAG_ORDERING, count=tag.questions_count)
     
     context = {
         'page_obj': page_obj,
         'tag': tag,  # ← передаем объект тега, а не только имя
-        'questions_count': questions.count()
+        'questions_count': tag.questions_count
     }
     return render(request, 'questions_by_tag.html', context)
 
+@anonymous_page_cache(lambda request, question_id: [f'question:{question_id}'])
 def question_detail(request, question_id):
     question = get_object_or_404(Question, id=question_id)
-    answers = Answer.objects.filter(question=question).order_by('-rating', '-created_at')
-    page_obj = paginate(answers, request, per_page=5)
+    answers = Answer.objects.filter(question=question).select_related('author').order_by('-rating', '-created_at')
+    page_obj = paginate(answers, request, per_page=5, count=question.answers_count)
     return render(request, 'question.html', {
         'question': question,
-        'page_obj': page_obj
+        'page_obj': page_obj,
+        'live_updates': live.available(request),
     })
+
+
+async def question_events(request, question_id):
+    """SSE-поток новых ответов и рейтингов вопроса, см. main/live.py.
+
+    Подписка не ходит в БД: тысячи открытых потоков не держат соединений,
+    а поток несуществующего вопроса просто молчит."""
+    if not live.available(request):
+        # Под WSGI бесконечный поток занял бы поток воркера; на 204
+        # EventSource не переподключается
+        return HttpResponse(status=204)
+    response = StreamingHttpResponse(live.stream(question_id), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # nginx не должен копить поток
+    return response
+
+
+def search(request):
+    """Полнотекстовый поиск по вопросам, см. main/search.py"""
+    query = request.GET.get('q', '').strip()
+    page_obj = None
+    if query:
+        results = search_questions(query).cards()
+        page_obj = paginate(results, request, keys=SEARCH_ORDERING)
+        for question in page_obj:
+            question.snippet = highlight(question.headline)
+    return render(request, 'search.html', {
+        'query': query,
+        'page_obj': page_obj,
+    })
+
+
+def tag_suggestions(request):
+    """JSON-подсказки тегов для поля ввода: ?q=префикс&limit=N"""
+    try:
+        limit = min(max(int(request.GET.get('limit', 10)), 1), 20)
+    except ValueError:
+        limit = 10
+    return JsonResponse({'tags': suggest_tags(request.GET.get('q', ''), limit)})
+
+
+@csrf_exempt
+@require_POST
+def vote(request):
+    """JSON-голос: {"kind": "question"|"answer", "id": N, "value": 1|-1|0}"""
+    # У анонима на странице нет CSRF-токена (страница из кэша): до проверки
+    # CSRF он получает 401, и script.js отправляет его на вход
+    if not request.user.is_authenticated:
+        return JsonResponse({'error': 'login required', 'login_url': settings.LOGIN_URL}, status=401)
+    return _cast_vote(request)
+
+
+@csrf_protect
+def _cast_vote(request):
+    try:
+        data = json.loads(request.body)
+        kind, target_id, value = data['kind'], int(data['id']), int(data['value'])
+    except (ValueError, TypeError, KeyError):
+        return JsonResponse({'error': 'bad request'}, status=400)
+    if kind not in VOTE_KINDS or value not in (1, -1, 0):
+        return JsonResponse({'error': 'bad request'}, status=400)
+    try:
+        rating, current = cast_vote(request.user, kind, target_id, value)
+    except (Question.DoesNotExist, Answer.DoesNotExist):
+        return JsonResponse({'error': 'not found'}, status=404)
+    except PermissionDenied:
+        return JsonResponse({'error': 'own post'}, status=403)
+    return JsonResponse({'rating': rating, 'vote': current})
+
+
+@staff_member_required
+def db_metrics(request):
+    """Метрики соединений с БД этого воркера, см. main/dbpool.py"""
+    return JsonResponse(pool_stats())
+
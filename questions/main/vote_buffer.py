@@ -0,0 +1,124 @@
+"""Сдвиг рейтинга вопросов и ответов по голосам.
+
+В режиме VOTE_RATING_MODE = 'direct' (по умолчанию) голос сразу делает
+UPDATE ... SET rating = rating + delta по строке вопроса/ответа, а профиль
+автора получает дельту при коммите. Когда вопрос набирает голоса лавиной,
+все голосующие выстраиваются в очередь на блокировку одной строки.
+
+В режиме 'buffered' строка лайка пишется как обычно, а дельта после
+коммита копится в памяти процесса по цели. Фоновый поток раз в
+VOTE_FLUSH_INTERVAL секунд записывает буфер одной транзакцией: один UPDATE
+на цель и один на профиль. Остаток сбрасывается при выходе процесса (atexit);
+при аварийном завершении его вернёт manage.py fix_ratings.
+"""
+import atexit
+import threading
+import time
+from functools import partial
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import F
+
+from .hot import hot_score_expression
+from .live import announce_rating
+from .pages import expire_answers, expire_question
+from .ratings import add_profile_delta
+
+
+_lock = threading.Lock()
+_buffer = {}  # (вид, id) -> [дельта, автор, id вопроса]
+_flusher = None
+_registered = False
+
+
+def buffered_mode():
+    return getattr(settings, 'VOTE_RATING_MODE', 'direct') == 'buffered'
+
+
+def change_rating(kind, pk, delta, author_id, question_id=None):
+    """Сдвинуть рейтинг вопроса ('question') или ответа ('answer') и профиля автора"""
+    if not delta:
+        return
+    if buffered_mode():
+        # Откат транзакции голоса выбрасывает и его дельту
+        transaction.on_commit(partial(_stage, kind, pk, delta, author_id, question_id))
+        return
+    _write(kind, pk, delta, question_id)
+    add_profile_delta(author_id, rating=delta)
+
+
+def _write(kind, pk, delta, question_id):
+    from .models import Answer, Question
+    if kind == 'question':
+        Question.objects.filter(pk=pk).update(
+            rating=F('rating') + delta,
+            hot_score=hot_score_expression(rating=F('rating') + delta),
+            cache_version=F('cache_version') + 1,
+        )
+        expire_question(pk)
+        announce_rating(kind, pk, pk)
+    else:
+        Answer.objects.filter(pk=pk).update(rating=F('rating') + delta, cache_version=F('cache_version') + 1)
+        expire_answers(question_id)
+        announce_rating(kind, pk, question_id)
+
+
+def _stage(kind, pk, delta, author_id, question_id):
+    with _lock:
+        entry = _buffer.setdefault((kind, pk), [0, author_id, question_id])
+        entry[0] += delta
+        _start_flusher()
+
+
+def pending_delta(kind, pk):
+    """Дельта цели, ещё не записанная в БД"""
+    with _lock:
+        entry = _buffer.get((kind, pk))
+        return entry[0] if entry else 0
+
+
+def flush_votes():
+    """Записать буфер одной транзакцией; возвращает число обновлённых целей"""
+    global _buffer
+    with _lock:
+        batch, _buffer = _buffer, {}
+    batch = {target: entry for target, entry in batch.items() if entry[0]}
+    if not batch:
+        return 0
+    try:
+        with transaction.atomic():
+            # Фиксированный порядок блокировок исключает взаимные дедлоки,
+            # профили add_profile_delta суммирует и пишет при коммите
+            for (kind, pk), (delta, author_id, question_id) in sorted(batch.items()):
+                _write(kind, pk, delta, question_id)
+                add_profile_delta(author_id, rating=delta)
+    except Exception:
+        with _lock:
+            for target, (delta, author_id, question_id) in batch.items():
+                _buffer.setdefault(target, [0, author_id, question_id])[0] += delta
+        raise
+    return len(batch)
+
+
+def _start_flusher():
+    global _flusher, _registered
+    if not _registered:
+        atexit.register(flush_votes)
+        _registered = True
+    # Интервал 0 — без потока: буфер пишет только явный flush_votes()
+    interval = getattr(settings, 'VOTE_FLUSH_INTERVAL', 0.3)
+    if interval and not (_flusher and _flusher.is_alive()):
+        _flusher = threading.Thread(target=_flush_forever, args=(interval,), name='vote-flusher', daemon=True)
+        _flusher.start()
+
+
+def _flush_forever(interval):
+    while True:
+        time.sleep(interval)
+        try:
+            flush_votes()
+        except Exception:
+            pass  # дельты вернулись в буфер, повтор на следующем шаге
+        finally:
+            close_old_connections()
@@ -0,0 +1,88 @@
+"""Голосование за вопросы и ответы одним SQL-оператором.
+
+Строка лайка вставляется, переворачивается или удаляется одним
+INSERT/UPDATE/DELETE в общем WITH: старое значение читается под
+FOR UPDATE в том же операторе, а уникальность (user, question) /
+(user, answer) страхует от двойной вставки. По разнице старого и нового
+значения рейтинг сдвигается тем же apply_delta, что и при save() лайка
+(сразу или через буфер, см. main/vote_buffer.py).
+"""
+from django.core.exceptions import PermissionDenied
+from django.db import connection, transaction
+
+from .vote_buffer import buffered_mode, pending_delta
+
+
+VOTE_SQL = """
+WITH old AS (
+    SELECT id, value FROM {table}
+    WHERE user_id = %(user)s AND {target} = %(target_id)s
+    FOR UPDATE
+), removed AS (
+    DELETE FROM {table}
+    WHERE id IN (SELECT id FROM old WHERE value = %(value)s OR %(value)s = 0)
+    RETURNING value
+), flipped AS (
+    UPDATE {table} SET value = %(value)s
+    WHERE id IN (SELECT id FROM old WHERE value <> %(value)s AND %(value)s <> 0)
+    RETURNING value
+), added AS (
+    INSERT INTO {table} (user_id, {target}, value, created_at)
+    SELECT %(user)s, %(target_id)s, %(value)s, now()
+    WHERE %(value)s <> 0 AND NOT EXISTS (SELECT 1 FROM old)
+    ON CONFLICT (user_id, {target}) DO NOTHING
+    RETURNING value
+)
+SELECT (SELECT value FROM old), (SELECT value FROM flipped), (SELECT value FROM added)
+"""
+
+
+VOTE_KINDS = ('question', 'answer')
+
+
+def _vote_models():
+    from .models import Answer, AnswerLike, Question, QuestionLike
+    return {
+        'question': (Question, QuestionLike, 'question'),
+        'answer': (Answer, AnswerLike, 'answer'),
+    }
+
+
+def _toggle(like_model, field, user_id, target_id, value):
+    """(старое, новое) значение голоса; повторный голос тем же знаком снимает его"""
+    sql = VOTE_SQL.format(
+        table=connection.ops.quote_name(like_model._meta.db_table),
+        target=connection.ops.quote_name(like_model._meta.get_field(field).column),
+    )
+    params = {'user': user_id, 'target_id': target_id, 'value': value}
+    with connection.cursor() as cursor:
+        for _ in range(2):
+            cursor.execute(sql, params)
+            old, flipped, added = cursor.fetchone()
+            if old is not None or not value or added is not None:
+                return old or 0, flipped or added or 0
+            # Параллельный первый голос того же пользователя вставил строку
+            # раньше: ON CONFLICT дождался его коммита, повтор увидит строку
+    raise RuntimeError('vote row is still locked by a concurrent insert')
+
+
+def cast_vote(user, kind, target_id, value):
+    """Проголосовать value (1, -1) или снять голос (0).
+
+    Возвращает (новый рейтинг, текущий голос пользователя). Голос тем же
+    знаком, что уже стоит, снимается. Неизвестный объект — DoesNotExist,
+    голос за собственный пост — PermissionDenied.
+    """
+    model, like_model, field = _vote_models()[kind]
+    only = ['author_id'] + (['question_id'] if kind == 'answer' else [])
+    with transaction.atomic():
+        target = model.objects.only(*only).get(pk=target_id)
+        if target.author_id == user.pk:
+            raise PermissionDenied('You cannot vote for your own post')
+        old, new = _toggle(like_model, field, user.pk, target.pk, value)
+        like_model(user=user, **{field: target}).apply_delta(new - old)
+        rating = model.objects.filter(pk=target.pk).values_list('rating', flat=True).get()
+    if buffered_mode():
+        # Дельты ещё в буфере процесса (включая эту) — показываем с ними
+        rating += pending_delta(kind, target.pk)
+    return rating, new
@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'questions.settings')
+# Async-версии читающих страниц (main/async_views.py) и под ASGI включаются
+# только явно, ASYNC_VIEWS=1: на замерах bench_views они медленнее синхронных
 
 application = get_asgi_application()
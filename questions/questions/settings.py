@@ -9,9 +9,13 @@ https://docs.djangoproject.com/en/5.2/topics/settings/
 For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
+import copy
 import os
+import sys
 from pathlib import Path
 
+from django.core.exceptions import ImproperlyConfigured
+
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -21,14 +25,19 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 # See https://docs.djangoproject.com/en/5.2/howto/deployment/checklist/
 
 # SECURITY WARNING: keep the secret key used in production secret!
-SECRET_KEY = 'django-insecure-9!x_5eq6y2nm*dl&+r=6sp5-u8n90(2(ip)z*%k3hjfvi*8s2#'
+DEV_SECRET_KEY = 'django-insecure-9!x_5eq6y2nm*dl&+r=6sp5-u8n90(2(ip)z*%k3hjfvi*8s2#'
+SECRET_KEY = os.environ.get('SECRET_KEY') or DEV_SECRET_KEY
 
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = True
-#DEBUG = False
+# По умолчанию — разработка; боевой профиль (docker-compose.prod.yml) ставит DEBUG=0
+DEBUG = os.environ.get('DEBUG', '1') == '1'
+
+# Ключ разработки лежит в репозитории: без DEBUG с ним не стартуем
+if not DEBUG and SECRET_KEY == DEV_SECRET_KEY:
+    raise ImproperlyConfigured('Set SECRET_KEY in the environment when DEBUG=0')
 
-ALLOWED_HOSTS = []
-#ALLOWED_HOSTS = ['127.0.0.1', 'localhost',]
+# Через запятую: example.com,www.example.com
+ALLOWED_HOSTS = [host for host in os.environ.get('ALLOWED_HOSTS', '').split(',') if host]
 
 # Application definition
 
@@ -40,8 +49,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
-    'debug_toolbar',
-    
+    'django.contrib.postgres',
 ]
 
 
@@ -53,15 +61,24 @@ LOGIN_URL = '/login/'
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    # Раньше сессий: запись сессии тоже делает запрос «записавшим»
+    'main.middleware.replica_stickiness',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-    'debug_toolbar.middleware.DebugToolbarMiddleware',
+    'main.middleware.fragment_stats',
 ]
 
+# Тесты идут с DEBUG = False, тулбар в них не нужен
+TESTING = 'test' in sys.argv[1:2]
+
+if DEBUG and not TESTING:
+    INSTALLED_APPS.append('debug_toolbar')
+    MIDDLEWARE.append('debug_toolbar.middleware.DebugToolbarMiddleware')
+
 ROOT_URLCONF = 'questions.urls'
 
 TEMPLATES = [
@@ -95,9 +112,113 @@ DATABASES = {
         'PASSWORD': os.environ.get('DB_PASSWORD', '1234'),
         'HOST': os.environ.get('DB_HOST', 'localhost'),
         'PORT': os.environ.get('DB_PORT', '5432'),
+        # Тестовая БД в UTF8 независимо от настроек кластера — иначе
+        # полнотекстовый поиск не видит кириллицу
+        'TEST': {'CHARSET': 'UTF8', 'TEMPLATE': 'template0'},
+        'OPTIONS': {'connect_timeout': int(os.environ.get('DB_CONNECT_TIMEOUT', 5))},
     }
 }
 
+# Соединения с PostgreSQL, см. main/dbpool.py:
+# 'close' — новое соединение на каждый запрос,
+# 'persistent' — соединение живёт в потоке воркера DB_CONN_MAX_AGE секунд
+#   и проверяется перед запросом (только WSGI: под ASGI поток новый на каждый запрос),
+# 'pool' — пул psycopg_pool на процесс; воркеров × DB_POOL_MAX_SIZE
+#   должно укладываться в max_connections сервера
+DB_CONN_MODE = os.environ.get('DB_CONN_MODE', 'close')
+
+# Проверка соединения перед использованием: в 'pool' — при выдаче из пула
+DATABASES['default']['CONN_HEALTH_CHECKS'] = DB_CONN_MODE in ('persistent', 'pool')
+if DB_CONN_MODE == 'persistent':
+    DATABASES['default']['CONN_MAX_AGE'] = int(os.environ.get('DB_CONN_MAX_AGE', 60))
+elif DB_CONN_MODE == 'pool':
+    DATABASES['default']['OPTIONS']['pool'] = {
+        'min_size': int(os.environ.get('DB_POOL_MIN_SIZE', 2)),
+        'max_size': int(os.environ.get('DB_POOL_MAX_SIZE', 10)),
+        'timeout': float(os.environ.get('DB_POOL_TIMEOUT', 10)),  # ожидание свободного соединения
+        'max_idle': float(os.environ.get('DB_POOL_MAX_IDLE', 300)),
+        'max_lifetime': float(os.environ.get('DB_POOL_MAX_LIFETIME', 3600)),
+    }
+
+# Реплики для чтения: через запятую host[:port] (остальное — как у default),
+# см. main/db_router.py. Без них всё читается и пишется в default
+DB_REPLICAS = []
+for number, replica_host in enumerate(filter(None, os.environ.get('DB_REPLICA_HOSTS', '').split(',')), 1):
+    replica_host, _, replica_port = replica_host.partition(':')
+    DATABASES[f'replica{number}'] = {
+        **DATABASES['default'],
+        'HOST': replica_host,
+        'PORT': replica_port or DATABASES['default']['PORT'],
+        'OPTIONS': copy.deepcopy(DATABASES['default']['OPTIONS']),
+        'TEST': {'MIRROR': 'default'},
+    }
+    DB_REPLICAS.append(f'replica{number}')
+if TESTING and not DB_REPLICAS:
+    # Второй алиас для тестов роутера (main.tests.ReplicaRouterTest)
+    DATABASES['replica'] = {**copy.deepcopy(DATABASES['default']), 'TEST': {'MIRROR': 'default'}}
+if DB_REPLICAS:
+    DATABASE_ROUTERS = ['main.db_router.ReplicaRouter']
+REPLICA_MAX_LAG = float(os.environ.get('REPLICA_MAX_LAG', 2))  # секунды; 0 — не проверять
+REPLICA_LAG_CHECK_INTERVAL = float(os.environ.get('REPLICA_LAG_CHECK_INTERVAL', 5))
+# Сколько секунд после своей записи клиент читает с primary; не меньше REPLICA_MAX_LAG
+REPLICA_STICKY_SECONDS = int(os.environ.get('REPLICA_STICKY_SECONDS', 5))
+
+# Рейтинг профилей: 'delta' — дельты пишутся при коммите,
+# 'deferred' — профили копятся в очереди и пересчитываются командой flush_profiles
+PROFILE_RATING_MODE = os.environ.get('PROFILE_RATING_MODE', 'delta')
+PROFILE_RATING_MAX_STALENESS = int(os.environ.get('PROFILE_RATING_MAX_STALENESS', 30))  # секунды
+PROFILE_FLUSH_BATCH_SIZE = int(os.environ.get('PROFILE_FLUSH_BATCH_SIZE', 1000))
+
+# Рейтинг вопросов и ответов по голосам: 'direct' — UPDATE в транзакции голоса,
+# 'buffered' — дельты копятся в процессе и пишутся раз в VOTE_FLUSH_INTERVAL секунд
+VOTE_RATING_MODE = os.environ.get('VOTE_RATING_MODE', 'direct')
+VOTE_FLUSH_INTERVAL = float(os.environ.get('VOTE_FLUSH_INTERVAL', 0.3))
+
+# Async-версии читающих страниц (main/async_views.py), только под ASGI.
+# По умолчанию выключены: на замерах bench_views они медленнее синхронных
+ASYNC_VIEWS = os.environ.get('ASYNC_VIEWS', '0') == '1'
+
+# Живые обновления страницы вопроса (SSE), см. main/live.py
+LIVE_HEARTBEAT = int(os.environ.get('LIVE_HEARTBEAT', 15))  # секунды между пульсами
+LIVE_QUEUE_SIZE = int(os.environ.get('LIVE_QUEUE_SIZE', 100))  # событий в очереди клиента
+LIVE_RETRY_MS = int(os.environ.get('LIVE_RETRY_MS', 3000))
+
+# Общий кэш (для нескольких процессов — Redis или Memcached, иначе
+# сброс из management-команд не дойдёт до веб-воркеров)
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('CACHE_LOCATION', ''),
+    }
+}
+
+# Сколько секунд сайдбар живёт в кэше без явного сброса
+SIDEBAR_CACHE_TTL = int(os.environ.get('SIDEBAR_CACHE_TTL', 60))
+
+# Сколько живут HTML-фрагменты карточек; устаревают они по cache_version
+FRAGMENT_CACHE_TTL = int(os.environ.get('FRAGMENT_CACHE_TTL', 600))
+
+# Полностраничный кэш для анонимов (0 — выключен); сбрасывается событиями, см. main/pages.py
+PAGE_CACHE_TTL = int(os.environ.get('PAGE_CACHE_TTL', 300))
+
+# Сколько живёт сводка профиля пользователя; сбрасывается его активностью, см. main/profiles.py
+PROFILE_STATS_TTL = int(os.environ.get('PROFILE_STATS_TTL', 300))
+
+# Оценка «горячих» вопросов, см. main/hot.py
+HOT_SCORE_PERIOD = int(os.environ.get('HOT_SCORE_PERIOD', 45000))
+HOT_ANSWER_WEIGHT = float(os.environ.get('HOT_ANSWER_WEIGHT', 2))
+
+# Конфигурация полнотекстового поиска PostgreSQL, см. main/search.py
+SEARCH_CONFIG = os.environ.get('SEARCH_CONFIG', 'russian')
+
+# Как часто процесс перечитывает теги для подсказок, см. main/typeahead.py
+TAG_TYPEAHEAD_REFRESH = int(os.environ.get('TAG_TYPEAHEAD_REFRESH', 60))
+
+# Рейтинг популярных тегов для сайдбара (manage.py refresh_tag_ranking)
+TAG_RANKING_WINDOW_DAYS = int(os.environ.get('TAG_RANKING_WINDOW_DAYS', 7))
+TAG_RANKING_ANSWER_WEIGHT = float(os.environ.get('TAG_RANKING_ANSWER_WEIGHT', 0.5))
+TAG_RANKING_VOTE_WEIGHT = float(os.environ.get('TAG_RANKING_VOTE_WEIGHT', 0.1))
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -133,6 +254,8 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/5.2/howto/static-files/
 
 STATIC_URL = 'static/'
+# Куда collectstatic собирает статику; в бою её отдаёт nginx, а не Django
+STATIC_ROOT = os.environ.get('STATIC_ROOT', BASE_DIR / 'staticfiles')
 
 
 # Default primary key field type
@@ -164,7 +287,7 @@ DEBUG_TOOLBAR_PANELS = [
 ]
 
 DEBUG_TOOLBAR_CONFIG = {
-    'SHOW_TOOLBAR_CALLBACK': lambda request: DEBUG,
+    'SHOW_TOOLBAR_CALLBACK': 'main.middleware.show_toolbar',
     'SHOW_COLLAPSED': True,
     'RESULTS_STORE_SIZE': 100,
     'INSERT_BEFORE': '</body>'
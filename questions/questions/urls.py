@@ -26,7 +26,7 @@ urlpatterns = [
 ]
 
 # Debug Toolbar URLs
-if settings.DEBUG:
+if 'debug_toolbar' in settings.INSTALLED_APPS:
     import debug_toolbar
     urlpatterns = [
         path('__debug__/', include('debug_toolbar.urls')),